@@ -4,27 +4,121 @@ Indexer for CS-429 IR Project
 Builds inverted index with TF-IDF from HTML files
 """
 
+import argparse
 import json
+import os
 import re
+import shutil
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
-from collections import defaultdict, Counter
 from bs4 import BeautifulSoup
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-import pickle
+
+from build_stats import BuildProfiler, print_profile
+from docstore import DOCSTORE_FILE, DocStore, DocStoreWriter, write_docstore
+from extract_cache import ExtractCache, ExtractLookup, file_digest
+from lsi import LSI_FILES, build_lsi, fold_in_lsi, load_basis
+from manifest import publish_version, retire_files
+from postings import PositionalIndex, index_sample, open_postings, write_postings_file
+from segments import SegmentStore, fit_tfidf
+from spimi import SpimiBuilder, publish_blocks
+from tfidf_store import CSC_FILES, CSR_FILES, NORMS_FILE, STOP_WORDS_FILE, save_tfidf
+
+# Kept positions per posting (first N occurrences); None keeps them all,
+# which phrase and proximity queries need
+MAX_POSITIONS = None
+
+TFIDF_PARAMS = dict(
+    max_features=5000,
+    stop_words='english',
+    ngram_range=(1, 2),  # Include bigrams
+    min_df=1,
+    max_df=0.95
+)
+
+# Everything save_index() writes
+INDEX_FILES = ("postings.bin", "index.json", "doc_metadata.json", "doc_ids.json",
+               *CSR_FILES, "tfidf_idf.npy", "tfidf_vocab.json", "tfidf_meta.json",
+               STOP_WORDS_FILE, *CSC_FILES, NORMS_FILE, DOCSTORE_FILE)
+
+# Version of what extract_from_html() / clean_text() produce; bump it when
+# they change so extraction caches written by older code are dropped
+EXTRACTOR_VERSION = 2
+
+# Per worker process: read-only view of the extraction cache
+_worker_lookup = None
+
+def _init_worker(cache_path):
+    global _worker_lookup
+    _worker_lookup = ExtractLookup(cache_path) if cache_path else None
+
+def _parse_in_worker(html_file, timed=False):
+    return _parse_document(html_file, timed, _worker_lookup)
+
+def _parse_document(html_file, timed=False, lookup=None):
+    """Read, hash and extract one HTML file (runs in worker processes).
+    
+    Returns (doc, SHA-1 of the file, whether it was parsed, step times).
+    A file whose hash lookup (an ExtractLookup) knows is not parsed. With
+    timed, step times are {stage: (wall, cpu)} for the read, parse and
+    clean steps, else None.
+    """
+    t0 = time.perf_counter(), time.process_time()
+    with open(html_file, 'rb') as f:
+        content = f.read()
+    digest = file_digest(content)
+    found = lookup.find(digest) if lookup else None
+    if found is not None:
+        return (html_file.stem, *found), digest, False, None
+    # Same decoding as text mode with errors='ignore' (universal newlines)
+    html_content = content.decode('utf-8', errors='ignore').replace('\r\n', '\n') \
+        .replace('\r', '\n')
+    t1 = time.perf_counter(), time.process_time()
+    
+    url, title, text = SearchIndexer.extract_from_html(html_content)
+    t2 = time.perf_counter(), time.process_time()
+    cleaned = SearchIndexer.clean_text(text)
+    doc = html_file.stem, url, title, cleaned
+    if not timed:
+        return doc, digest, True, None
+    
+    t3 = time.perf_counter(), time.process_time()
+    spans = zip(('read_html', 'parse_html', 'clean_text'), (t0, t1, t2), (t1, t2, t3))
+    return doc, digest, True, {name: (end[0] - start[0], end[1] - start[1])
+                               for name, start, end in spans}
 
 class SearchIndexer:
-    def __init__(self, html_dir="../html", output_dir="."):
+    def __init__(self, html_dir="../html", output_dir=".", workers=1, chunksize=16,
+                 max_segments=8, cache=True, profile=False, lsi_dims=128, nlist=None,
+                 target_recall=0.95):
         self.html_dir = Path(html_dir)
         self.output_dir = Path(output_dir)
+        # Extracted url/title/text of parsed files, reused by later builds
+        self.cache_path = self.output_dir / "extract_cache.sqlite" if cache else None
+        self.workers = workers or os.cpu_count() or 1  # 0/None -> all cores
+        self.chunksize = chunksize
+        self.max_segments = max_segments  # update() merges beyond this
+        self.profiler = BuildProfiler() if profile else None
+        self.lsi_dims = lsi_dims  # 0 skips the LSI / IVF index
+        self.nlist = nlist
+        self.target_recall = target_recall
         self.documents = {}  # doc_id -> cleaned_text
         self.doc_metadata = {}  # doc_id -> {url, title, length}
-        self.inverted_index = defaultdict(lambda: {"df": 0, "postings": []})
+        self.inverted_index = None  # PositionalIndex
         self.vectorizer = None
         self.tfidf_matrix = None
         self.doc_ids = []
+        # Published docstore and its doc numbers by doc_id, kept open by
+        # update() so unchanged docs' blocks are copied from it
+        self.previous_docstore = None
+        self.previous_doc_nums = {}
     
-    def clean_text(self, text):
+    @staticmethod
+    def clean_text(text):
         """Basic text cleaning"""
         # Lowercase
         text = text.lower()
@@ -34,7 +128,8 @@ class SearchIndexer:
         text = re.sub(r'\s+', ' ', text).strip()
         return text
     
-    def extract_from_html(self, html_content):
+    @staticmethod
+    def extract_from_html(html_content):
         """Extract URL, title, and text from HTML"""
         # Get URL from comment
         url_match = re.search(r'<!-- URL: (.*?) -->', html_content)
@@ -59,28 +154,14 @@ class SearchIndexer:
         """Build positional inverted index"""
         print("Building inverted index...")
         
-        for doc_id, text in self.documents.items():
-            tokens = text.split()
-            
-            # Build positional index
-            term_positions = defaultdict(list)
-            for pos, token in enumerate(tokens):
-                term_positions[token].append(pos)
-            
-            # Add to inverted index
-            for term, positions in term_positions.items():
-                # Update document frequency
-                if not any(p['doc_id'] == doc_id for p in self.inverted_index[term]['postings']):
-                    self.inverted_index[term]['df'] += 1
-                
-                # Add posting
-                self.inverted_index[term]['postings'].append({
-                    'doc_id': doc_id,
-                    'tf': len(positions),
-                    'positions': positions[:10]  # Limit to first 10 for space
-                })
-        
-        print(f"  Indexed {len(self.inverted_index)} unique terms")
+        # Doc number i is self.doc_ids[i]
+        self.inverted_index = PositionalIndex.build(
+            (self.documents[doc_id].split() for doc_id in self.doc_ids),
+            max_positions=MAX_POSITIONS
+        )
+        
+        print(f"  Indexed {len(self.inverted_index)} unique terms "
+              f"({self.inverted_index.num_postings} postings)")
     
     def build_tfidf(self):
         """Build TF-IDF vectors using scikit-learn"""
@@ -90,102 +171,458 @@ class SearchIndexer:
         corpus = [self.documents[doc_id] for doc_id in self.doc_ids]
         
         # Build TF-IDF
-        self.vectorizer = TfidfVectorizer(
-            max_features=5000,
-            stop_words='english',
-            ngram_range=(1, 2),  # Include bigrams
-            min_df=1,
-            max_df=0.95
-        )
+        self.vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
         
         self.tfidf_matrix = self.vectorizer.fit_transform(corpus)
         
         print(f"  Vocabulary size: {len(self.vectorizer.vocabulary_)}")
         print(f"  Matrix shape: {self.tfidf_matrix.shape}")
     
-    def load_documents(self):
-        """Load all HTML documents"""
-        print(f"Loading documents from {self.html_dir}/...")
+    def iter_documents(self, html_files=None):
+        """Yield (doc_id, url, title, cleaned_text) for each file, in order.
         
-        html_files = sorted(self.html_dir.glob("*.html"))
-        if not html_files:
-            raise ValueError(f"No HTML files found in {self.html_dir}/")
+        Files found in the extraction cache are not parsed again. With
+        workers > 1 at most workers * chunksize files are in flight, so
+        parsed documents never pile up faster than they are consumed; a
+        file that misses the cache's mtime/size check is read and hashed
+        only by its worker.
+        """
+        full_scan = html_files is None
+        if full_scan:
+            html_files = sorted(self.html_dir.glob("*.html"))
+            if not html_files:
+                raise ValueError(f"No HTML files found in {self.html_dir}/")
         
-        for html_file in html_files:
-            doc_id = html_file.stem
-            
-            with open(html_file, 'r', encoding='utf-8', errors='ignore') as f:
-                html_content = f.read()
+        cache = ExtractCache(self.cache_path, EXTRACTOR_VERSION) if self.cache_path else None
+        try:
+            if self.workers > 1:
+                print(f"  Using {self.workers} worker processes (chunksize={self.chunksize})")
+                window = self.workers * self.chunksize
+                with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                         initargs=(self.cache_path,)) as pool:
+                    # Cache hits wait in the queue too, to keep file order
+                    pending = deque()
+                    for html_file in html_files:
+                        doc = cache.get(html_file) if cache else None
+                        pending.append((html_file, doc or pool.submit(
+                            _parse_in_worker, html_file, self.profiler is not None)))
+                        if len(pending) >= window:
+                            yield self._finish_document(cache, *pending.popleft())
+                    while pending:
+                        yield self._finish_document(cache, *pending.popleft())
+            else:
+                for html_file in html_files:
+                    doc = cache.get(html_file) if cache else None
+                    if doc is None:
+                        doc = self._record(cache, html_file, _parse_document(
+                            html_file, self.profiler is not None, cache))
+                    yield doc
             
-            url, title, text = self.extract_from_html(html_content)
-            cleaned_text = self.clean_text(text)
-            
-            self.documents[doc_id] = cleaned_text
-            self.doc_ids.append(doc_id)
-            self.doc_metadata[doc_id] = {
-                'url': url,
-                'title': title,
-                'length': len(cleaned_text.split())
-            }
+            if cache:
+                if full_scan:
+                    cache.evict()  # entries for files that are gone
+                print(f"  Extraction cache: {cache.stats()}")
+        finally:
+            if cache:
+                cache.close()
+    
+    def _finish_document(self, cache, html_file, doc):
+        """Wait for a parse result and remember it; cache hits pass through"""
+        if isinstance(doc, Future):
+            doc = self._record(cache, html_file, doc.result())
+        return doc
+    
+    def _record(self, cache, html_file, result):
+        """Unpack a _parse_document result, caching the doc under the
+        file's hash and recording its step times"""
+        doc, digest, parsed, times = result
+        if cache:
+            cache.put(html_file, digest, *doc[1:], parsed=parsed)
+        if self.profiler is not None and times:
+            for name, (wall, cpu) in times.items():
+                self.profiler.add_time(name, wall, cpu)
+        return doc
+    
+    def _stage(self, name, *outputs):
+        """Profile a build stage (no-op unless profiling)"""
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.stage(name, [self.output_dir / out for out in outputs])
+    
+    def _save_profile(self, mode, num_docs):
+        if self.profiler is None:
+            return
+        stats = self.profiler.save(self.output_dir / "build_stats.json", mode=mode,
+                                   html_dir=str(self.html_dir), documents=num_docs,
+                                   workers=self.workers)
+        print_profile(stats)
+        print(f"Build stats saved to {self.output_dir / 'build_stats.json'}")
+    
+    def load_documents(self, html_files=None):
+        """Load all HTML documents (or just html_files)"""
+        print(f"Loading documents from {self.html_dir}/...")
+        
+        # Results come back in input order, so doc_ids stay sorted
+        # exactly as in the serial path
+        for doc in self.iter_documents(html_files):
+            self.add_document(*doc)
         
         print(f"  Loaded {len(self.documents)} documents")
     
+    def add_document(self, doc_id, url, title, cleaned_text):
+        """Register one extracted document"""
+        self.documents[doc_id] = cleaned_text
+        self.doc_ids.append(doc_id)
+        self.doc_metadata[doc_id] = {
+            'url': url,
+            'title': title,
+            'length': len(cleaned_text.split())
+        }
+    
     def save_index(self):
         """Save all index components"""
         print("Saving index files...")
         
-        # Save inverted index (sample for submission)
-        index_sample = dict(list(self.inverted_index.items())[:100])
-        with open(self.output_dir / "index.json", 'w') as f:
-            json.dump(index_sample, f, indent=2)
+        # Save full inverted index as a compressed postings file (for actual use);
+        # after update() publish() has already written it
+        postings_path = self.output_dir / "postings.bin"
+        if isinstance(self.inverted_index, PositionalIndex):
+            with self._stage('write_postings', "postings.bin"):
+                postings_size = write_postings_file(
+                    self.inverted_index, postings_path, len(self.doc_ids))
+            postings_note = "varint-compressed"
+        else:
+            postings_size = postings_path.stat().st_size
+            postings_note = f"references {len(self.inverted_index.readers)} segment files"
         
-        # Save full inverted index as pickle (for actual use)
-        with open(self.output_dir / "inverted_index_full.pkl", 'wb') as f:
-            pickle.dump(dict(self.inverted_index), f)
+        # Save inverted index (sample for submission)
+        with self._stage('write_index_json', "index.json"), \
+                open(self.output_dir / "index.json", 'w') as f:
+            json.dump(index_sample(self.inverted_index, 100, self.doc_ids), f, indent=2)
         
         # Save metadata
-        with open(self.output_dir / "doc_metadata.json", 'w') as f:
+        with self._stage('write_doc_metadata', "doc_metadata.json"), \
+                open(self.output_dir / "doc_metadata.json", 'w') as f:
             json.dump(self.doc_metadata, f, indent=2)
         
         # Save doc_ids
-        with open(self.output_dir / "doc_ids.json", 'w') as f:
+        with self._stage('write_doc_ids', "doc_ids.json"), \
+                open(self.output_dir / "doc_ids.json", 'w') as f:
             json.dump(self.doc_ids, f, indent=2)
         
-        # Save TF-IDF components
-        with open(self.output_dir / "tfidf_vectorizer.pkl", 'wb') as f:
-            pickle.dump(self.vectorizer, f)
+        # Save TF-IDF components as flat arrays (mmap-able at query time)
+        with self._stage('write_tfidf', *INDEX_FILES[4:-1]):
+            save_tfidf(self.output_dir, self.vectorizer, self.tfidf_matrix, TFIDF_PARAMS)
         
-        with open(self.output_dir / "tfidf_matrix.pkl", 'wb') as f:
-            pickle.dump(self.tfidf_matrix, f)
+        # Save cleaned text, URLs and titles for result snippets
+        with self._stage('write_docstore', DOCSTORE_FILE):
+            docstore_size = write_docstore(self.output_dir / DOCSTORE_FILE,
+                                           self.stored_documents(), self.previous_docstore)
         
         print(f"  Saved to {self.output_dir}/")
         print("  Files created:")
         print("    - index.json (sample)")
-        print("    - inverted_index_full.pkl")
+        print(f"    - postings.bin ({postings_size:,} bytes; {postings_note})")
         print("    - doc_metadata.json")
         print("    - doc_ids.json")
-        print("    - tfidf_vectorizer.pkl")
-        print("    - tfidf_matrix.pkl")
+        print("    - tfidf_data.npy, tfidf_indices.npy, tfidf_indptr.npy (CSR matrix)")
+        print("    - tfidf_idf.npy, tfidf_vocab.json, tfidf_meta.json")
+        print("    - tfidf_csc_*.npy, tfidf_norms.npy (term-major copy, doc norms)")
+        print(f"    - {DOCSTORE_FILE} ({docstore_size:,} bytes; compressed text, URLs, titles)")
+    
+    def stored_documents(self):
+        """(doc_id, url, title, cleaned_text) for every indexed doc, in order.
+        
+        After update() only the new documents are in memory; the rest are
+        given as their doc number in previous_docstore, whose blocks
+        write_docstore() copies, or, when that does not have them, extracted
+        again (from the extraction cache when it has them).
+        """
+        missing = [self.html_dir / f"{doc_id}.html" for doc_id in self.doc_ids
+                   if doc_id not in self.documents and doc_id not in self.previous_doc_nums]
+        extracted = self.iter_documents(missing) if missing else iter(())
+        for doc_id in self.doc_ids:
+            text = self.documents.get(doc_id)
+            if text is None and doc_id in self.previous_doc_nums:
+                yield self.previous_doc_nums[doc_id]
+                continue
+            if text is None:
+                text = next(extracted)[3]
+            meta = self.doc_metadata[doc_id]
+            yield doc_id, meta['url'], meta['title'], text
+        # Let the extraction finish (it prints cache stats and closes the cache)
+        for _ in extracted:
+            pass
+    
+    def _open_previous_docstore(self):
+        """Keep the published docstore open (it is about to be retired) and
+        map its doc ids to doc numbers"""
+        path, ids_path = self.output_dir / DOCSTORE_FILE, self.output_dir / "doc_ids.json"
+        if not path.exists() or not ids_path.exists():
+            return
+        with open(ids_path, 'r') as f:
+            doc_ids = json.load(f)
+        store = DocStore(path)
+        if len(store) != len(doc_ids):  # not from the same build
+            store.close()
+            return
+        self.previous_docstore = store
+        self.previous_doc_nums = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+    
+    def _close_previous_docstore(self):
+        if self.previous_docstore is not None:
+            self.previous_docstore.close()
+        self.previous_docstore, self.previous_doc_nums = None, {}
+    
+    def build_lsi(self, basis=None):
+        """Reduce the saved TF-IDF matrix with SVD and build the IVF index;
+        with a previous basis (see lsi.load_basis) only project onto it"""
+        if not self.lsi_dims:
+            for name in LSI_FILES:
+                (self.output_dir / name).unlink(missing_ok=True)
+            return
+        if basis is not None:
+            print("Folding documents into the previous LSI basis...")
+            with self._stage('fold_in_lsi', *LSI_FILES):
+                meta = fold_in_lsi(self.output_dir, basis, self.target_recall)
+        else:
+            print("Building LSI vectors and IVF index...")
+            with self._stage('build_lsi', *LSI_FILES):
+                meta = build_lsi(self.output_dir, self.lsi_dims, self.nlist, self.target_recall)
+        if meta is None:
+            print("  Too few documents for LSI, skipped")
+            return
+        print(f"  {meta['dims']} dims ({meta['explained_variance']:.0%} of variance), "
+              f"{meta['nlist']} lists")
+        report = meta['recall_report']
+        print(f"  recall@{report['k']} vs exhaustive over {report['queries']} sample queries:")
+        for row in report['results']:
+            print(f"    nprobe={row['nprobe']:<5} recall={row['recall']:.3f}  "
+                  f"{row['ms_per_query']:.3f} ms/query")
+        print(f"  Default nprobe: {meta['nprobe']}")
+    
+    def _retire_outputs(self):
+        """Unlink the previous index files so servers still mapping them
+        keep a consistent copy until they reload"""
+        retire_files(self.output_dir, INDEX_FILES + LSI_FILES)
+    
+    def _publish_version(self, num_docs):
+        """Mark the index complete; servers watching the directory reload"""
+        version = publish_version(self.output_dir, INDEX_FILES + LSI_FILES, documents=num_docs)
+        print(f"Published index version {version}")
     
     def get_stats(self):
         """Print index statistics"""
+        lengths = [m['length'] for m in self.doc_metadata.values()]
+        self._print_stats(
+            len(self.doc_ids),
+            len(self.inverted_index) if self.inverted_index else 0,
+            len(self.vectorizer.vocabulary_) if self.vectorizer else 0,
+            np.mean(lengths) if lengths else 0.0)
+    
+    @staticmethod
+    def _print_stats(num_docs, num_terms, vocab_size, avg_length):
         print("\n" + "=" * 60)
         print("INDEX STATISTICS")
         print("=" * 60)
-        print(f"Documents indexed: {len(self.documents)}")
-        print(f"Unique terms: {len(self.inverted_index)}")
-        print(f"Vocabulary size (TF-IDF): {len(self.vectorizer.vocabulary_) if self.vectorizer else 0}")
-        print(f"Average doc length: {np.mean([m['length'] for m in self.doc_metadata.values()]):.0f} tokens")
+        print(f"Documents indexed: {num_docs}")
+        print(f"Unique terms: {num_terms}")
+        print(f"Vocabulary size (TF-IDF): {vocab_size}")
+        print(f"Average doc length: {avg_length:.0f} tokens")
         print("=" * 60)
     
     def build(self):
         """Main build process"""
-        self.load_documents()
-        self.build_inverted_index()
-        self.build_tfidf()
+        with self._stage('load_documents'):
+            self.load_documents()
+        with self._stage('build_inverted_index'):
+            self.build_inverted_index()
+        with self._stage('build_tfidf'):
+            self.build_tfidf()
+        self._retire_outputs()
         self.save_index()
+        self.build_lsi()
+        self._publish_version(len(self.doc_ids))
         self.get_stats()
+        self._save_profile('build', len(self.doc_ids))
+    
+    def build_streaming(self, memory_budget_mb=256):
+        """Out-of-core build (SPIMI) for corpora that do not fit in memory.
+        
+        Documents are parsed lazily and accumulated into blocks that are
+        flushed to spimi_blocks/ whenever the in-memory postings and term
+        counts reach the budget; the blocks are then merged into the same
+        files build() writes, byte for byte.
+        """
+        work_dir = self.output_dir / "spimi_blocks"
+        budget = int(memory_budget_mb * 1024 * 1024)
+        print(f"Streaming documents from {self.html_dir}/ "
+              f"(memory budget {memory_budget_mb} MB)...")
+        
+        analyzer = TfidfVectorizer(**TFIDF_PARAMS).build_analyzer()
+        with self._stage('parse_and_invert', "spimi_blocks"):
+            spimi = SpimiBuilder(work_dir, budget, analyzer, max_positions=MAX_POSITIONS)
+            work_dir.mkdir(parents=True, exist_ok=True)
+            with DocStoreWriter(work_dir / DOCSTORE_FILE) as docstore:
+                for doc in self.iter_documents():
+                    spimi.add(*doc)
+                    docstore.add(*doc)
+            store = spimi.finish()
+        print(f"  Flushed {len(store.segments)} blocks to {work_dir}/")
+        
+        print("Merging blocks into index files...")
+        self._retire_outputs()
+        with self._stage('merge_blocks', *INDEX_FILES):
+            summary = publish_blocks(store, self.output_dir, TFIDF_PARAMS, budget)
+            os.replace(work_dir / DOCSTORE_FILE, self.output_dir / DOCSTORE_FILE)
+        shutil.rmtree(work_dir)
+        print(f"  Saved to {self.output_dir}/")
+        self.build_lsi()
+        self._publish_version(summary['documents'])
+        
+        self._print_stats(summary['documents'], summary['unique_terms'],
+                          summary['vocabulary'], summary['avg_length'])
+        self._save_profile('streaming', summary['documents'])
+    
+    def update(self, merge=False):
+        """Incrementally sync the index with html_dir.
+        
+        New and modified files become one new segment under segments/;
+        replaced and deleted docs are tombstoned. Global df/idf statistics
+        and weights are recomputed from the segments' stored counts, with
+        the same doc order and values as build() would give; postings.bin
+        only references the segments' postings files, so their cost does not
+        grow with the corpus. LSI vectors are projected onto the previous
+        basis, which is refitted when segments are merged. The first
+        update() on an empty store indexes every file.
+        """
+        store = SegmentStore(self.output_dir / "segments")
+        print(f"Updating index from {self.html_dir}/ ({len(store.segments)} segments)...")
+        
+        with self._stage('scan_html'):
+            on_disk = {}
+            for html_file in sorted(self.html_dir.glob("*.html")):
+                stat = html_file.stat()
+                on_disk[html_file.stem] = (html_file, stat.st_mtime_ns, stat.st_size)
+            
+            live = store.live_docs()
+            deleted = [doc_id for doc_id in live if doc_id not in on_disk]
+            modified = [doc_id for doc_id, (s, row) in live.items() if doc_id in on_disk
+                        and on_disk[doc_id][1:] != (store.segments[s].docs[row]['mtime_ns'],
+                                                    store.segments[s].docs[row]['size'])]
+            added = [doc_id for doc_id in on_disk if doc_id not in live]
+        print(f"  {len(added)} new, {len(modified)} modified, {len(deleted)} deleted")
+        stale = deleted + modified
+        fresh = sorted(added + modified, key=lambda doc_id: on_disk[doc_id][0])
+        
+        if not fresh and not stale and not merge and store.published:
+            print("  Index is up to date")
+            return
+        
+        store.delete(stale)
+        if fresh:
+            with self._stage('load_documents'):
+                self.load_documents([on_disk[doc_id][0] for doc_id in fresh])
+            docs = []
+            for doc_id in fresh:
+                _, mtime_ns, size = on_disk[doc_id]
+                docs.append(dict(doc_id=doc_id, **self.doc_metadata[doc_id],
+                                 mtime_ns=mtime_ns, size=size))
+            analyzer = TfidfVectorizer(**TFIDF_PARAMS).build_analyzer()
+            with self._stage('write_segment', "segments"):
+                seg = store.add(docs, [self.documents[doc_id] for doc_id in fresh],
+                                analyzer, max_positions=MAX_POSITIONS)
+            print(f"  Wrote segment {seg.name} ({len(docs)} docs)")
+        
+        basis = None
+        if merge or len(store.segments) > self.max_segments:
+            with self._stage('merge_segments', "segments"):
+                seg = store.merge()
+            print(f"  Merged into {seg.name} ({len(seg.docs)} docs)")
+        elif self.lsi_dims:
+            basis = load_basis(self.output_dir)
+            if basis is not None and (basis['meta']['dims'] > self.lsi_dims
+                                      or self.nlist not in (None, basis['meta']['nlist'])):
+                basis = None  # fitted with other settings
+        
+        self._open_previous_docstore()
+        self._retire_outputs()
+        with self._stage('publish', "postings.bin"):
+            self.publish(store)
+        try:
+            self.save_index()
+        finally:
+            self._close_previous_docstore()
+        self.build_lsi(basis)
+        store.save(published=True)
+        self._publish_version(len(self.doc_ids))
+        # Only now does no published file point into merged-away segments
+        store.remove_unlisted()
+        self.get_stats()
+        self._save_profile('update', len(self.doc_ids))
+    
+    def publish(self, store):
+        """Rebuild the query-time index from the live docs of every segment"""
+        print("Publishing index from segments...")
+        
+        # Same doc order as build(): sorted by file name
+        rows = store.live_rows()
+        self.doc_ids = [doc_id for doc_id, _ in rows]
+        self.doc_metadata = {}
+        for doc_id, (s, row) in rows:
+            doc = store.segments[s].docs[row]
+            self.doc_metadata[doc_id] = {k: doc[k] for k in ('url', 'title', 'length')}
+        rows = [loc for _, loc in rows]
+        
+        self.vectorizer, self.tfidf_matrix = fit_tfidf(*store.live_counts(rows), TFIDF_PARAMS)
+        
+        store.write_postings(rows, self.output_dir / "postings.bin")
+        self.inverted_index = open_postings(self.output_dir / "postings.bin")
+        
+        print(f"  {len(self.doc_ids)} live documents in {len(store.segments)} segments")
 
 if __name__ == "__main__":
-    indexer = SearchIndexer(html_dir="../html", output_dir=".")
-    indexer.build()
+    parser = argparse.ArgumentParser(description="Build the search index from HTML files")
+    parser.add_argument("--html-dir", default="../html", help="directory of *.html documents")
+    parser.add_argument("--output-dir", default=".", help="where to write index files")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes used to parse HTML (0 = all cores)")
+    parser.add_argument("--chunksize", type=int, default=16,
+                        help="files handed to a worker at a time")
+    parser.add_argument("--update", action="store_true",
+                        help="incrementally index new/modified/deleted files via segments/")
+    parser.add_argument("--merge", action="store_true",
+                        help="with --update: compact all segments into one")
+    parser.add_argument("--max-segments", type=int, default=8,
+                        help="with --update: merge automatically above this many segments")
+    parser.add_argument("--streaming", action="store_true",
+                        help="out-of-core build: flush index blocks to disk, then merge")
+    parser.add_argument("--memory-budget", type=float, default=256,
+                        help="with --streaming: MB of postings/counts held before a flush")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="re-parse every file instead of using extract_cache.sqlite")
+    parser.add_argument("--profile", action="store_true",
+                        help="time each build stage and write build_stats.json")
+    parser.add_argument("--lsi-dims", type=int, default=None,
+                        help="LSI (truncated SVD) dimensions; 0 skips the LSI/IVF index "
+                             "(default 128, or 0 with --streaming)")
+    parser.add_argument("--nlist", type=int, default=None,
+                        help="IVF lists (k-means clusters); default sqrt(documents)")
+    parser.add_argument("--target-recall", type=float, default=0.95,
+                        help="default nprobe is the smallest reaching this recall@10")
+    args = parser.parse_args()
+    if args.lsi_dims is None:
+        # The SVD and k-means run in memory, so an out-of-core build opts in
+        args.lsi_dims = 0 if args.streaming else 128
+    
+    indexer = SearchIndexer(html_dir=args.html_dir, output_dir=args.output_dir,
+                            workers=args.workers, chunksize=args.chunksize,
+                            max_segments=args.max_segments, cache=not args.no_cache,
+                            profile=args.profile, lsi_dims=args.lsi_dims, nlist=args.nlist,
+                            target_recall=args.target_recall)
+    if args.update:
+        indexer.update(merge=args.merge)
+    elif args.streaming:
+        indexer.build_streaming(memory_budget_mb=args.memory_budget)
+    else:
+        indexer.build()
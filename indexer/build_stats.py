@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Build instrumentation for CS-429 IR Project
+Records wall time, CPU time, peak RSS and output size of each index build
+stage and saves them to build_stats.json
+"""
+
+from contextlib import contextmanager
+import json
+import os
+from pathlib import Path
+import platform
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: no rusage, CPU time of this process only
+    resource = None
+
+
+def _cpu_seconds():
+    """CPU time (user + system) of this process and its reaped children"""
+    if resource is None:
+        return time.process_time()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _reset_peak_rss():
+    """Start a new RSS high-water mark for this process (Linux: writing 5
+    to clear_refs resets VmHWM); False where that is not possible"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _rss_since_reset_mb():
+    """VmHWM of this process: its peak RSS since _reset_peak_rss()"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_mb():
+    """High-water RSS of this process (or its largest child) so far"""
+    if resource is None:
+        return None
+    kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+             resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    scale = 1024 * 1024 if platform.system() == 'Darwin' else 1024  # bytes on macOS
+    return round(kb / scale, 1)
+
+
+def _size(paths):
+    total = 0
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            total += sum(p.stat().st_size for p in path.rglob('*') if p.is_file())
+        elif path.exists():
+            total += path.stat().st_size
+    return total
+
+
+class BuildProfiler:
+    """Collects per-stage measurements of one build run.
+
+    stage() times a block of code in this process and records its own
+    peak RSS: the high-water mark is reset when the stage starts (Linux
+    only; None elsewhere). Worker processes are not included; the total's
+    peak RSS is the whole build's, workers included. add_time() accumulates
+    time spent per document in worker processes (summed over workers, so it
+    can exceed the wall time of the enclosing stage).
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._wall0 = time.perf_counter()
+        self._cpu0 = _cpu_seconds()
+        self.stages = []
+        self.worker_times = {}  # name -> [wall, cpu, count]
+        # Resetting the high-water mark also resets ru_maxrss, so the peak
+        # of the whole build is kept here
+        self._peak_rss = _peak_rss_mb()
+
+    @contextmanager
+    def stage(self, name, outputs=()):
+        """Measure the enclosed block; outputs are files/dirs it writes"""
+        self._note_peak_rss()
+        reset = _reset_peak_rss()
+        wall, cpu = time.perf_counter(), _cpu_seconds()
+        try:
+            yield
+        finally:
+            peak = _rss_since_reset_mb() if reset else None
+            self._note_peak_rss()
+            self.stages.append({
+                'stage': name,
+                'wall_s': round(time.perf_counter() - wall, 4),
+                'cpu_s': round(_cpu_seconds() - cpu, 4),
+                'peak_rss_mb': peak,
+                'output_bytes': _size(outputs),
+            })
+
+    def _note_peak_rss(self):
+        peak = _peak_rss_mb()
+        if peak is not None:
+            self._peak_rss = max(self._peak_rss, peak)
+
+    def add_time(self, name, wall, cpu):
+        totals = self.worker_times.setdefault(name, [0.0, 0.0, 0])
+        totals[0] += wall
+        totals[1] += cpu
+        totals[2] += 1
+
+    def to_dict(self, **info):
+        self._note_peak_rss()
+        return {
+            **info,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'total': {
+                'wall_s': round(time.perf_counter() - self._wall0, 4),
+                'cpu_s': round(_cpu_seconds() - self._cpu0, 4),
+                'peak_rss_mb': self._peak_rss,
+            },
+            'stages': self.stages,
+            'per_document': [
+                {'stage': name, 'calls': n, 'wall_s': round(wall, 4), 'cpu_s': round(cpu, 4)}
+                for name, (wall, cpu, n) in self.worker_times.items()
+            ],
+        }
+
+    def save(self, path, **info):
+        stats = self.to_dict(**info)
+        with open(path, 'w') as f:
+            json.dump(stats, f, indent=2)
+        return stats
+
+
+def print_profile(stats):
+    """Human-readable table of a build_stats dict"""
+    print("\n" + "=" * 60)
+    print("BUILD PROFILE")
+    print("=" * 60)
+    print(f"{'stage':<24}{'wall s':>9}{'cpu s':>9}{'rss MB':>9}{'bytes':>12}")
+    for s in stats['stages']:
+        rss = '-' if s['peak_rss_mb'] is None else f"{s['peak_rss_mb']:.1f}"
+        size = f"{s['output_bytes']:,}" if s['output_bytes'] else ''
+        print(f"{s['stage']:<24}{s['wall_s']:>9.3f}{s['cpu_s']:>9.3f}{rss:>9}{size:>12}")
+    for s in stats['per_document']:
+        print(f"  {s['stage']:<22}{s['wall_s']:>9.3f}{s['cpu_s']:>9.3f}"
+              f"   ({s['calls']} docs, summed)")
+    total = stats['total']
+    rss = '-' if total['peak_rss_mb'] is None else f"{total['peak_rss_mb']:.1f}"
+    print(f"{'total':<24}{total['wall_s']:>9.3f}{total['cpu_s']:>9.3f}{rss:>9}")
+    print("=" * 60)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Compressed document store for CS-429 IR Project
+Documents are packed into zlib-compressed blocks, each with a metadata
+column (doc id, URL, title) and a cleaned-text column, and located through a
+per-doc (block, row) table, so a reader decompresses only the blocks (and
+columns) of the docs it needs and an update can copy unchanged blocks
+"""
+
+from array import array
+import mmap
+from pathlib import Path
+import struct
+import zlib
+import numpy as np
+
+DOCSTORE_FILE = "docstore.bin"
+DOCSTORE_MAGIC = b'IRDOCS02'
+# magic, num_docs, num_blocks, block table offset, locator offset
+_HEADER = struct.Struct('<8s4Q')
+
+# A block is closed once its text reaches this many bytes (or docs);
+# smaller blocks mean less to decompress per fetched document
+BLOCK_BYTES = 16 << 10
+MAX_BLOCK_DOCS = 64
+# write_docstore() copies a previous block only if at least this share of
+# its rows is still wanted; the rest are recompressed into new blocks
+MIN_LIVE_ROWS = 0.5
+
+
+def _pack(rows):
+    """Uncompressed column: uint32 field lengths, then the UTF-8 fields"""
+    fields = [field.encode('utf-8') for row in rows for field in row]
+    lengths = array('I', [len(field) for field in fields])
+    return lengths.tobytes() + b''.join(fields)
+
+
+class _Column:
+    """A decompressed column; rows are decoded on access"""
+
+    def __init__(self, blob, num_rows, width):
+        lengths = np.frombuffer(blob, dtype='<u4', count=num_rows * width)
+        self.blob, self.width = blob, width
+        self.ends = (4 * len(lengths) + np.cumsum(lengths, dtype=np.int64)).tolist()
+
+    def __getitem__(self, row):
+        i = row * self.width
+        start = self.ends[i - 1] if i else 4 * len(self.ends)
+        fields = []
+        for end in self.ends[i:i + self.width]:
+            fields.append(self.blob[start:end].decode('utf-8'))
+            start = end
+        return fields
+
+
+class DocStoreWriter:
+    """Appends documents (in doc-number order) to a docstore file.
+
+    New documents are packed into new blocks; copy() instead points a doc
+    number at a row of a block copied verbatim from another docstore.
+    """
+
+    def __init__(self, path, level=6):
+        self.path = Path(path)
+        self.level = level
+        self._f = open(self.path, 'wb')
+        self._f.write(b'\0' * _HEADER.size)
+        # Per block: metadata column offset, text column offset, end
+        # offset and number of rows
+        self._table = array('Q')
+        # Per doc number: block and row holding it
+        self._doc_block, self._doc_row = array('I'), array('I')
+        self._copied = {}  # (source path, block) -> block
+        self._meta, self._text, self._pending = [], [], []
+        self._text_bytes = 0
+        self.num_docs = 0
+
+    def add(self, doc_id, url, title, text):
+        self._meta.append((doc_id, url, title))
+        self._text.append((text,))
+        self._text_bytes += len(text)
+        self._pending.append(self._new_doc(0, 0))
+        if self._text_bytes >= BLOCK_BYTES or len(self._text) >= MAX_BLOCK_DOCS:
+            self._flush()
+
+    def copy(self, store, doc_num):
+        """Append doc doc_num of store (an open DocStore); the compressed
+        block holding it is copied once, without decompressing it"""
+        b, row = store.locate(doc_num)
+        key = (store.path, b)
+        if key not in self._copied:
+            self._copied[key] = self._write_block(*store.raw_block(b))
+        self._new_doc(self._copied[key], row)
+
+    def _new_doc(self, block, row):
+        self._doc_block.append(block)
+        self._doc_row.append(row)
+        self.num_docs += 1
+        return self.num_docs - 1
+
+    def _write_block(self, meta_blob, text_blob, num_rows):
+        meta_off = self._f.tell()
+        self._f.write(meta_blob)
+        text_off = self._f.tell()
+        self._f.write(text_blob)
+        self._table.extend((meta_off, text_off, self._f.tell(), num_rows))
+        return len(self._table) // 4 - 1
+
+    def _flush(self):
+        if not self._meta:
+            return
+        b = self._write_block(zlib.compress(_pack(self._meta), self.level),
+                              zlib.compress(_pack(self._text), self.level), len(self._meta))
+        for row, doc_num in enumerate(self._pending):
+            self._doc_block[doc_num], self._doc_row[doc_num] = b, row
+        self._meta, self._text, self._pending = [], [], []
+        self._text_bytes = 0
+
+    def close(self):
+        self._flush()
+        f = self._f
+        f.write(b'\0' * (-f.tell() % 8))
+        table_off = f.tell()
+        f.write(self._table.tobytes())
+        locator_off = f.tell()
+        locator = np.empty((self.num_docs, 2), dtype='<u4')
+        locator[:, 0], locator[:, 1] = self._doc_block, self._doc_row
+        f.write(locator.tobytes())
+        f.seek(0)
+        f.write(_HEADER.pack(DOCSTORE_MAGIC, self.num_docs, len(self._table) // 4,
+                             table_off, locator_off))
+        f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_docstore(path, docs, previous=None):
+    """Write docs in order; returns the file size.
+
+    A doc is a (doc_id, url, title, cleaned_text) tuple or, with previous
+    (an open DocStore), its doc number there: the previous block holding
+    it is then copied as is, unless fewer than MIN_LIVE_ROWS of that
+    block's rows are wanted, in which case its wanted docs are
+    decompressed and packed again (deleted docs stop taking space).
+    """
+    repacked = {}
+    if previous is not None:
+        docs = list(docs)
+        reused = [doc for doc in docs if not isinstance(doc, tuple)]
+        blocks = previous.locate_all(reused)[0]
+        live = np.bincount(blocks, minlength=len(previous.block_rows)) / \
+            np.maximum(previous.block_rows, 1)
+        repack = [doc for doc, b in zip(reused, blocks.tolist()) if live[b] < MIN_LIVE_ROWS]
+        repacked = dict(zip(repack, previous.get(repack)))
+    with DocStoreWriter(path) as writer:
+        for doc in docs:
+            if isinstance(doc, tuple):
+                writer.add(*doc)
+            elif doc in repacked:
+                found = repacked[doc]
+                writer.add(found['doc_id'], found['url'], found['title'], found['text'])
+            else:
+                writer.copy(previous, doc)
+    return Path(path).stat().st_size
+
+
+class DocStore:
+    """Memory-mapped docstore; only the block table is read at open time"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(DOCSTORE_MAGIC)] != DOCSTORE_MAGIC:
+            raise ValueError(f"{self.path} is not a docstore file")
+        _, self.num_docs, num_blocks, table_off, locator_off = _HEADER.unpack_from(self._mm)
+        table = np.frombuffer(self._mm, dtype='<u8', count=4 * num_blocks,
+                              offset=table_off).reshape(-1, 4).astype(np.int64)
+        self._meta_off, self._text_off, self._end_off, self.block_rows = table.T
+        # Left memory-mapped: one (block, row) pair per doc
+        locator = np.frombuffer(self._mm, dtype='<u4', count=2 * self.num_docs,
+                                offset=locator_off).reshape(-1, 2)
+        self._doc_block, self._doc_row = locator[:, 0], locator[:, 1]
+
+    def __len__(self):
+        return self.num_docs
+
+    def locate_all(self, doc_nums):
+        """(blocks, rows) arrays holding doc_nums"""
+        doc_nums = np.asarray(doc_nums, dtype=np.int64)
+        if len(doc_nums) and not (0 <= doc_nums.min() and doc_nums.max() < self.num_docs):
+            bad = doc_nums[(doc_nums < 0) | (doc_nums >= self.num_docs)][0]
+            raise IndexError(f"doc number {bad} out of range")
+        return (self._doc_block[doc_nums].astype(np.int64),
+                self._doc_row[doc_nums].astype(np.int64))
+
+    def locate(self, doc_num):
+        """(block, row) holding doc_num"""
+        blocks, rows = self.locate_all([doc_num])
+        return int(blocks[0]), int(rows[0])
+
+    def raw_block(self, b):
+        """Block b as stored: (compressed metadata column, compressed text
+        column, number of rows)"""
+        return (self._mm[self._meta_off[b]:self._text_off[b]],
+                self._mm[self._text_off[b]:self._end_off[b]], int(self.block_rows[b]))
+
+    def _column(self, b, text):
+        """Block b's metadata or text column, decompressed"""
+        start = self._text_off[b] if text else self._meta_off[b]
+        end = self._end_off[b] if text else self._text_off[b]
+        return _Column(zlib.decompress(self._mm[start:end]), self.block_rows[b],
+                       1 if text else 3)
+
+    def _rows(self, doc_nums):
+        """(block, [(position in doc_nums, row in block), ...]) for each
+        block holding any of doc_nums"""
+        blocks, rows = self.locate_all(doc_nums)
+        for b in np.unique(blocks).tolist():
+            at = np.flatnonzero(blocks == b)
+            yield b, list(zip(at.tolist(), rows[at].tolist()))
+
+    def get(self, doc_nums, text=True):
+        """[{doc_id, url, title[, text]}] for doc_nums, in that order.
+
+        Each block holding one of them is decompressed once.
+        """
+        out = [None] * len(doc_nums)
+        for b, rows in self._rows(doc_nums):
+            meta = self._column(b, False)
+            texts = self._column(b, True) if text else None
+            for i, row in rows:
+                doc_id, url, title = meta[row]
+                out[i] = {'doc_id': doc_id, 'url': url, 'title': title}
+                if text:
+                    out[i]['text'], = texts[row]
+        return out
+
+    def texts(self, doc_nums):
+        """Cleaned text of doc_nums, in that order (text columns only)"""
+        out = [None] * len(doc_nums)
+        for b, rows in self._rows(doc_nums):
+            texts = self._column(b, True)
+            for i, row in rows:
+                out[i], = texts[row]
+        return out
+
+    def close(self):
+        self._doc_block = self._doc_row = None
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
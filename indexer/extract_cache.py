@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Extraction cache for CS-429 IR Project
+Remembers the url, title and cleaned text extracted from each HTML file in a
+SQLite database, keyed by content hash, so rebuilds only parse new or changed
+files
+"""
+
+import hashlib
+import sqlite3
+import zlib
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    digest BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS extracts (
+    digest BLOB PRIMARY KEY,
+    url TEXT NOT NULL,
+    title TEXT NOT NULL,
+    text BLOB NOT NULL  -- zlib-compressed cleaned text
+);
+"""
+
+
+def file_digest(content):
+    """SHA-1 of a file's bytes"""
+    return hashlib.sha1(content).digest()
+
+
+class ExtractLookup:
+    """Read-only access to a cache's extracts by content hash; worker
+    processes use it alongside the ExtractCache the main process writes"""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    def find(self, digest):
+        """(url, title, cleaned_text) extracted from content with this
+        digest, or None"""
+        row = self.conn.execute(
+            "SELECT url, title, text FROM extracts WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        url, title, text = row
+        return url, title, zlib.decompress(text).decode('utf-8')
+
+    def close(self):
+        self.conn.close()
+
+
+class ExtractCache(ExtractLookup):
+    """Persistent (url, title, cleaned_text) cache for parsed HTML files.
+
+    A file whose mtime and size are unchanged is a hit from get() without
+    being read. Otherwise whoever reads the file hashes it and looks the
+    hash up with find() (so touched, copied or renamed files are still
+    hits, and no file is read twice); put() then records it. Entries made
+    by another extractor_version are dropped at open time, and entries
+    for files that no longer exist by evict().
+    """
+
+    def __init__(self, path, extractor_version):
+        self.path = path
+        self.conn = sqlite3.connect(str(path))
+        # Workers read (ExtractLookup) while this connection writes
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != extractor_version:
+            self.conn.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS extracts;")
+            self.conn.execute(f"PRAGMA user_version = {int(extractor_version)}")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.hits = self.misses = self.evicted = 0
+        self.seen = set()
+        self._stats = {}  # name -> (mtime_ns, size) of files get() missed
+
+    def get(self, html_file):
+        """Cached (doc_id, url, title, cleaned_text) of an unchanged file,
+        or None if its mtime or size changed"""
+        stat = html_file.stat()
+        name = html_file.name
+        self.seen.add(name)
+        row = self.conn.execute(
+            "SELECT mtime_ns, size, digest FROM files WHERE name = ?", (name,)).fetchone()
+        found = None
+        if row is not None and tuple(row[:2]) == (stat.st_mtime_ns, stat.st_size):
+            found = self.find(row[2])
+        if found is None:
+            # Stat taken before the file is read: if it changes meanwhile,
+            # the next build sees a different stat and reads it again
+            self._stats[name] = stat.st_mtime_ns, stat.st_size
+            return None
+        self.hits += 1
+        return (html_file.stem, *found)
+
+    def put(self, html_file, digest, url, title, cleaned_text, parsed=True):
+        """Record a file get() missed, with the digest of the content it was
+        extracted from; parsed=False if find() had it already"""
+        mtime_ns, size = self._stats.pop(html_file.name)
+        self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                          (html_file.name, mtime_ns, size, digest))
+        if parsed:
+            self.misses += 1
+            self.conn.execute("INSERT OR REPLACE INTO extracts VALUES (?, ?, ?, ?)",
+                              (digest, url, title, zlib.compress(cleaned_text.encode('utf-8'))))
+        else:
+            self.hits += 1
+
+    def evict(self):
+        """Drop entries for files not looked up since the cache was opened"""
+        names = [name for (name,) in self.conn.execute("SELECT name FROM files")
+                 if name not in self.seen]
+        self.conn.executemany("DELETE FROM files WHERE name = ?", ((n,) for n in names))
+        cur = self.conn.execute(
+            "DELETE FROM extracts WHERE digest NOT IN (SELECT digest FROM files)")
+        self.evicted += cur.rowcount
+        return self.evicted
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return (f"{self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), "
+                f"{self.evicted} evicted")
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
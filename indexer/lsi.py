@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+LSI dense vectors and IVF approximate nearest-neighbour index for CS-429 IR Project
+Truncated SVD reduces the saved TF-IDF matrix to unit-length float32 document
+vectors, stored grouped by their k-means (inverted file) list so a query only
+reads the lists it probes
+"""
+
+import json
+from pathlib import Path
+import time
+import numpy as np
+
+from tfidf_store import load_tfidf_matrix
+
+# Projection (dims x features), vectors grouped by list, their doc numbers,
+# list centroids and list boundaries
+LSI_FILES = ("lsi_components.npy", "lsi_vectors.npy", "lsi_doc_nums.npy",
+             "ivf_centroids.npy", "ivf_indptr.npy", "lsi_meta.json")
+
+# k-means is trained on at most this many sampled vectors per list
+TRAIN_PER_LIST = 64
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def _project(rows, components):
+    """Unit-length float32 LSI vectors of sparse TF-IDF rows"""
+    return _normalize(np.asarray(rows @ components.T, dtype=np.float32))
+
+
+def _assign(vectors, centroids):
+    """Nearest centroid (by inner product) of each vector"""
+    return np.argmax(vectors @ centroids.T, axis=1)
+
+
+def _sample_queries(matrix, num_queries, terms, rng):
+    """Keyword-like queries: the `terms` highest-weighted features of
+    sampled documents"""
+    rows = []
+    for doc in rng.choice(matrix.shape[0], min(num_queries, matrix.shape[0]), replace=False):
+        row = matrix[int(doc)]
+        if row.nnz:
+            keep = np.argsort(-row.data, kind='stable')[:terms]
+            rows.append((row.indices[keep], row.data[keep]))
+    return rows
+
+
+def build_lsi(output_dir, dims=128, nlist=None, target_recall=0.95, seed=0,
+              block_rows=1 << 16, num_queries=200, k=10):
+    """Write the LSI projection, the IVF-ordered vectors and lsi_meta.json.
+
+    Reads the saved (memory-mapped) CSR matrix, so it runs after any build
+    mode; vectors are projected in row blocks straight into their lists.
+    nlist defaults to sqrt(num_docs). The recall@k of each nprobe against
+    an exhaustive scan is measured on sampled keyword queries and stored;
+    the smallest nprobe reaching target_recall becomes the default.
+    Returns the meta dict, or None if the matrix is too small to reduce.
+    """
+    from sklearn.cluster import KMeans
+    from sklearn.decomposition import TruncatedSVD
+
+    output_dir = Path(output_dir)
+    matrix = load_tfidf_matrix(output_dir)
+    num_docs, num_features = matrix.shape
+    dims = min(dims, num_docs - 1, num_features - 1)
+    if dims < 1:
+        return None
+    rng = np.random.default_rng(seed)
+
+    svd = TruncatedSVD(n_components=dims, algorithm='randomized', random_state=seed)
+    svd.fit(matrix)
+    components = svd.components_.astype(np.float32)
+
+    # Coarse quantizer, trained on a sample
+    nlist = max(1, min(nlist or int(round(np.sqrt(num_docs))), num_docs))
+    train_size = min(num_docs, nlist * TRAIN_PER_LIST)
+    train_rows = np.sort(rng.choice(num_docs, train_size, replace=False))
+    kmeans = KMeans(n_clusters=nlist, n_init=1, random_state=seed)
+    kmeans.fit(_project(matrix[train_rows], components))
+    centroids = _normalize(kmeans.cluster_centers_.astype(np.float32))
+
+    meta = {
+        'dims': dims,
+        'nlist': nlist,
+        'explained_variance': round(float(svd.explained_variance_ratio_.sum()), 4),
+    }
+    return _write_ivf(output_dir, matrix, components, centroids, meta, target_recall,
+                      rng, block_rows, num_queries, k)
+
+
+def load_basis(indexer_dir):
+    """The projection, centroids and meta of a published LSI index, with
+    the TF-IDF vocabulary its columns refer to; None if there is none"""
+    indexer_dir = Path(indexer_dir)
+    if not IVFIndex.exists(indexer_dir) or not (indexer_dir / "tfidf_vocab.json").exists():
+        return None
+    with open(indexer_dir / LSI_FILES[5], 'r') as f:
+        meta = json.load(f)
+    with open(indexer_dir / "tfidf_vocab.json", 'r') as f:
+        terms = json.load(f)
+    return {'components': np.load(indexer_dir / LSI_FILES[0]),
+            'centroids': np.load(indexer_dir / LSI_FILES[3]), 'meta': meta, 'terms': terms}
+
+
+def fold_in_lsi(output_dir, basis, target_recall=0.95, seed=0, block_rows=1 << 16,
+                num_queries=200, k=10):
+    """Rewrite the LSI vectors of a changed index with a previous basis.
+
+    Every doc is projected with the old components (their columns matched
+    to the new vocabulary by term; new terms get zero weight) and assigned
+    to the old centroids, so no SVD or k-means runs. The basis goes stale
+    as the corpus drifts; build_lsi() refits it.
+    """
+    output_dir = Path(output_dir)
+    matrix = load_tfidf_matrix(output_dir)
+    with open(output_dir / "tfidf_vocab.json", 'r') as f:
+        vocab = json.load(f)
+    old_col = {term: col for col, term in enumerate(basis['terms'])}
+    shared = [(col, old_col[term]) for col, term in enumerate(vocab) if term in old_col]
+    components = np.zeros((basis['meta']['dims'], len(vocab)), dtype=np.float32)
+    if shared:
+        new, old = np.array(shared).T
+        components[:, new] = basis['components'][:, old]
+
+    meta = {key: basis['meta'][key] for key in ('dims', 'nlist', 'explained_variance')}
+    meta['folded_in'] = True
+    return _write_ivf(output_dir, matrix, components, basis['centroids'], meta, target_recall,
+                      np.random.default_rng(seed), block_rows, num_queries, k)
+
+
+def _write_ivf(output_dir, matrix, components, centroids, meta, target_recall, rng,
+               block_rows, num_queries, k):
+    """Assign every doc to its list, write the LSI files and measure recall"""
+    num_docs = matrix.shape[0]
+    nlist = len(centroids)
+    np.save(output_dir / LSI_FILES[0], components)
+
+    blocks = [(r, min(r + block_rows, num_docs)) for r in range(0, num_docs, block_rows)]
+    labels = np.empty(num_docs, dtype=np.int32)
+    for r0, r1 in blocks:
+        labels[r0:r1] = _assign(_project(matrix[r0:r1], components), centroids)
+    ivf_indptr = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=nlist), out=ivf_indptr[1:])
+    doc_nums = np.argsort(labels, kind='stable')  # docs ascend within a list
+    slot = np.empty(num_docs, dtype=np.int64)
+    slot[doc_nums] = np.arange(num_docs)
+
+    vectors = np.lib.format.open_memmap(output_dir / LSI_FILES[1], mode='w+',
+                                        dtype=np.float32, shape=(num_docs, len(components)))
+    for r0, r1 in blocks:
+        vectors[slot[r0:r1]] = _project(matrix[r0:r1], components)
+    vectors.flush()
+    del vectors
+    doc_dtype = np.int32 if num_docs < 2**31 else np.int64
+    np.save(output_dir / LSI_FILES[2], doc_nums.astype(doc_dtype))
+    np.save(output_dir / LSI_FILES[3], centroids)
+    np.save(output_dir / LSI_FILES[4], ivf_indptr)
+
+    index = IVFIndex(components, np.load(output_dir / LSI_FILES[1], mmap_mode='r'),
+                     doc_nums, centroids, ivf_indptr, meta)
+    queries = [index.project_terms(cols, weights)
+               for cols, weights in _sample_queries(matrix, num_queries, 3, rng)]
+    nprobes = sorted({min(2**i, nlist) for i in range(nlist.bit_length() + 1)})
+    report = recall_at_k(index, queries, k, nprobes)
+    meta['nprobe'] = next((row['nprobe'] for row in report if row['recall'] >= target_recall),
+                          nlist)
+    meta['recall_report'] = {'k': k, 'queries': len(queries), 'results': report}
+    with open(output_dir / LSI_FILES[5], 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class IVFIndex:
+    """Memory-mapped LSI vectors with an inverted-file coarse quantizer.
+
+    List l holds rows indptr[l]:indptr[l+1] of vectors (and doc_nums).
+    Scores are inner products of unit vectors, i.e. cosine in LSI space.
+    """
+
+    def __init__(self, components, vectors, doc_nums, centroids, indptr, meta):
+        self.components = components
+        self.vectors = vectors
+        self.doc_nums = doc_nums
+        self.centroids = centroids
+        self.indptr = indptr
+        self.meta = meta
+        self.nlist = len(indptr) - 1
+        self.nprobe = meta.get('nprobe', self.nlist)
+
+    @classmethod
+    def load(cls, indexer_dir, mmap_mode='r'):
+        indexer_dir = Path(indexer_dir)
+        with open(indexer_dir / LSI_FILES[5], 'r') as f:
+            meta = json.load(f)
+        components, vectors, doc_nums = (np.load(indexer_dir / name, mmap_mode=mmap_mode)
+                                         for name in LSI_FILES[:3])
+        # Small, read on every query
+        centroids = np.load(indexer_dir / LSI_FILES[3])
+        indptr = np.load(indexer_dir / LSI_FILES[4])
+        return cls(components, vectors, doc_nums, centroids, indptr, meta)
+
+    @staticmethod
+    def exists(indexer_dir):
+        return all((Path(indexer_dir) / name).exists() for name in LSI_FILES)
+
+    def project(self, query_vec):
+        """Unit-length LSI vector of a 1 x features sparse query"""
+        return self.project_terms(query_vec.indices, query_vec.data)
+
+    def project_terms(self, cols, weights):
+        vec = np.asarray(weights, dtype=np.float32) @ self.components[:, cols].T
+        return _normalize(vec)
+
+    def search(self, query, k, nprobe=None):
+        """(doc indices, scores) of the k best docs in the nprobe lists whose
+        centroids are closest to query, best first (ties: lower doc).
+        nprobe=None probes the default number of lists; below 1 is a
+        ValueError."""
+        if nprobe is None:
+            nprobe = self.nprobe
+        elif nprobe < 1:
+            raise ValueError("nprobe must be >= 1")
+        nprobe = min(nprobe, self.nlist)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if nprobe < self.nlist:
+            probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(self.nlist)
+        spans = [(self.indptr[l], self.indptr[l + 1]) for l in np.sort(probe)]
+        spans = [(lo, hi) for lo, hi in spans if hi > lo]
+        if not spans:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        docs = np.concatenate([self.doc_nums[lo:hi] for lo, hi in spans])
+        scores = np.concatenate([self.vectors[lo:hi] @ query for lo, hi in spans])
+        if len(scores) > k:
+            keep = np.argpartition(-scores, k - 1)[:k]
+            # Everything tied with the k-th score competes on doc number
+            keep = np.flatnonzero(scores >= scores[keep].min())
+            docs, scores = docs[keep], scores[keep]
+        order = np.lexsort((docs, -scores))[:k]
+        return docs[order].astype(np.int64), scores[order].astype(np.float64)
+
+    def scores(self, query):
+        """LSI cosine of query against every doc, in doc order"""
+        out = np.empty(len(self.doc_nums))
+        out[self.doc_nums] = self.vectors @ query
+        return out
+
+
+def recall_at_k(index, queries, k=10, nprobes=(1,)):
+    """Per nprobe: mean recall@k against probing every list, and mean
+    latency in ms, over LSI query vectors"""
+    exact = [set(index.search(query, k, index.nlist)[0].tolist()) for query in queries]
+    report = []
+    for nprobe in nprobes:
+        found = 0
+        start = time.perf_counter()
+        results = [index.search(query, k, nprobe)[0] for query in queries]
+        elapsed = time.perf_counter() - start
+        for truth, docs in zip(exact, results):
+            found += len(truth.intersection(docs.tolist()))
+        total = sum(len(truth) for truth in exact)
+        report.append({
+            'nprobe': int(nprobe),
+            'recall': round(found / total, 4) if total else 1.0,
+            'ms_per_query': round(1000 * elapsed / max(len(queries), 1), 4),
+        })
+    return report
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Index version manifest for CS-429 IR Project
+A build first marks index_version.json as being rebuilt, replaces its output
+files by unlinking the old ones (running query servers keep their
+memory-mapped copies) and writes the new manifest last, with the size of
+every file, so a reader that sees a version sees a complete index and can
+check that the files on disk are that version's
+"""
+
+import json
+import os
+from pathlib import Path
+import time
+import uuid
+
+MANIFEST_FILE = "index_version.json"
+
+
+def _write_manifest(output_dir, manifest):
+    """Replace the manifest atomically"""
+    output_dir = Path(output_dir)
+    tmp = output_dir / (MANIFEST_FILE + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, output_dir / MANIFEST_FILE)
+
+
+def retire_files(output_dir, names):
+    """Mark the index as being rebuilt, then unlink previous outputs
+    before they are rewritten.
+
+    Writing in place would truncate files that servers have mapped;
+    unlinked files live on until the last mapping is closed. A server
+    loading meanwhile sees the manifest change and discards what it read.
+    """
+    _write_manifest(output_dir, {'version': None,
+                                 'building_since': time.strftime('%Y-%m-%dT%H:%M:%S')})
+    for name in names:
+        (Path(output_dir) / name).unlink(missing_ok=True)
+
+
+def publish_version(output_dir, files=(), **info):
+    """Atomically write a new manifest recording the size of each of files
+    that exists; returns the version id"""
+    output_dir = Path(output_dir)
+    version = uuid.uuid4().hex[:12]
+    sizes = {name: (output_dir / name).stat().st_size
+             for name in files if (output_dir / name).exists()}
+    _write_manifest(output_dir, dict(version=version,
+                                     built_at=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                     **info, files=sizes))
+    return version
+
+
+def read_manifest(output_dir):
+    """The manifest as a dict, or None without one"""
+    path = Path(output_dir) / MANIFEST_FILE
+    if not path.exists():
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def read_version(output_dir):
+    """Version id of the published index, or None without a manifest;
+    ValueError while a build is rewriting the index"""
+    manifest = read_manifest(output_dir)
+    if manifest is None:
+        return None
+    if manifest['version'] is None:
+        raise ValueError("the index is being rebuilt")
+    return manifest['version']
+
+
+def check_files(output_dir, manifest):
+    """ValueError unless every file the manifest lists has its recorded
+    size on disk"""
+    for name, size in manifest.get('files', {}).items():
+        path = Path(output_dir) / name
+        if not path.exists() or path.stat().st_size != size:
+            raise ValueError(f"{name} on disk is not the one version "
+                             f"{manifest['version']} published")
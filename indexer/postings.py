@@ -0,0 +1,767 @@
+#!/usr/bin/env python3
+"""
+Positional inverted index for CS-429 IR Project
+Postings are kept in flat typed arrays keyed by dense int32 doc numbers,
+and saved as a varint-compressed file that is read back through mmap
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+import heapq
+from itertools import groupby, islice
+import json
+import mmap
+import os
+from pathlib import Path
+import struct
+import numpy as np
+
+
+def _offsets(counts):
+    """Exclusive prefix sums [0, c0, c0+c1, ...]; int32 unless they overflow it"""
+    total = int(np.sum(counts, dtype=np.int64))
+    ptr = np.zeros(len(counts) + 1, dtype=np.int32 if total < 2**31 else np.int64)
+    np.cumsum(counts, out=ptr[1:])
+    return ptr
+
+
+class PositionalIndexBuilder:
+    """Accumulates documents into append-only buffers (O(total tokens))"""
+
+    # Rough per-distinct-term cost of the term dict, for memory budgeting
+    TERM_OVERHEAD = 120
+
+    def __init__(self, max_positions=None):
+        self.max_positions = max_positions
+        self.num_docs = 0
+        self.term_ids = {}
+        self.term_buf, self.doc_buf, self.tf_buf = array('i'), array('i'), array('i')
+        self.npos_buf, self.pos_buf = array('i'), array('i')
+
+    def add(self, tokens):
+        """Index one document's tokens as the next doc number"""
+        doc_num = self.num_docs
+        self.num_docs += 1
+        term_positions = defaultdict(list)
+        for pos, token in enumerate(tokens):
+            term_positions[token].append(pos)
+
+        term_ids = self.term_ids
+        for term, positions in term_positions.items():
+            self.term_buf.append(term_ids.setdefault(term, len(term_ids)))
+            self.doc_buf.append(doc_num)
+            self.tf_buf.append(len(positions))
+            if self.max_positions is not None:
+                positions = positions[:self.max_positions]
+            self.npos_buf.append(len(positions))
+            self.pos_buf.extend(positions)
+        return doc_num
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the buffers"""
+        postings = len(self.doc_buf)
+        return 16 * postings + 4 * len(self.pos_buf) + self.TERM_OVERHEAD * len(self.term_ids)
+
+    def finish(self):
+        return PositionalIndex.from_buffers(self.term_ids, self.term_buf, self.doc_buf,
+                                            self.tf_buf, self.npos_buf, self.pos_buf)
+
+
+def index_sample(index, n, doc_ids):
+    """JSON-friendly {term: {df, postings}} view of the first n terms"""
+    out = {}
+    for term in islice(iter(index), n):
+        docs, tfs = index.postings(term)
+        out[term] = {
+            'df': len(docs),
+            'postings': [
+                {'doc_id': doc_ids[d], 'tf': int(tf), 'positions': pos.tolist()}
+                for d, tf, pos in zip(docs, tfs, index.positions_for(term))
+            ],
+        }
+    return out
+
+
+def reorder_runs(counts, order):
+    """Reorder variable-length runs: returns (new counts, gather index)"""
+    old_ptr = _offsets(counts)
+    counts = counts[order]
+    new_ptr = _offsets(counts)
+    gather = np.repeat(old_ptr[:-1][order] - new_ptr[:-1], counts) + np.arange(new_ptr[-1])
+    return counts, gather
+
+
+class PositionalIndex:
+    """Positional inverted index in CSR layout.
+
+    Doc numbers are positions in doc_ids.json. For term t (its rank in the
+    sorted vocabulary) the postings are doc_nums/tfs[post_ptr[t]:post_ptr[t+1]],
+    and posting p has positions[pos_ptr[p]:pos_ptr[p+1]].
+    """
+
+    def __init__(self, terms, post_ptr, doc_nums, tfs, pos_ptr, positions):
+        self.terms = terms          # sorted list of str
+        self.post_ptr = post_ptr    # int32/int64[T+1]
+        self.doc_nums = doc_nums    # int32[P]
+        self.tfs = tfs              # int32[P]
+        self.pos_ptr = pos_ptr      # int32/int64[P+1]
+        self.positions = positions  # int32[N]
+
+    @classmethod
+    def build(cls, token_lists, max_positions=None):
+        """Build from an iterable of token lists, one per doc number"""
+        builder = PositionalIndexBuilder(max_positions)
+        for tokens in token_lists:
+            builder.add(tokens)
+        return builder.finish()
+
+    @classmethod
+    def from_buffers(cls, term_ids, term_buf, doc_buf, tf_buf, npos_buf, pos_buf):
+        """Group doc-ordered (term, doc, tf, positions) tuples by sorted term"""
+        terms = list(term_ids)  # insertion order == term id
+        order = sorted(range(len(terms)), key=terms.__getitem__)
+        rank = np.empty(len(terms), dtype=np.int32)
+        rank[order] = np.arange(len(terms), dtype=np.int32)
+        terms = [terms[i] for i in order]
+
+        term_nums = rank[np.frombuffer(term_buf, dtype=np.int32)]
+        # Stable sort keeps doc numbers ascending inside each posting list
+        perm = np.argsort(term_nums, kind='stable')
+
+        post_ptr = _offsets(np.bincount(term_nums, minlength=len(terms)))
+
+        # Move each posting's position run along with the posting
+        npos, gather = reorder_runs(np.frombuffer(npos_buf, dtype=np.int32), perm)
+
+        return cls(
+            terms,
+            post_ptr,
+            np.frombuffer(doc_buf, dtype=np.int32)[perm],
+            np.frombuffer(tf_buf, dtype=np.int32)[perm],
+            _offsets(npos),
+            np.frombuffer(pos_buf, dtype=np.int32)[gather],
+        )
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return self.term_id(term) >= 0
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    @property
+    def num_postings(self):
+        return len(self.doc_nums)
+
+    def term_id(self, term):
+        """Rank of term in the sorted vocabulary, or -1"""
+        i = bisect_left(self.terms, term)
+        return i if i < len(self.terms) and self.terms[i] == term else -1
+
+    def df(self, term):
+        t = self.term_id(term)
+        return 0 if t < 0 else int(self.post_ptr[t + 1] - self.post_ptr[t])
+
+    def postings(self, term):
+        """(doc_nums, tfs) array views for term; empty if unknown"""
+        t = self.term_id(term)
+        if t < 0:
+            return self.doc_nums[:0], self.tfs[:0]
+        lo, hi = self.post_ptr[t], self.post_ptr[t + 1]
+        return self.doc_nums[lo:hi], self.tfs[lo:hi]
+
+    def docs(self, term):
+        """Sorted doc numbers of term (a view); empty if unknown"""
+        return self.postings(term)[0]
+
+    def positions_for(self, term):
+        """Per-posting position arrays for term"""
+        t = self.term_id(term)
+        if t < 0:
+            return []
+        return [self.positions[self.pos_ptr[p]:self.pos_ptr[p + 1]]
+                for p in range(self.post_ptr[t], self.post_ptr[t + 1])]
+
+    def read(self, t):
+        """(doc_nums, tfs, pos_ptr, positions) of term number t"""
+        lo, hi = self.post_ptr[t], self.post_ptr[t + 1]
+        pos_ptr = self.pos_ptr[lo:hi + 1]
+        return (self.doc_nums[lo:hi], self.tfs[lo:hi],
+                pos_ptr - pos_ptr[0], self.positions[pos_ptr[0]:pos_ptr[-1]])
+
+    def read_term(self, term):
+        """read() of term, or None if unknown"""
+        t = self.term_id(term)
+        return None if t < 0 else self.read(t)
+
+
+# ---------------------------------------------------------------------------
+# Varint (LEB128) codec, vectorized with NumPy
+# ---------------------------------------------------------------------------
+
+def varint_sizes(values):
+    """Encoded byte length of each value"""
+    v = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(v), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        sizes += v >= np.uint64(1 << shift)
+    return sizes
+
+
+def encode_varints(values):
+    """Encode non-negative ints as a uint8 LEB128 stream"""
+    v = np.asarray(values, dtype=np.uint64)
+    sizes = varint_sizes(v)
+    starts = np.zeros(len(v), dtype=np.int64)
+    np.cumsum(sizes[:-1], out=starts[1:])
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for k in range(int(sizes.max()) if len(v) else 0):
+        live = sizes > k
+        byte = (v[live] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        byte |= np.where(sizes[live] > k + 1, 0x80, 0).astype(np.uint64)
+        out[starts[live] + k] = byte
+    return out
+
+
+def decode_varints(buf):
+    """Decode a whole uint8 LEB128 stream into a uint64 array"""
+    b = np.frombuffer(buf, dtype=np.uint8)
+    ends = np.flatnonzero(b < 0x80)
+    starts = np.zeros(len(ends), dtype=np.int64)
+    starts[1:] = ends[:-1] + 1
+    sizes = ends - starts + 1
+    out = np.zeros(len(ends), dtype=np.uint64)
+    for k in range(int(sizes.max()) if len(ends) else 0):
+        live = sizes > k
+        out[live] |= (b[starts[live] + k] & 0x7F).astype(np.uint64) << np.uint64(7 * k)
+    return out
+
+
+def _gaps(values, ptr):
+    """Delta-encode values within each [ptr[i], ptr[i+1]) run"""
+    gaps = np.diff(np.asarray(values, dtype=np.int64), prepend=0)
+    heads = ptr[:-1][ptr[:-1] < ptr[1:]]
+    gaps[heads] = values[heads]
+    return gaps
+
+
+def _ungaps(gaps, counts):
+    """Inverse of _gaps for consecutive runs of the given lengths"""
+    total = np.concatenate(([0], np.cumsum(gaps, dtype=np.int64)))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    return total[1:] - np.repeat(total[starts], counts)
+
+
+# ---------------------------------------------------------------------------
+# On-disk postings file
+#
+#   header   magic, num_terms, num_docs, num_postings, section offsets
+#   data     per term: varints of doc gaps[df], tfs[df], npos[df],
+#            then each posting's position gaps (first one absolute);
+#            IRPOST02 files keep every position, so npos (= tf) is omitted
+#   term_ptr uint64[T+1]  byte offsets into the term blob
+#   terms    sorted UTF-8 terms, concatenated
+#   df       uint32[T]
+#   data_ptr uint64[T+1]  byte offsets of each term's data
+# ---------------------------------------------------------------------------
+
+POSTINGS_MAGIC = b'IRPOST01'
+FULL_POSITIONS_MAGIC = b'IRPOST02'
+_HEADER = struct.Struct('<8s7Q')
+
+
+class PostingsWriter:
+    """Streams term-sorted PositionalIndex chunks into a postings file.
+
+    With full_positions every posting must keep all tf positions, and the
+    per-posting position counts are not stored.
+    """
+
+    def __init__(self, path, num_docs, full_positions=False):
+        self.path = path
+        self.num_docs = num_docs
+        self.full_positions = full_positions
+        self._f = open(path, 'wb')
+        self._f.write(b'\0' * _HEADER.size)
+        self._term_ptr = array('Q', [0])
+        self._terms = bytearray()
+        self._df = array('I')
+        self._data_ptr = array('Q', [0])
+        self._num_postings = 0
+        self._last_term = None
+
+    def add(self, index):
+        """Append every term of index; terms must sort after those already written"""
+        if not len(index):
+            return
+        if self._last_term is not None and index.terms[0] <= self._last_term:
+            raise ValueError("PostingsWriter terms must be added in sorted order")
+        self._last_term = index.terms[-1]
+
+        df = np.diff(index.post_ptr).astype(np.int64)
+        npos = np.diff(index.pos_ptr).astype(np.int64)
+        num_terms, num_postings = len(df), len(npos)
+        if self.full_positions and not np.array_equal(npos, index.tfs):
+            raise ValueError("full_positions postings must keep every position")
+        stride = 2 if self.full_positions else 3
+
+        # Lay every term's [doc gaps | tfs | npos | position gaps] out
+        # contiguously, then varint-encode the whole chunk in one call
+        seg_len = stride * df + np.diff(index.pos_ptr[index.post_ptr]).astype(np.int64)
+        seg_start = np.zeros(num_terms, dtype=np.int64)
+        np.cumsum(seg_len[:-1], out=seg_start[1:])
+
+        term_of = np.repeat(np.arange(num_terms), df)
+        rel = np.arange(num_postings) - index.post_ptr[:-1][term_of]
+        values = np.empty(int(seg_len.sum()), dtype=np.int64)
+        values[seg_start[term_of] + rel] = _gaps(index.doc_nums, index.post_ptr)
+        values[seg_start[term_of] + df[term_of] + rel] = index.tfs
+        if not self.full_positions:
+            values[seg_start[term_of] + 2 * df[term_of] + rel] = npos
+
+        pos_term = np.repeat(term_of, npos)
+        pos_first = index.pos_ptr[index.post_ptr[:-1]][pos_term]
+        pos_rel = np.arange(len(index.positions)) - pos_first
+        values[seg_start[pos_term] + stride * df[pos_term] + pos_rel] = _gaps(index.positions, index.pos_ptr)
+
+        encoded = encode_varints(values)
+        sizes = varint_sizes(values)
+        seg_bytes = np.add.reduceat(sizes, seg_start) if len(values) else sizes
+        self._f.write(encoded.tobytes())
+
+        base = self._data_ptr[-1]
+        self._data_ptr.extend((base + np.cumsum(seg_bytes)).tolist())
+        self._df.extend(df.tolist())
+        for term in index.terms:
+            self._terms += term.encode('utf-8')
+            self._term_ptr.append(len(self._terms))
+        self._num_postings += num_postings
+
+    def close(self):
+        f = self._f
+        data_end = f.tell()
+        sections = []
+        for blob in (self._term_ptr, self._terms, self._df, self._data_ptr):
+            f.write(b'\0' * (-f.tell() % 8))  # keep arrays 8-byte aligned
+            sections.append(f.tell())
+            f.write(bytes(blob))
+        assert data_end - _HEADER.size == self._data_ptr[-1]
+        f.seek(0)
+        magic = FULL_POSITIONS_MAGIC if self.full_positions else POSTINGS_MAGIC
+        f.write(_HEADER.pack(magic, len(self._df), self.num_docs,
+                             self._num_postings, *sections))
+        f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_postings_file(index, path, num_docs):
+    """Write a whole PositionalIndex to path; returns the file size"""
+    full_positions = np.array_equal(np.diff(index.pos_ptr), index.tfs)
+    with PostingsWriter(path, num_docs, full_positions) as writer:
+        writer.add(index)
+    return Path(path).stat().st_size
+
+
+class PostingsReader:
+    """Memory-mapped postings file; decodes one term's postings on demand.
+
+    Only the header is read at open time, so cold start and resident
+    memory do not depend on vocabulary size.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, num_terms, self.num_docs, self.num_postings,
+         term_ptr_off, terms_off, df_off, data_ptr_off) = _HEADER.unpack_from(self._mm)
+        if magic not in (POSTINGS_MAGIC, FULL_POSITIONS_MAGIC):
+            raise ValueError(f"{self.path} is not a postings file")
+        self.full_positions = magic == FULL_POSITIONS_MAGIC
+        self._num_terms = num_terms
+        self._term_ptr = np.frombuffer(self._mm, dtype='<u8', count=num_terms + 1, offset=term_ptr_off)
+        self._terms_off = terms_off
+        self._df = np.frombuffer(self._mm, dtype='<u4', count=num_terms, offset=df_off)
+        self._data_ptr = np.frombuffer(self._mm, dtype='<u8', count=num_terms + 1, offset=data_ptr_off)
+
+    def __len__(self):
+        return self._num_terms
+
+    def __contains__(self, term):
+        return self.term_id(term) >= 0
+
+    def __iter__(self):
+        return (self.term_at(t) for t in range(self._num_terms))
+
+    def _term_bytes(self, t):
+        return self._mm[self._terms_off + self._term_ptr[t]:self._terms_off + self._term_ptr[t + 1]]
+
+    def term_at(self, t):
+        return self._term_bytes(t).decode('utf-8')
+
+    def term_id(self, term):
+        """Binary search of the on-disk term dictionary, or -1"""
+        key = term.encode('utf-8')
+        t = bisect_left(range(self._num_terms), key, key=self._term_bytes)
+        return t if t < self._num_terms and self._term_bytes(t) == key else -1
+
+    def df(self, term):
+        t = self.term_id(term)
+        return 0 if t < 0 else int(self._df[t])
+
+    def read(self, t):
+        """Decode term number t into (doc_nums, tfs, pos_ptr, positions)"""
+        df = int(self._df[t])
+        lo = _HEADER.size + int(self._data_ptr[t])
+        hi = _HEADER.size + int(self._data_ptr[t + 1])
+        values = decode_varints(self._mm[lo:hi]).astype(np.int64)
+        doc_nums = np.cumsum(values[:df]).astype(np.int32)
+        tfs = values[df:2 * df].astype(np.int32)
+        if self.full_positions:
+            npos, start = values[df:2 * df], 2 * df
+        else:
+            npos, start = values[2 * df:3 * df], 3 * df
+        positions = _ungaps(values[start:], npos).astype(np.int32)
+        return doc_nums, tfs, _offsets(npos), positions
+
+    def read_term(self, term):
+        """read() of term, or None if unknown"""
+        t = self.term_id(term)
+        return None if t < 0 else self.read(t)
+
+    def read_range(self, t0, t1):
+        """PositionalIndex of term numbers t0..t1-1, decoded in one pass.
+
+        Their data is contiguous, so a single varint decode covers every
+        term; the per-term sections are then split out with array indexing.
+        """
+        df = self._df[t0:t1].astype(np.int64)
+        lo = _HEADER.size + int(self._data_ptr[t0])
+        hi = _HEADER.size + int(self._data_ptr[t1])
+        raw = np.frombuffer(self._mm, dtype=np.uint8, count=hi - lo, offset=lo)
+        values = decode_varints(raw).astype(np.int64)
+        # Index of each term's first value: varints ended before its first byte
+        ended = np.cumsum(raw < 0x80)
+        byte_start = (self._data_ptr[t0 + 1:t1] - self._data_ptr[t0]).astype(np.int64)
+        value_start = np.concatenate(([0], ended[byte_start - 1]))
+
+        stride = 2 if self.full_positions else 3
+        post_ptr = _offsets(df)
+        term_of = np.repeat(np.arange(t1 - t0), df)
+        first = value_start[term_of] + np.arange(post_ptr[-1]) - post_ptr[:-1][term_of]
+        tfs = values[first + df[term_of]]
+        npos = tfs if self.full_positions else values[first + 2 * df[term_of]]
+        pos_ptr = _offsets(npos)
+        # A term's position gaps follow its per-posting sections, posting by posting
+        pos_term = np.repeat(term_of, npos)
+        pos_first = pos_ptr[post_ptr[:-1]][pos_term]
+        pos_at = value_start[pos_term] + stride * df[pos_term] + np.arange(pos_ptr[-1]) - pos_first
+        return PositionalIndex(
+            [self.term_at(t) for t in range(t0, t1)], post_ptr,
+            _ungaps(values[first], df).astype(np.int32), tfs.astype(np.int32), pos_ptr,
+            _ungaps(values[pos_at], npos).astype(np.int32))
+
+    def run_end(self, t0, nbytes):
+        """End of the run of terms from t0 whose data fits in nbytes (at
+        least one term)"""
+        t1 = int(np.searchsorted(self._data_ptr, self._data_ptr[t0] + nbytes, side='right')) - 1
+        return min(max(t1, t0 + 1), self._num_terms)
+
+    def postings(self, term):
+        """(doc_nums, tfs) arrays for term; empty if unknown"""
+        t = self.term_id(term)
+        if t < 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        doc_nums, tfs, _, _ = self.read(t)
+        return doc_nums, tfs
+
+    def docs(self, term):
+        """Sorted doc numbers of term; only its doc gaps are decoded"""
+        t = self.term_id(term)
+        if t < 0:
+            return np.empty(0, dtype=np.int32)
+        df = int(self._df[t])
+        lo = _HEADER.size + int(self._data_ptr[t])
+        hi = _HEADER.size + int(self._data_ptr[t + 1])
+        # Doc gaps come first and take at most 5 bytes each
+        head = np.frombuffer(self._mm, dtype=np.uint8, count=min(hi - lo, 5 * df), offset=lo)
+        end = int(np.flatnonzero(head < 0x80)[df - 1]) + 1
+        return np.cumsum(decode_varints(head[:end]).astype(np.int64)).astype(np.int32)
+
+    def positions_for(self, term):
+        """Per-posting position arrays for term"""
+        t = self.term_id(term)
+        if t < 0:
+            return []
+        _, _, pos_ptr, positions = self.read(t)
+        return [positions[pos_ptr[i]:pos_ptr[i + 1]] for i in range(len(pos_ptr) - 1)]
+
+    def close(self):
+        self._term_ptr = self._df = self._data_ptr = None
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------------------------------------------------------------------------
+# Segmented postings file (incremental updates)
+#
+#   header   magic, num_docs, num_segments, JSON length
+#   JSON     [[postings file path relative to this file, rows], ...]
+#   doc maps int32[sum(rows)] (8-byte aligned): global doc number of each
+#            segment row, -1 for a deleted doc
+# ---------------------------------------------------------------------------
+
+SEGMENTED_MAGIC = b'IRPSEG01'
+_SEGMENTED_HEADER = struct.Struct('<8s3Q')
+
+
+def write_segmented_postings(path, postings_paths, doc_maps, num_docs):
+    """Publish several postings files as one index without copying them;
+    returns the size of the (small) file written"""
+    path = Path(path)
+    entries = [[os.path.relpath(p, path.parent), len(doc_map)]
+               for p, doc_map in zip(postings_paths, doc_maps)]
+    blob = json.dumps(entries).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(_SEGMENTED_HEADER.pack(SEGMENTED_MAGIC, num_docs, len(entries), len(blob)))
+        f.write(blob)
+        f.write(b'\0' * (-f.tell() % 8))
+        for doc_map in doc_maps:
+            f.write(np.asarray(doc_map, dtype='<i4').tobytes())
+    return path.stat().st_size
+
+
+def open_postings(path):
+    """PostingsReader, or SegmentedPostings for a file written by an update"""
+    with open(path, 'rb') as f:
+        magic = f.read(len(SEGMENTED_MAGIC))
+    return SegmentedPostings(path) if magic == SEGMENTED_MAGIC else PostingsReader(path)
+
+
+class SegmentedPostings:
+    """Postings spread over immutable per-segment files, read side by side.
+
+    Each segment's postings are decoded as written and their doc numbers
+    mapped through the segment's doc map (deleted docs dropped); a term's
+    lists from several segments are then merged by doc number. Answers
+    the same lookups as a PostingsReader of the merged index, except that
+    len() also counts terms whose docs were all deleted, until the
+    segments are merged.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            magic, self.num_docs, _, blob_len = _SEGMENTED_HEADER.unpack(
+                f.read(_SEGMENTED_HEADER.size))
+            if magic != SEGMENTED_MAGIC:
+                raise ValueError(f"{self.path} is not a segmented postings file")
+            entries = json.loads(f.read(blob_len))
+            f.seek(-f.tell() % 8, os.SEEK_CUR)
+            maps = np.fromfile(f, dtype='<i4', count=sum(rows for _, rows in entries))
+        self.readers = [PostingsReader(self.path.parent / rel) for rel, _ in entries]
+        self._maps = np.split(maps, np.cumsum([rows for _, rows in entries])[:-1])
+        # Without deleted rows a segment's stored df is exact
+        self._complete = [not (doc_map < 0).any() for doc_map in self._maps]
+        self.full_positions = all(reader.full_positions for reader in self.readers)
+        self._num_terms = None
+
+    def _term_lists(self):
+        for reader in self.readers:
+            blob = reader._mm[reader._terms_off:reader._terms_off + int(reader._term_ptr[-1])]
+            ptr = reader._term_ptr.tolist()
+            yield [blob[a:b] for a, b in zip(ptr, ptr[1:])]
+
+    def __len__(self):
+        if self._num_terms is None:
+            self._num_terms = len(set().union(*self._term_lists()))
+        return self._num_terms
+
+    def __contains__(self, term):
+        return self.df(term) > 0
+
+    def __iter__(self):
+        terms = (term for term, _ in groupby(heapq.merge(*self.readers)))
+        return (term for term in terms if term in self)
+
+    def _parts(self, term):
+        """(segment number, term number) of every segment holding term"""
+        for s, reader in enumerate(self.readers):
+            t = reader.term_id(term)
+            if t >= 0:
+                yield s, t
+
+    def read_term(self, term):
+        """(doc_nums, tfs, pos_ptr, positions) of term, or None if unknown"""
+        docs, tfs, npos, positions = [], [], [], []
+        for s, t in self._parts(term):
+            doc_nums, part_tfs, pos_ptr, part_positions = self.readers[s].read(t)
+            mapped = self._maps[s][doc_nums]
+            keep = mapped >= 0
+            docs.append(mapped[keep])
+            tfs.append(part_tfs[keep])
+            npos.append(np.diff(pos_ptr)[keep])
+            positions.append(part_positions[np.repeat(keep, np.diff(pos_ptr))])
+        if not docs:
+            return None
+        docs, tfs, npos, positions = (np.concatenate(col) for col in (docs, tfs, npos, positions))
+        order = np.argsort(docs, kind='stable')
+        npos, gather = reorder_runs(npos, order)
+        return docs[order], tfs[order], _offsets(npos), positions[gather]
+
+    def df(self, term):
+        df = 0
+        for s, t in self._parts(term):
+            if self._complete[s]:
+                df += int(self.readers[s]._df[t])
+            else:
+                df += int((self._maps[s][self.readers[s].docs(term)] >= 0).sum())
+        return df
+
+    def postings(self, term):
+        """(doc_nums, tfs) arrays for term; empty if unknown"""
+        read = self.read_term(term)
+        if read is None:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        return read[0], read[1]
+
+    def docs(self, term):
+        """Sorted doc numbers of term; only its doc gaps are decoded"""
+        docs = [self._maps[s][self.readers[s].docs(term)] for s, _ in self._parts(term)]
+        if not docs:
+            return np.empty(0, dtype=np.int32)
+        docs = np.concatenate(docs)
+        return np.sort(docs[docs >= 0])
+
+    def positions_for(self, term):
+        """Per-posting position arrays for term"""
+        read = self.read_term(term)
+        if read is None:
+            return []
+        _, _, pos_ptr, positions = read
+        return [positions[pos_ptr[i]:pos_ptr[i + 1]] for i in range(len(pos_ptr) - 1)]
+
+    def close(self):
+        for reader in self.readers:
+            reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------------------------------------------------------------------------
+# Merging postings files (segments / SPIMI blocks)
+# ---------------------------------------------------------------------------
+
+# Smallest run of encoded postings a merge input decodes at once, and the
+# rough growth of a run once decoded (term strings, int32 arrays)
+MIN_MERGE_RUN = 4 << 10
+DECODED_GROWTH = 16
+
+
+class _MergeCursor:
+    """Walks one postings file in term order, decoding runs of terms of
+    about chunk_bytes (encoded) at a time, with doc numbers mapped"""
+
+    def __init__(self, reader, doc_map, chunk_bytes):
+        self.reader = reader
+        self.doc_map = np.asarray(doc_map)
+        self.chunk_bytes = chunk_bytes
+        self.next_term = 0   # first term not decoded yet
+        self.chunk = None    # decoded PositionalIndex
+        self.taken = 0       # terms of chunk already merged
+
+    def fill(self):
+        """Decode the next run of terms once the current one is used up;
+        False when the file is exhausted"""
+        if self.chunk is not None and self.taken < len(self.chunk):
+            return True
+        t0 = self.next_term
+        if t0 >= len(self.reader):
+            return False
+        self.next_term = t1 = self.reader.run_end(t0, self.chunk_bytes)
+        self.chunk, self.taken = self.reader.read_range(t0, t1), 0
+        return True
+
+    @property
+    def last_term(self):
+        return self.chunk.terms[-1]
+
+    def take(self, bound):
+        """(terms, df, doc_nums, tfs, npos, positions) of the remaining
+        decoded terms up to bound, doc numbers mapped (-1 = dropped)"""
+        chunk = self.chunk
+        t0, t1 = self.taken, bisect_right(chunk.terms, bound, lo=self.taken)
+        self.taken = t1
+        lo, hi = chunk.post_ptr[t0], chunk.post_ptr[t1]
+        p0, p1 = chunk.pos_ptr[lo], chunk.pos_ptr[hi]
+        return (chunk.terms[t0:t1], np.diff(chunk.post_ptr[t0:t1 + 1]),
+                self.doc_map[chunk.doc_nums[lo:hi]], chunk.tfs[lo:hi],
+                np.diff(chunk.pos_ptr[lo:hi + 1]), chunk.positions[p0:p1])
+
+
+def _merge_parts(parts):
+    """PositionalIndex of the union of take() results (disjoint docs),
+    dropped postings removed and each posting list sorted by doc"""
+    terms = sorted(set().union(*(part[0] for part in parts)))
+    term_num = {term: i for i, term in enumerate(terms)}
+    keys, docs, tfs, npos, positions = [], [], [], [], []
+    for part_terms, df, doc_nums, part_tfs, part_npos, part_positions in parts:
+        ids = np.array([term_num[term] for term in part_terms], dtype=np.int64)
+        keep = doc_nums >= 0
+        keys.append(np.repeat(ids, df)[keep])
+        docs.append(doc_nums[keep])
+        tfs.append(part_tfs[keep])
+        npos.append(part_npos[keep])
+        positions.append(part_positions[np.repeat(keep, part_npos)])
+    keys, docs, tfs, npos, positions = (np.concatenate(col) for col in
+                                        (keys, docs, tfs, npos, positions))
+    order = np.lexsort((docs, keys))
+    counts = np.bincount(keys, minlength=len(terms))
+    npos, gather = reorder_runs(npos, order)
+    return PositionalIndex([term for term, n in zip(terms, counts) if n],
+                           _offsets(counts[counts > 0]), docs[order].astype(np.int32),
+                           tfs[order].astype(np.int32), _offsets(npos),
+                           positions[gather].astype(np.int32))
+
+
+def merge_postings(readers, doc_maps, path, num_docs, buffer_bytes=16 << 20):
+    """K-way merge of term-sorted postings files into one postings file.
+
+    doc_maps[i][d] is the output doc number of doc d of readers[i], or -1
+    to drop it (e.g. a tombstoned doc). Output doc numbers may reorder docs
+    freely; each merged posting list is re-sorted. Every input is read
+    sequentially, in runs sized so that all decoded runs together take
+    about buffer_bytes; each round merges all terms up to the smallest
+    last term decoded by any input, so only those runs are held in memory.
+    """
+    chunk_bytes = max(MIN_MERGE_RUN, buffer_bytes // (DECODED_GROWTH * max(len(readers), 1)))
+    cursors = [_MergeCursor(reader, doc_map, chunk_bytes)
+               for reader, doc_map in zip(readers, doc_maps)]
+    full_positions = all(reader.full_positions for reader in readers)
+    with PostingsWriter(path, num_docs, full_positions) as writer:
+        while True:
+            cursors = [cursor for cursor in cursors if cursor.fill()]
+            if not cursors:
+                break
+            bound = min(cursor.last_term for cursor in cursors)
+            writer.add(_merge_parts([cursor.take(bound) for cursor in cursors]))
+    return Path(path).stat().st_size
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Query-time TF-IDF vectorizer for CS-429 IR Project
+Reproduces a fitted TfidfVectorizer's transform() from the exported vocabulary,
+idf and stop words, without importing scikit-learn, plus a compiled analyzer
+for single queries
+"""
+
+import math
+import re
+import numpy as np
+from scipy import sparse
+
+# TfidfVectorizer defaults for the parameters the indexer does not set
+TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+DEFAULTS = dict(lowercase=True, token_pattern=TOKEN_PATTERN, ngram_range=(1, 1), norm='l2')
+# Only used when fitting; the exported vocabulary and idf already reflect them
+FIT_PARAMS = ('max_features', 'min_df', 'max_df', 'stop_words', 'use_idf', 'smooth_idf')
+
+
+class QueryVectorizer:
+    """The transform() half of a fitted TfidfVectorizer (word analyzer).
+
+    Same tokenization (token_pattern on the lowercased text), stop-word
+    removal, word n-grams, raw counts times idf and L2 row normalization,
+    performed in the same order, so the output is bit-identical.
+    """
+
+    def __init__(self, vocabulary, idf, stop_words=(), lowercase=True,
+                 token_pattern=TOKEN_PATTERN, ngram_range=(1, 1), norm='l2'):
+        self.vocabulary_ = vocabulary
+        self.idf_ = idf
+        self.stop_words = frozenset(stop_words)
+        self.lowercase = lowercase
+        self.token_pattern = token_pattern
+        self.token_re = re.compile(token_pattern)
+        self.ngram_range = tuple(ngram_range)
+        self.norm = norm
+
+    @classmethod
+    def from_params(cls, vocabulary, idf, stop_words, params):
+        """Build from the indexer's TfidfVectorizer params; ValueError if
+        they use an option this class does not reproduce"""
+        kwargs = dict(DEFAULTS)
+        for key, value in params.items():
+            if key in FIT_PARAMS:
+                continue
+            if key not in DEFAULTS:
+                raise ValueError(f"unsupported vectorizer parameter '{key}'")
+            kwargs[key] = value
+        if kwargs['norm'] not in ('l2', None) or not params.get('use_idf', True) \
+                or params.get('sublinear_tf'):
+            raise ValueError("only raw tf times idf with norm='l2' or None is supported")
+        return cls(vocabulary, idf, stop_words, **kwargs)
+
+    def get_stop_words(self):
+        return self.stop_words
+
+    def analyze(self, doc):
+        """Features of one document: unigrams, then bigrams, ... (as
+        TfidfVectorizer's word analyzer)"""
+        if self.lowercase:
+            doc = doc.lower()
+        tokens = [t for t in self.token_re.findall(doc) if t not in self.stop_words]
+        min_n, max_n = self.ngram_range
+        if max_n == 1:
+            return tokens
+        features = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(max_n, len(tokens)) + 1):
+            features.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return features
+
+    def transform(self, raw_documents):
+        """(n_docs x n_features) CSR matrix, indices sorted per row"""
+        vocabulary, idf = self.vocabulary_, self.idf_
+        indices, data, indptr = [], [], [0]
+        for doc in raw_documents:
+            counts = {}
+            for feature in self.analyze(doc):
+                col = vocabulary.get(feature)
+                if col is not None:
+                    counts[col] = counts.get(col, 0) + 1
+            cols = sorted(counts)
+            weights = [counts[col] * float(idf[col]) for col in cols]
+            if self.norm == 'l2':
+                # Summed left to right, like sklearn's row normalization
+                total = 0.0
+                for w in weights:
+                    total += w * w
+                if total != 0.0:
+                    total = math.sqrt(total)
+                    weights = [w / total for w in weights]
+            indices.extend(cols)
+            data.extend(weights)
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32),
+             np.array(indptr, dtype=np.int32)),
+            shape=(len(indptr) - 1, len(vocabulary)))
+
+
+class QueryVector:
+    """One query's TF-IDF weights: the parts of a 1 x n_features CSR row
+    that the query engines read (indices sorted)"""
+
+    __slots__ = ('indices', 'data', 'shape')
+
+    def __init__(self, indices, data, n_features):
+        self.indices = indices
+        self.data = data
+        self.shape = (1, n_features)
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    def toarray(self):
+        out = np.zeros(self.shape)
+        out[0, self.indices] = self.data
+        return out
+
+    def tocsr(self):
+        indptr = np.array([0, len(self.indices)], dtype=np.int32)
+        return sparse.csr_matrix((self.data, self.indices, indptr), shape=self.shape)
+
+
+class QueryAnalyzer:
+    """Single-query transform of a fitted vectorizer, compiled to one table.
+
+    Every vocabulary feature maps straight to its (column, idf): unigrams
+    by token, n-grams by token tuple, so no n-gram string is built. The
+    tokenization, counts and L2 normalization are QueryVectorizer's, in
+    the same order, so the weights are bit-identical to transform()'s.
+    Vectorizers with options it does not reproduce keep using transform().
+    """
+
+    def __init__(self, vectorizer):
+        self.vectorizer = vectorizer
+        self.n_features = len(vectorizer.vocabulary_)
+        self.table = self._compile(vectorizer)
+        if self.table is not None:
+            self.lowercase = vectorizer.lowercase
+            self.token_re = re.compile(vectorizer.token_pattern)
+            self.stop_words = frozenset(vectorizer.get_stop_words() or ())
+            self.ngram_range = tuple(vectorizer.ngram_range)
+            self.norm = vectorizer.norm
+
+    @staticmethod
+    def _compile(vectorizer):
+        """feature -> (column, idf), or None if vectorizer can't be compiled"""
+        unsupported = (getattr(vectorizer, 'analyzer', 'word') != 'word'
+                       or getattr(vectorizer, 'tokenizer', None) is not None
+                       or getattr(vectorizer, 'preprocessor', None) is not None
+                       or getattr(vectorizer, 'strip_accents', None) is not None
+                       or getattr(vectorizer, 'binary', False)
+                       or getattr(vectorizer, 'sublinear_tf', False)
+                       or not getattr(vectorizer, 'use_idf', True)
+                       or vectorizer.norm not in ('l2', None))
+        if unsupported:
+            return None
+        token_re = re.compile(vectorizer.token_pattern)
+        min_n, max_n = vectorizer.ngram_range
+        idf = np.asarray(vectorizer.idf_, dtype=np.float64).tolist()
+        table = {}
+        for feature, col in vectorizer.vocabulary_.items():
+            tokens = feature.split(" ")
+            # A token containing a space would make the split ambiguous
+            if not min_n <= len(tokens) <= max_n \
+                    or not all(token_re.fullmatch(token) for token in tokens):
+                return None
+            table[tokens[0] if len(tokens) == 1 else tuple(tokens)] = (col, idf[col])
+        return table
+
+    def vector(self, text):
+        """QueryVector of text (a 1-row CSR matrix if not compiled)"""
+        if self.table is None:
+            return self.vectorizer.transform([text])
+        table, stop_words = self.table, self.stop_words
+        if self.lowercase:
+            text = text.lower()
+        tokens = [t for t in self.token_re.findall(text) if t not in stop_words]
+        min_n, max_n = self.ngram_range
+        counts = {}
+        if min_n == 1:
+            for token in tokens:
+                hit = table.get(token)
+                if hit is not None:
+                    counts[hit] = counts.get(hit, 0) + 1
+        for n in range(max(min_n, 2), min(max_n, len(tokens)) + 1):
+            for gram in zip(*[tokens[i:] for i in range(n)]):
+                hit = table.get(gram)
+                if hit is not None:
+                    counts[hit] = counts.get(hit, 0) + 1
+        # Sorted by column, like transform()'s output
+        hits = sorted(counts.items())
+        weights = [count * idf for (_, idf), count in hits]
+        if self.norm == 'l2':
+            total = 0.0
+            for w in weights:
+                total += w * w
+            if total != 0.0:
+                total = math.sqrt(total)
+                weights = [w / total for w in weights]
+        return QueryVector(np.array([col for (col, _), _ in hits], dtype=np.int32),
+                           np.array(weights, dtype=np.float64), self.n_features)
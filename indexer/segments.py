@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Segment store for incremental indexing (CS-429 IR Project)
+Each update writes a small immutable segment; replaced or deleted docs are
+masked with a per-segment tombstone bitmap until a merge compacts them
+"""
+
+from array import array
+from bisect import bisect_left
+import json
+from numbers import Integral
+import os
+from pathlib import Path
+import shutil
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfTransformer, TfidfVectorizer
+
+from postings import (PositionalIndex, PostingsReader, merge_postings,
+                      reorder_runs, write_postings_file, write_segmented_postings)
+
+MANIFEST = "manifest.json"
+# Store-wide sorted feature list, and each segment's local -> global ids
+FEATURES = "features.txt"
+FEATURE_IDS = "feature_ids.npz"
+
+
+def _write_json(path, obj):
+    """Write JSON atomically (readers never see a half-written file)"""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+class FeatureCounter:
+    """Per-doc feature counts as CSR (terms, indptr, indices, data).
+
+    Row entries keep the order in which each feature first occurs in the
+    doc, which is what CountVectorizer does before sorting its columns.
+    """
+
+    TERM_OVERHEAD = 120
+
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        self.terms = {}
+        self.indptr, self.indices, self.data = array('q', [0]), array('i'), array('i')
+
+    def add(self, text):
+        counter = {}
+        for feature in self.analyzer(text):
+            counter[feature] = counter.get(feature, 0) + 1
+        terms = self.terms
+        for feature, count in counter.items():
+            self.indices.append(terms.setdefault(feature, len(terms)))
+            self.data.append(count)
+        self.indptr.append(len(self.indices))
+
+    @property
+    def nbytes(self):
+        return 8 * len(self.indices) + 8 * len(self.indptr) + self.TERM_OVERHEAD * len(self.terms)
+
+    def finish(self):
+        return (list(self.terms), np.frombuffer(self.indptr, dtype=np.int64),
+                np.frombuffer(self.indices, dtype=np.int32), np.frombuffer(self.data, dtype=np.int32))
+
+
+def count_features(texts, analyzer):
+    """FeatureCounter over a list of texts"""
+    counter = FeatureCounter(analyzer)
+    for text in texts:
+        counter.add(text)
+    return counter.finish()
+
+
+def select_features(dfs, tfs, n_doc, vectorizer):
+    """Keep-mask over a sorted vocabulary, as CountVectorizer._limit_features.
+
+    dfs (int64) and tfs (float64 corpus term counts) are per-feature arrays.
+    """
+    max_df, min_df = vectorizer.max_df, vectorizer.min_df
+    high = max_df if isinstance(max_df, Integral) else max_df * n_doc
+    low = min_df if isinstance(min_df, Integral) else min_df * n_doc
+    mask = (dfs <= high) & (dfs >= low)
+    limit = vectorizer.max_features
+    if limit is not None and mask.sum() > limit:
+        mask_inds = (-tfs[mask]).argsort()[:limit]
+        new_mask = np.zeros(len(dfs), dtype=bool)
+        new_mask[np.where(mask)[0][mask_inds]] = True
+        mask = new_mask
+    if not mask.any():
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+    return mask
+
+
+def fit_tfidf(terms, indptr, indices, data, params):
+    """Fit a TfidfVectorizer from precomputed counts.
+
+    terms must be sorted and indices must index it (terms no row uses are
+    ignored); rows are in corpus order with entries in first-occurrence
+    order. Reproduces TfidfVectorizer(**params).fit_transform(corpus)
+    exactly: the same max_df/min_df/max_features pruning, the same feature
+    numbering, the same per-row entry order and therefore bit-identical
+    weights.
+    """
+    vectorizer = TfidfVectorizer(**params)
+    n_doc, nnz = len(indptr) - 1, len(indices)
+
+    # Columns over the features actually present, in sorted order
+    dfs = np.bincount(indices, minlength=len(terms))
+    present = np.flatnonzero(dfs)
+    col = (np.cumsum(dfs > 0) - 1)[indices]
+    first_seen = np.full(len(present), nnz, dtype=np.int64)
+    np.minimum.at(first_seen, col, np.arange(nnz))
+    seen_rank = np.empty(len(present), dtype=np.int64)
+    seen_rank[np.argsort(first_seen)] = np.arange(len(present))
+
+    mask = select_features(dfs[present], np.bincount(col, weights=data, minlength=len(present)),
+                           n_doc, vectorizer)
+    new_index = np.cumsum(mask) - 1
+
+    # Rows sorted by first-seen feature number (CountVectorizer sorts its
+    # indices before renumbering), then restricted to kept features. A row
+    # holds each feature once, so (row, rank) keys are unique
+    row = np.repeat(np.arange(n_doc, dtype=np.int64), np.diff(indptr))
+    kept_entries = np.flatnonzero(mask[col])
+    order = kept_entries[np.argsort(row[kept_entries] * len(present)
+                                    + seen_rank[col[kept_entries]])]
+    X = sparse.csr_matrix(
+        (data[order].astype(np.float64),
+         new_index[col[order]].astype(np.int32),
+         np.concatenate(([0], np.cumsum(np.bincount(row[order], minlength=n_doc)))).astype(np.int32)),
+        shape=(n_doc, int(mask.sum())))
+
+    transformer = TfidfTransformer(norm=vectorizer.norm, use_idf=vectorizer.use_idf,
+                                   smooth_idf=vectorizer.smooth_idf,
+                                   sublinear_tf=vectorizer.sublinear_tf)
+    transformer.fit(X)
+    tfidf_matrix = transformer.transform(X, copy=False)
+
+    kept = np.flatnonzero(mask)
+    vectorizer.vocabulary_ = {terms[present[i]]: new_index[i] for i in kept}
+    vectorizer.idf_ = transformer.idf_
+    return vectorizer, tfidf_matrix
+
+
+class Segment:
+    """One immutable batch of documents plus its tombstone bitmap"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.name = self.path.name
+        self._docs = None
+        self.num_docs = len(self.docs)
+        tombstones = self.path / "tombstones.npy"
+        if tombstones.exists():
+            bits = np.unpackbits(np.load(tombstones), count=self.num_docs)
+            self.deleted = bits.astype(bool)
+        else:
+            self.deleted = np.zeros(self.num_docs, dtype=bool)
+
+    @classmethod
+    def create(cls, path, docs, counts):
+        """Write a segment; path/postings.bin must already be in place.
+
+        docs.json is written last, so a crashed write leaves no loadable segment.
+        """
+        terms, indptr, indices, data = counts
+        np.savez(path / "counts.npz", indptr=indptr, indices=indices, data=data)
+        with open(path / "terms.json", 'w') as f:
+            json.dump(terms, f)
+        _write_json(path / "docs.json", docs)
+        return cls(path)
+
+    @property
+    def docs(self):
+        """[{doc_id, url, title, length, mtime_ns, size}], loaded on first use"""
+        if self._docs is None:
+            with open(self.path / "docs.json", 'r') as f:
+                self._docs = json.load(f)
+        return self._docs
+
+    def drop_docs(self):
+        """Release the cached doc list (it is re-read on next use)"""
+        self._docs = None
+
+    @property
+    def live_count(self):
+        return self.num_docs - int(self.deleted.sum())
+
+    def save_tombstones(self):
+        tmp = self.path / "tombstones.tmp.npy"
+        np.save(tmp, np.packbits(self.deleted))
+        os.replace(tmp, self.path / "tombstones.npy")
+
+    def counts(self):
+        """(terms, indptr, indices, data) with segment-local term numbers"""
+        with open(self.path / "terms.json", 'r') as f:
+            terms = json.load(f)
+        return (terms, *self.count_arrays())
+
+    def count_arrays(self):
+        """(indptr, indices, data) of counts(), without loading the terms"""
+        with np.load(self.path / "counts.npz") as z:
+            return z['indptr'], z['indices'], z['data']
+
+    def postings(self):
+        return PostingsReader(self.path / "postings.bin")
+
+
+class SegmentStore:
+    """Ordered list of segments recorded in segments/manifest.json"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.next_segment = 0
+        self.segments = []
+        self.published = False  # index files reflect the current segments
+        self._features = self._feature_ids = None  # loaded on first use
+        manifest = self.root / MANIFEST
+        if manifest.exists():
+            with open(manifest, 'r') as f:
+                state = json.load(f)
+            self.next_segment = state['next_segment']
+            self.published = state['published']
+            self.segments = [Segment(self.root / name) for name in state['segments']]
+
+    def save(self, published=False):
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.published = published
+        _write_json(self.root / MANIFEST, {
+            'next_segment': self.next_segment,
+            'segments': [seg.name for seg in self.segments],
+            'published': published,
+        })
+
+    def _new_path(self):
+        path = self.root / f"seg_{self.next_segment:06d}"
+        self.next_segment += 1
+        return path
+
+    def live_docs(self):
+        """doc_id -> (segment number, row) for every non-deleted doc"""
+        live = {}
+        for s, seg in enumerate(self.segments):
+            for row in np.flatnonzero(~seg.deleted):
+                live[seg.docs[row]['doc_id']] = (s, int(row))
+        return live
+
+    def live_rows(self):
+        """(doc_id, (segment number, row)) of every live doc, in build()'s
+        doc order (sorted by file name)"""
+        return sorted(self.live_docs().items(), key=lambda item: item[0] + ".html")
+
+    def delete(self, doc_ids):
+        """Tombstone the live copies of doc_ids"""
+        live = self.live_docs()
+        touched = set()
+        for doc_id in doc_ids:
+            if doc_id in live:
+                s, row = live[doc_id]
+                self.segments[s].deleted[row] = True
+                touched.add(s)
+        for s in touched:
+            self.segments[s].save_tombstones()
+        if touched:
+            self.save()
+
+    def add(self, docs, texts, analyzer, max_positions=None):
+        """Write docs (metadata dicts) and their cleaned texts as a new
+        segment, and add its features to the feature table"""
+        index = PositionalIndex.build((text.split() for text in texts), max_positions=max_positions)
+        counts = count_features(texts, analyzer)
+        self._load_features()  # before the new segment is listed
+        seg = self.add_built(docs, index, counts)
+        self._insert_features(seg.name, counts[0])
+        return seg
+
+    def add_built(self, docs, index, counts):
+        """Write an already built PositionalIndex and feature counts as a new segment"""
+        path = self._new_path()
+        path.mkdir(parents=True)
+        write_postings_file(index, path / "postings.bin", len(docs))
+        seg = Segment.create(path, docs, counts)
+        self.segments.append(seg)
+        self.save()
+        return seg
+
+    def merge(self):
+        """Compact all segments into one, dropping tombstoned docs; the
+        merged segment keeps build()'s doc order.
+
+        The old segment directories stay on disk, since the published
+        postings.bin still points into them; remove_unlisted() deletes
+        them once an index built from the merged segment is published.
+        """
+        old = self.segments
+        path = self._new_path()
+        rows = [loc for _, loc in self.live_rows()]
+        docs = [old[s].docs[row] for s, row in rows]
+        features, indptr, indices, data = self.live_counts(rows)
+        # Local term numbers of the merged segment follow the sorted features
+        used = np.unique(indices)
+        counts = ([features[g] for g in used], indptr,
+                  np.searchsorted(used, indices).astype(np.int32), data)
+
+        path.mkdir(parents=True)
+        readers = [seg.postings() for seg in old]
+        try:
+            merge_postings(readers, self._doc_maps(rows), path / "postings.bin", len(docs))
+        finally:
+            for reader in readers:
+                reader.close()
+        merged = Segment.create(path, docs, counts)
+
+        self.segments = [merged]
+        self.save()
+        self._features = counts[0]
+        self._feature_ids = {merged.name: np.arange(len(used), dtype=np.int64)}
+        self._save_features()
+        return merged
+
+    def remove_unlisted(self):
+        """Delete segment directories the manifest no longer lists (merged
+        away, or left behind by an interrupted update)"""
+        listed = {seg.name for seg in self.segments}
+        for path in sorted(self.root.glob("seg_*")):
+            if path.is_dir() and path.name not in listed:
+                shutil.rmtree(path)
+
+    def _doc_maps(self, rows):
+        """Per segment, the position of each row in rows (-1 if absent)"""
+        doc_maps = [np.full(seg.num_docs, -1, dtype=np.int64) for seg in self.segments]
+        for doc_num, (s, row) in enumerate(rows):
+            doc_maps[s][row] = doc_num
+        return doc_maps
+
+    # -- feature table -----------------------------------------------------
+    #
+    # features.txt lists every feature of every segment in sorted order, and
+    # feature_ids.npz maps each segment's local term numbers into it, so
+    # global counts are assembled with array indexing instead of per-term
+    # dict lookups. An update inserts only the new segment's unseen terms.
+
+    def _load_features(self):
+        if self._features is not None:
+            return
+        try:
+            with open(self.root / FEATURES, 'r', encoding='utf-8') as f:
+                features = f.read().split('\n')[:-1]
+            with np.load(self.root / FEATURE_IDS) as z:
+                ids = {name: z[name] for name in z.files}
+            valid = int(ids.pop('num_features')) == len(features) \
+                and all(seg.name in ids for seg in self.segments)
+        except (OSError, KeyError, ValueError):
+            valid = False
+        if valid:
+            self._features = features
+            self._feature_ids = {seg.name: ids[seg.name] for seg in self.segments}
+        else:
+            self._rebuild_features()
+
+    def _rebuild_features(self):
+        """Feature table from every segment's terms.json"""
+        seg_terms = []
+        for seg in self.segments:
+            with open(seg.path / "terms.json", 'r') as f:
+                seg_terms.append(json.load(f))
+        features = sorted(set().union(*seg_terms))
+        ids = {term: i for i, term in enumerate(features)}
+        self._features = features
+        self._feature_ids = {seg.name: np.array([ids[t] for t in terms], dtype=np.int64)
+                             for seg, terms in zip(self.segments, seg_terms)}
+        self._save_features()
+
+    def _insert_features(self, name, terms):
+        """Add a new segment's local terms to the feature table"""
+        self._load_features()
+        if name in self._feature_ids:  # rebuilt from disk, already included
+            return
+        features = self._features
+        order = sorted(range(len(terms)), key=terms.__getitem__)
+        pos = np.array([bisect_left(features, terms[i]) for i in order], dtype=np.int64)
+        found = np.array([p < len(features) and features[p] == terms[i]
+                          for p, i in zip(pos.tolist(), order)], dtype=bool)
+        # Unseen terms go in at their insertion points; later ids shift up
+        new_pos = pos[~found]
+
+        def shift(ids):
+            return ids + np.searchsorted(new_pos, ids, side='right')
+
+        for seg_name, ids in self._feature_ids.items():
+            self._feature_ids[seg_name] = shift(ids)
+        order = np.asarray(order, dtype=np.int64)
+        local_ids = np.empty(len(terms), dtype=np.int64)
+        local_ids[order[found]] = shift(pos[found])
+        local_ids[order[~found]] = new_pos + np.arange(len(new_pos))
+        self._feature_ids[name] = local_ids
+
+        merged, prev = [], 0
+        new_terms = [terms[i] for i in order[~found].tolist()]
+        for p, term in zip(new_pos.tolist(), new_terms):
+            merged.extend(features[prev:p])
+            merged.append(term)
+            prev = p
+        merged.extend(features[prev:])
+        self._features = merged
+        self._save_features()
+
+    def _save_features(self):
+        """Write the table; features.txt first, and feature_ids.npz records
+        its length, so a half-written pair is detected and rebuilt"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / (FEATURES + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            if self._features:
+                f.write('\n'.join(self._features) + '\n')
+        os.replace(tmp, self.root / FEATURES)
+        tmp = self.root / "feature_ids.tmp.npz"
+        np.savez(tmp, num_features=len(self._features), **self._feature_ids)
+        os.replace(tmp, self.root / FEATURE_IDS)
+
+    def live_counts(self, rows):
+        """Counts for (segment, row) pairs, in that order, over the sorted
+        feature table: (features, indptr, indices, data)"""
+        self._load_features()
+        base = np.zeros(len(self.segments) + 1, dtype=np.int64)
+        lengths, indices, data = [], [], []
+        for s, seg in enumerate(self.segments):
+            seg_ptr, seg_ind, seg_data = seg.count_arrays()
+            lengths.append(np.diff(seg_ptr))
+            indices.append(self._feature_ids[seg.name][seg_ind])
+            data.append(seg_data)
+            base[s + 1] = base[s] + len(seg_ptr) - 1
+
+        order = np.array([base[s] + row for s, row in rows], dtype=np.int64)
+        lengths, gather = reorder_runs(np.concatenate(lengths), order)
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        return (self._features, indptr, np.concatenate(indices)[gather],
+                np.concatenate(data)[gather])
+
+    def write_postings(self, rows, path):
+        """Publish every segment's postings as one index at path, numbering
+        docs as in rows; the segment files are referenced, not rewritten"""
+        return write_segmented_postings(
+            path, [seg.path / "postings.bin" for seg in self.segments],
+            self._doc_maps(rows), len(rows))
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Out-of-core (SPIMI) index construction for CS-429 IR Project
+Documents are streamed into in-memory blocks that are flushed to disk
+whenever a memory budget is reached; the blocks are then k-way merged
+into the same index files the in-memory build writes
+"""
+
+from bisect import bisect_right
+from itertools import islice
+import json
+from pathlib import Path
+import shutil
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfTransformer, TfidfVectorizer
+
+from postings import PositionalIndexBuilder, PostingsReader, index_sample, merge_postings
+from segments import FeatureCounter, SegmentStore, select_features
+from tfidf_store import CsrWriter, write_meta, write_term_major, write_vocab
+
+# Rough cost of one buffered vocabulary line, for sizing merge runs
+TERM_BYTES = 100
+
+
+class SpimiBuilder:
+    """Streams documents into on-disk blocks under a memory budget.
+
+    Each block is a segment (see segments.py) plus its vocabulary sorted by
+    term with per-term df/tf, which the final merge reads sequentially.
+    """
+
+    DOC_OVERHEAD = 200  # bytes per buffered metadata dict, roughly
+
+    def __init__(self, work_dir, memory_budget, analyzer, max_positions=None):
+        shutil.rmtree(work_dir, ignore_errors=True)
+        self.store = SegmentStore(work_dir)
+        self.memory_budget = memory_budget
+        self.analyzer = analyzer
+        self.max_positions = max_positions
+        self._reset()
+
+    def _reset(self):
+        self.postings = PositionalIndexBuilder(self.max_positions)
+        self.counts = FeatureCounter(self.analyzer)
+        self.docs = []
+        self.doc_bytes = 0
+
+    @property
+    def nbytes(self):
+        return self.postings.nbytes + self.counts.nbytes + self.doc_bytes
+
+    def add(self, doc_id, url, title, cleaned_text):
+        tokens = cleaned_text.split()
+        self.postings.add(tokens)
+        self.counts.add(cleaned_text)
+        self.docs.append({'doc_id': doc_id, 'url': url, 'title': title, 'length': len(tokens)})
+        self.doc_bytes += self.DOC_OVERHEAD + len(url) + len(title)
+        if self.nbytes >= self.memory_budget:
+            self.flush()
+
+    def flush(self):
+        """Write the current block to disk and start an empty one"""
+        if not self.docs:
+            return
+        counts = self.counts.finish()
+        seg = self.store.add_built(self.docs, self.postings.finish(), counts)
+
+        terms, _, indices, data = counts
+        order = sorted(range(len(terms)), key=terms.__getitem__)
+        with open(seg.path / "vocab_sorted.txt", 'w', encoding='utf-8') as f:
+            f.writelines(terms[i] + '\n' for i in order)
+        np.save(seg.path / "vocab_local.npy", np.asarray(order, dtype=np.int64))
+        np.save(seg.path / "vocab_df.npy", np.bincount(indices, minlength=len(terms))[order])
+        np.save(seg.path / "vocab_tf.npy", np.bincount(indices, weights=data, minlength=len(terms))[order])
+        seg.drop_docs()
+        self._reset()
+
+    def finish(self):
+        self.flush()
+        return self.store
+
+
+class _VocabCursor:
+    """Walks one block's sorted vocabulary (and per-term df / tf / first-seen
+    number) in runs of run_terms lines, recording each term's global id"""
+
+    def __init__(self, seg, b, run_terms):
+        self.b = b
+        self.run_terms = run_terms
+        self._f = open(seg.path / "vocab_sorted.txt", 'r', encoding='utf-8')
+        self._local = np.load(seg.path / "vocab_local.npy", mmap_mode='r')
+        self._df = np.load(seg.path / "vocab_df.npy", mmap_mode='r')
+        self._tf = np.load(seg.path / "vocab_tf.npy", mmap_mode='r')
+        self._gids = np.lib.format.open_memmap(seg.path / "vocab_gid.npy", mode='w+',
+                                               dtype=np.int64, shape=(len(self._local),))
+        self.start = 0  # rank of terms[0] in the block vocabulary
+        self.terms, self.taken = [], 0
+
+    def fill(self):
+        """Read the next run once the current one is used up; False at the end"""
+        if self.taken < len(self.terms):
+            return True
+        if self.terms:
+            self._gids[self.start:self.start + len(self.terms)] = self.gids
+        self.start += len(self.terms)
+        self.terms, self.taken = [line[:-1] for line in islice(self._f, self.run_terms)], 0
+        if not self.terms:
+            self._f.close()
+            self._gids.flush()
+            return False
+        end = self.start + len(self.terms)
+        # Plain copies: slicing the memory maps on every round is slow
+        self.local, self.df, self.tf = (np.array(arr[self.start:end])
+                                        for arr in (self._local, self._df, self._tf))
+        self.gids = np.empty(len(self.terms), dtype=np.int64)
+        return True
+
+    def take(self, bound):
+        """(terms, first, end) of the remaining run up to bound; first and
+        end index the run"""
+        i, j = self.taken, bisect_right(self.terms, bound, lo=self.taken)
+        self.taken = j
+        return self.terms[i:j], i, j
+
+
+def _merge_vocabularies(segments, out_path, run_terms):
+    """Merge the blocks' sorted vocabularies into out_path (one term per
+    line) and fill each block's vocab_gid.npy.
+
+    Returns the global (df, corpus tf, first-seen key) arrays; the key of a
+    term is (block << 32 | local first-seen number) in the earliest block
+    that has it. Each round merges the terms up to the smallest last term
+    read from any block, with NumPy scatters per block.
+    """
+    cursors = [_VocabCursor(seg, b, run_terms) for b, seg in enumerate(segments)]
+    dfs, tfs, first_seen = [], [], []
+    next_gid = 0
+    with open(out_path, 'w', encoding='utf-8') as out:
+        while True:
+            cursors = [cursor for cursor in cursors if cursor.fill()]
+            if not cursors:
+                break
+            bound = min(cursor.terms[-1] for cursor in cursors)
+            runs = [(cursor, *cursor.take(bound)) for cursor in cursors]
+            terms = sorted(set().union(*(run[1] for run in runs)))
+            term_num = {term: i for i, term in enumerate(terms)}
+            df = np.zeros(len(terms), dtype=np.int64)
+            tf = np.zeros(len(terms))
+            first = np.full(len(terms), np.iinfo(np.int64).max)
+            # Blocks in order, so tf sums in the same order as a per-term loop
+            for cursor, block_terms, i, j in runs:
+                ids = np.array([term_num[term] for term in block_terms], dtype=np.int64)
+                cursor.gids[i:j] = next_gid + ids
+                df[ids] += cursor.df[i:j]
+                tf[ids] += cursor.tf[i:j]
+                first[ids] = np.minimum(first[ids], (cursor.b << 32) | cursor.local[i:j])
+            dfs.append(df)
+            tfs.append(tf)
+            first_seen.append(first)
+            out.writelines(term + '\n' for term in terms)
+            next_gid += len(terms)
+    empty = [np.empty(0, dtype=np.int64)]
+    return (np.concatenate(dfs or empty), np.concatenate(tfs or [np.empty(0)]),
+            np.concatenate(first_seen or empty))
+
+
+def _smooth_idf(dfs, n_doc, transformer):
+    """idf_ exactly as TfidfTransformer.fit computes it, from df counts"""
+    df = dfs.astype(np.float64)
+    n_samples = n_doc
+    df += int(transformer.smooth_idf)
+    n_samples += int(transformer.smooth_idf)
+    idf = np.full_like(df, fill_value=n_samples, dtype=np.float64)
+    idf /= df
+    np.log(idf, out=idf)
+    idf += 1.0
+    return idf
+
+
+def _write_json_lines(path, open_char, close_char, items):
+    """Stream a JSON list/object formatted like json.dump(..., indent=2)"""
+    with open(path, 'w') as f:
+        f.write(open_char)
+        first = True
+        for item in items:
+            f.write(('\n' if first else ',\n') + '  ' + item.replace('\n', '\n  '))
+            first = False
+        f.write(('\n' if not first else '') + close_char)
+
+
+def publish_blocks(store, output_dir, params, buffer_bytes=16 << 20):
+    """K-way merge SPIMI blocks into the published index files.
+
+    Writes postings.bin, the tfidf_* files, doc_ids.json, doc_metadata.json
+    and index.json byte-for-byte as SearchIndexer.save_index would for the
+    same corpus. Memory is bounded by one block, per-term statistics (three
+    numbers per distinct term) and about buffer_bytes of merge input read
+    ahead from the blocks' postings and vocabularies; no per-document state
+    is kept.
+    """
+    output_dir = Path(output_dir)
+    work_dir = store.root
+    segments = store.segments
+    sizes = [seg.num_docs for seg in segments]
+    bases = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+    n_doc = int(bases[-1])
+
+    # 1. Positional postings: blocks cover consecutive doc ranges
+    readers = [seg.postings() for seg in segments]
+    try:
+        merge_postings(readers, [bases[b] + np.arange(n) for b, n in enumerate(sizes)],
+                       output_dir / "postings.bin", n_doc, buffer_bytes)
+    finally:
+        for reader in readers:
+            reader.close()
+
+    # 2. Merge the sorted block vocabularies into global df/tf/first-seen arrays
+    run_terms = max(1024, buffer_bytes // (TERM_BYTES * max(len(segments), 1)))
+    dfs, tfs, first_seen = _merge_vocabularies(segments, work_dir / "terms_sorted.txt", run_terms)
+    seen_rank = np.empty(len(dfs), dtype=np.int64)
+    seen_rank[np.argsort(first_seen)] = np.arange(len(dfs))
+    del first_seen
+
+    # 3. Feature selection and idf, as TfidfVectorizer.fit would do
+    vectorizer = TfidfVectorizer(**params)
+    mask = select_features(dfs, tfs, n_doc, vectorizer)
+    new_index = np.cumsum(mask) - 1
+    num_features = int(mask.sum())
+    transformer = TfidfTransformer(norm=vectorizer.norm, use_idf=vectorizer.use_idf,
+                                   smooth_idf=vectorizer.smooth_idf,
+                                   sublinear_tf=vectorizer.sublinear_tf)
+    transformer.idf_ = _smooth_idf(dfs[mask], n_doc, transformer)
+
+    # 4. Weight each block's rows and append them to the CSR files
+    def block_rows(seg):
+        indptr, indices, data = seg.count_arrays()
+        local = np.load(seg.path / "vocab_local.npy")
+        gid_of = np.empty(len(local), dtype=np.int64)
+        gid_of[local] = np.load(seg.path / "vocab_gid.npy")
+        cols = gid_of[indices]
+        row = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        return row, cols, data
+
+    nnz = 0
+    for seg in segments:
+        _, cols, _ = block_rows(seg)
+        nnz += int(np.count_nonzero(mask[cols]))
+    writer = CsrWriter(output_dir, (n_doc, num_features), nnz)
+    for b, seg in enumerate(segments):
+        row, cols, data = block_rows(seg)
+        order = np.lexsort((seen_rank[cols], row))
+        order = order[mask[cols[order]]]
+        X = sparse.csr_matrix(
+            (data[order].astype(np.float64),
+             new_index[cols[order]].astype(np.int32),
+             np.concatenate(([0], np.cumsum(np.bincount(row[order], minlength=sizes[b]))))),
+            shape=(sizes[b], num_features))
+        writer.append(transformer.transform(X, copy=False))
+    writer.close()
+
+    np.save(output_dir / "tfidf_idf.npy", transformer.idf_)
+    with open(work_dir / "terms_sorted.txt", 'r', encoding='utf-8') as f:
+        write_vocab(output_dir, (line[:-1] for line, keep in zip(f, mask) if keep))
+    write_meta(output_dir, (n_doc, num_features), nnz, params)
+    write_term_major(output_dir)
+
+    # 5. Doc files, streamed one block at a time
+    def doc_entries(fmt):
+        for seg in segments:
+            yield from map(fmt, seg.docs)
+            seg.drop_docs()
+    _write_json_lines(output_dir / "doc_ids.json", '[', ']',
+                      doc_entries(lambda doc: json.dumps(doc['doc_id'])))
+    _write_json_lines(output_dir / "doc_metadata.json", '{', '}', doc_entries(
+        lambda doc: json.dumps(doc['doc_id']) + ': ' + json.dumps(
+            {k: doc[k] for k in ('url', 'title', 'length')}, indent=2)))
+
+    # 6. index.json sample: resolve only the doc ids it mentions
+    with PostingsReader(output_dir / "postings.bin") as reader:
+        wanted = set()
+        for t in range(min(100, len(reader))):
+            wanted.update(reader.read(t)[0].tolist())
+        doc_ids = {}
+        wanted = np.array(sorted(wanted), dtype=np.int64)
+        block_of = np.searchsorted(bases, wanted, side='right') - 1
+        for b, seg in enumerate(segments):
+            for d in wanted[block_of == b].tolist():
+                doc_ids[d] = seg.docs[d - bases[b]]['doc_id']
+            seg.drop_docs()
+        with open(output_dir / "index.json", 'w') as f:
+            json.dump(index_sample(reader, 100, doc_ids), f, indent=2)
+        num_terms = len(reader)
+
+    total_length = 0
+    for seg in segments:
+        total_length += sum(doc['length'] for doc in seg.docs)
+        seg.drop_docs()
+    return {
+        'documents': n_doc,
+        'unique_terms': num_terms,
+        'vocabulary': num_features,
+        'avg_length': total_length / n_doc if n_doc else 0.0,
+        'blocks': len(segments),
+    }
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+TF-IDF storage for CS-429 IR Project
+The matrix is saved as raw CSR arrays (.npy) that query processes open with
+mmap_mode, so they share one copy through the OS page cache
+"""
+
+import json
+from pathlib import Path
+import numpy as np
+from scipy import sparse
+
+CSR_FILES = ("tfidf_data.npy", "tfidf_indices.npy", "tfidf_indptr.npy")
+# Term-major copy: per feature, (doc number, weight, position in the CSR row)
+CSC_FILES = ("tfidf_csc_data.npy", "tfidf_csc_indices.npy", "tfidf_csc_indptr.npy",
+             "tfidf_csc_rank.npy")
+NORMS_FILE = "tfidf_norms.npy"
+# Resolved stop-word list, so queries can be analyzed without scikit-learn
+STOP_WORDS_FILE = "tfidf_stop_words.json"
+
+
+def save_tfidf(output_dir, vectorizer, tfidf_matrix, params):
+    """Write CSR arrays, idf, vocabulary (by column) and vectorizer params"""
+    output_dir = Path(output_dir)
+    tfidf_matrix = sparse.csr_matrix(tfidf_matrix)
+    for name, arr in zip(CSR_FILES, (tfidf_matrix.data, tfidf_matrix.indices, tfidf_matrix.indptr)):
+        np.save(output_dir / name, arr)
+    np.save(output_dir / "tfidf_idf.npy", vectorizer.idf_)
+
+    vocab = [None] * len(vectorizer.vocabulary_)
+    for term, col in vectorizer.vocabulary_.items():
+        vocab[col] = term
+    write_vocab(output_dir, vocab)
+    write_meta(output_dir, tfidf_matrix.shape, tfidf_matrix.nnz, params)
+    write_term_major(output_dir)
+
+
+def write_vocab(output_dir, terms):
+    """tfidf_vocab.json: JSON list of terms in column order (streamed)"""
+    with open(Path(output_dir) / "tfidf_vocab.json", 'w') as f:
+        f.write('[')
+        for i, term in enumerate(terms):
+            f.write((', ' if i else '') + json.dumps(term))
+        f.write(']')
+
+
+def write_meta(output_dir, shape, nnz, params):
+    with open(Path(output_dir) / "tfidf_meta.json", 'w') as f:
+        json.dump({'shape': list(shape), 'nnz': int(nnz), 'params': params}, f, indent=2)
+    write_stop_words(output_dir, params.get('stop_words'))
+
+
+def write_stop_words(output_dir, stop_words):
+    """tfidf_stop_words.json: the stop_words param as a sorted list"""
+    if stop_words == 'english':
+        from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+        stop_words = ENGLISH_STOP_WORDS
+    with open(Path(output_dir) / STOP_WORDS_FILE, 'w') as f:
+        json.dump(sorted(stop_words or ()), f)
+
+
+class CsrWriter:
+    """Appends row blocks to the tfidf_*.npy files without holding the matrix"""
+
+    def __init__(self, output_dir, shape, nnz):
+        output_dir = Path(output_dir)
+        index_dtype = np.int32 if max(nnz, shape[1]) < 2**31 else np.int64
+        open_memmap = np.lib.format.open_memmap
+        self.data = open_memmap(output_dir / CSR_FILES[0], mode='w+', dtype=np.float64, shape=(nnz,))
+        self.indices = open_memmap(output_dir / CSR_FILES[1], mode='w+', dtype=index_dtype, shape=(nnz,))
+        self.indptr = open_memmap(output_dir / CSR_FILES[2], mode='w+', dtype=index_dtype,
+                                  shape=(shape[0] + 1,))
+        self.indptr[0] = 0
+        self.rows = self.nnz = 0
+
+    def append(self, block):
+        """Append the rows of a CSR block"""
+        n, k = block.shape[0], block.nnz
+        self.data[self.nnz:self.nnz + k] = block.data
+        self.indices[self.nnz:self.nnz + k] = block.indices
+        self.indptr[self.rows + 1:self.rows + n + 1] = block.indptr[1:] + self.nnz
+        self.rows += n
+        self.nnz += k
+
+    def close(self):
+        assert self.rows + 1 == len(self.indptr) and self.nnz == len(self.data)
+        for arr in (self.data, self.indices, self.indptr):
+            arr.flush()
+        self.data = self.indices = self.indptr = None
+
+
+def write_term_major(output_dir, block_rows=1 << 16):
+    """Write the CSC copy and L2 row norms of the saved CSR matrix.
+
+    Streams the (memory-mapped) CSR files in row blocks: one pass counts
+    entries per feature and sums squared weights per row, a second one
+    scatters each block into place. Doc numbers ascend within a feature.
+    """
+    output_dir = Path(output_dir)
+    matrix = load_tfidf_matrix(output_dir)
+    num_docs, num_features = matrix.shape
+    data, indices, indptr = matrix.data, matrix.indices, matrix.indptr
+    blocks = [(r, min(r + block_rows, num_docs)) for r in range(0, num_docs, block_rows)]
+
+    col_counts = np.zeros(num_features, dtype=np.int64)
+    norms = np.zeros(num_docs)
+    for r0, r1 in blocks:
+        lo, hi = indptr[r0], indptr[r1]
+        cols = np.asarray(indices[lo:hi])
+        col_counts += np.bincount(cols, minlength=num_features)
+        rows = np.repeat(np.arange(r1 - r0), np.diff(indptr[r0:r1 + 1]))
+        weights = np.asarray(data[lo:hi])
+        norms[r0:r1] = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=r1 - r0))
+    np.save(output_dir / NORMS_FILE, norms)
+
+    nnz = len(data)
+    csc_indptr = np.zeros(num_features + 1, dtype=np.int64)
+    np.cumsum(col_counts, out=csc_indptr[1:])
+    row_dtype = np.int32 if num_docs < 2**31 else np.int64
+    open_memmap = np.lib.format.open_memmap
+    out_data = open_memmap(output_dir / CSC_FILES[0], mode='w+', dtype=np.float64, shape=(nnz,))
+    out_rows = open_memmap(output_dir / CSC_FILES[1], mode='w+', dtype=row_dtype, shape=(nnz,))
+    out_rank = open_memmap(output_dir / CSC_FILES[3], mode='w+', dtype=np.int32, shape=(nnz,))
+    next_free = csc_indptr[:-1].copy()
+    for r0, r1 in blocks:
+        lo, hi = indptr[r0], indptr[r1]
+        row_len = np.diff(indptr[r0:r1 + 1]).astype(np.int64)
+        cols = np.asarray(indices[lo:hi])
+        order = np.argsort(cols, kind='stable')  # keeps rows ascending per feature
+        sorted_cols = cols[order]
+        within = np.arange(len(order)) - np.searchsorted(sorted_cols, sorted_cols)
+        pos = next_free[sorted_cols] + within
+        out_data[pos] = np.asarray(data[lo:hi])[order]
+        out_rows[pos] = np.repeat(np.arange(r0, r1), row_len)[order]
+        out_rank[pos] = (np.arange(hi - lo) - np.repeat(indptr[r0:r1] - lo, row_len))[order]
+        next_free += np.bincount(cols, minlength=num_features)
+    for arr in (out_data, out_rows, out_rank):
+        arr.flush()
+    del out_data, out_rows, out_rank
+    np.save(output_dir / CSC_FILES[2], csc_indptr)
+
+
+def load_term_major(indexer_dir, mmap_mode='r'):
+    """(indptr, doc_nums, weights, row_rank, norms) written by write_term_major"""
+    indexer_dir = Path(indexer_dir)
+    data, rows, indptr, rank = (np.load(indexer_dir / name, mmap_mode=mmap_mode)
+                                for name in CSC_FILES)
+    return indptr, rows, data, rank, np.load(indexer_dir / NORMS_FILE, mmap_mode=mmap_mode)
+
+
+def load_tfidf_matrix(indexer_dir, mmap_mode='r'):
+    """CSR matrix whose arrays are memory-mapped (no copy, no unpickling)"""
+    indexer_dir = Path(indexer_dir)
+    with open(indexer_dir / "tfidf_meta.json", 'r') as f:
+        meta = json.load(f)
+    data, indices, indptr = (np.load(indexer_dir / name, mmap_mode=mmap_mode) for name in CSR_FILES)
+    return sparse.csr_matrix((data, indices, indptr), shape=tuple(meta['shape']), copy=False)
+
+
+def load_vectorizer(indexer_dir, lightweight=True):
+    """Query vectorizer rebuilt from the vocabulary and idf files.
+
+    A QueryVectorizer (no scikit-learn import) when the stop-word list was
+    exported and the params are ones it reproduces, else a fitted
+    TfidfVectorizer; both transform() identically.
+    """
+    indexer_dir = Path(indexer_dir)
+    with open(indexer_dir / "tfidf_meta.json", 'r') as f:
+        params = json.load(f)['params']
+    params['ngram_range'] = tuple(params['ngram_range'])
+    with open(indexer_dir / "tfidf_vocab.json", 'r') as f:
+        vocab = json.load(f)
+    vocabulary = {term: col for col, term in enumerate(vocab)}
+    idf = np.load(indexer_dir / "tfidf_idf.npy")
+
+    if lightweight and (indexer_dir / STOP_WORDS_FILE).exists():
+        from query_vectorizer import QueryVectorizer
+        with open(indexer_dir / STOP_WORDS_FILE, 'r') as f:
+            stop_words = json.load(f)
+        try:
+            return QueryVectorizer.from_params(vocabulary, idf, stop_words, params)
+        except ValueError:
+            pass
+
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    vectorizer = TfidfVectorizer(**params)
+    vectorizer.vocabulary_ = vocabulary
+    vectorizer.idf_ = idf
+    return vectorizer
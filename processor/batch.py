@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Vectorized batch query execution for CS-429 IR Project
+Scores chunks of queries with one sparse matrix product each, selects every
+query's top-k with partial selection and streams rows to results.csv (or,
+for uploaded queries, NDJSON records to the client)
+"""
+
+import csv
+from itertools import islice
+import json
+import numpy as np
+
+from phrase import match_phrases, parse_query, tokenize
+
+RESULT_FIELDS = ['query_id', 'doc_id', 'rank', 'score']
+
+# Dense score cells (queries x documents) held at once, ~128 MB of float64
+MAX_SCORE_CELLS = 1 << 24
+
+# Uploaded queries are ranked in micro-batches of this many, and each
+# micro-batch's results are sent before the next one is read
+STREAM_CHUNK = 64
+MAX_STREAM_CHUNK = 1024
+MAX_LINE_BYTES = 1 << 16
+
+
+def batch_top_k(scores, k):
+    """Row-wise scoring.top_k of a 2-D score array: (indices, scores).
+
+    Partial selection finds each row's k-th score; everything above it is
+    kept, plus the lowest-numbered docs tied with it, so ties break exactly
+    as in the single-query path.
+    """
+    rows, n = scores.shape
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((rows, 0), dtype=np.int64), np.empty((rows, 0))
+    kth = np.partition(scores, n - k, axis=1)[:, n - k:n - k + 1]
+    above = scores > kth
+    tied = scores == kth
+    room = k - above.sum(axis=1, keepdims=True)
+    chosen = above | (tied & (np.cumsum(tied, axis=1) <= room))
+    idx = np.nonzero(chosen)[1].reshape(rows, k)
+    picked = np.take_along_axis(scores, idx, axis=1)
+    order = _row_order(idx, picked)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(picked, order, axis=1)
+
+
+def _row_order(idx, picked):
+    """Per-row argsort by (-score, doc number)"""
+    # Stable sort by doc number first, then by score: ties keep doc order
+    by_doc = np.argsort(idx, axis=1, kind='stable')
+    by_score = np.argsort(-np.take_along_axis(picked, by_doc, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(by_doc, by_score, axis=1)
+
+
+def score_chunk(texts, vectorizer, tfidf_matrix, postings=None, scorer=None, norms=None):
+    """Dense (len(texts), num_docs) cosine scores for a chunk of queries,
+    and which queries have phrases.
+
+    One vectorizer.transform and one sparse product for the whole chunk;
+    cosine dot products are divided by the doc norms when given. With a
+    scorer (e.g. BM25F), its accumulator row for each query instead.
+    Documents failing a query's phrases ("a b", "a b"~k) get -inf.
+    """
+    parsed = [parse_query(text) for text in texts]
+    if scorer is not None:
+        scores = np.empty((len(texts), tfidf_matrix.shape[0]))
+        for row, (text, _) in enumerate(parsed):
+            scores[row] = scorer.score(tokenize(text))
+    else:
+        query_vecs = vectorizer.transform([text.lower() for text, _ in parsed])
+        # docs x queries keeps each score's summation in CSR row order, so
+        # it equals the single-query scoring.cosine_scores bit for bit
+        scores = (tfidf_matrix @ query_vecs.T.tocsr()).T.toarray()
+        if norms is not None:
+            scores /= norms
+    for row, (_, phrases) in enumerate(parsed):
+        if phrases:
+            keep = np.zeros(scores.shape[1], dtype=bool)
+            keep[match_phrases(postings, phrases)] = True
+            scores[row, ~keep] = -np.inf
+    return scores, np.array([bool(phrases) for _, phrases in parsed])
+
+
+def rank_chunk(texts, vectorizer, tfidf_matrix, doc_ids, postings=None, top_k=10, scorer=None,
+               norms=None):
+    """Per query, its ranked (doc_id, rank, score) rows. doc_ids must be
+    an object array"""
+    scores, phrase_rows = score_chunk(texts, vectorizer, tfidf_matrix, postings, scorer, norms)
+    top_idx, top_scores = batch_top_k(scores, top_k)
+    # Same filter as rank_documents: non-zero similarity, or any phrase match
+    keep = (top_scores > 0) | (phrase_rows[:, None] & np.isfinite(top_scores))
+
+    ranks = np.arange(1, top_idx.shape[1] + 1)
+    results = []
+    for row in range(len(texts)):
+        mask = keep[row]
+        results.append(list(zip(doc_ids[top_idx[row][mask]], ranks[mask].tolist(),
+                                top_scores[row][mask].tolist())))
+    return results
+
+
+def run_batch(queries_file, results_file, vectorizer, tfidf_matrix, doc_ids,
+              postings=None, top_k=10, chunk_size=None, progress=None, scorer=None,
+              norms=None):
+    """Rank every query of queries_file and stream rows to results_file.
+
+    Memory is bounded by one chunk of dense scores (MAX_SCORE_CELLS);
+    rows are written as each chunk finishes. Returns the number of queries.
+    """
+    num_docs = tfidf_matrix.shape[0]
+    if chunk_size is None:
+        chunk_size = max(1, MAX_SCORE_CELLS // max(num_docs, 1))
+    doc_ids = np.asarray(doc_ids, dtype=object)
+
+    num_queries = 0
+    with open(queries_file, 'r', newline='') as fin, open(results_file, 'w', newline='') as fout:
+        reader = csv.DictReader(fin)
+        writer = csv.writer(fout)
+        header_written = False
+        while True:
+            rows = list(islice(reader, chunk_size))
+            if not rows:
+                break
+            texts = [row['query_text'] for row in rows]
+            ranked = rank_chunk(texts, vectorizer, tfidf_matrix, doc_ids, postings, top_k,
+                                scorer, norms)
+            out = [(query_row['query_id'], *result)
+                   for query_row, results in zip(rows, ranked) for result in results]
+            if out and not header_written:
+                writer.writerow(RESULT_FIELDS)
+                header_written = True
+            writer.writerows(out)
+
+            num_queries += len(rows)
+            if progress:
+                progress(num_queries)
+    return num_queries
+
+
+def body_lines(stream, max_line=MAX_LINE_BYTES):
+    """Decoded lines of a binary stream, read as they are consumed"""
+    while True:
+        line = stream.readline(max_line + 1)
+        if not line:
+            return
+        if len(line) > max_line:
+            raise ValueError(f"line longer than {max_line} bytes")
+        yield line.decode('utf-8', errors='replace')
+
+
+def read_queries(lines, ndjson=False):
+    """Iterator of (query_id, query_text, error) per query of an uploaded body.
+
+    CSV needs a query_text column (query_id optional); NDJSON has one
+    object per line with "query_text" (or "q") and optionally "query_id".
+    A missing query_id is the query's 1-based position. Bad NDJSON lines
+    and CSV rows the csv module rejects (e.g. a field over its size limit)
+    come out as errors instead of ending the stream. The CSV header is read
+    right away: ValueError if it is unreadable or has no query_text column.
+    """
+    if ndjson:
+        return _ndjson_queries(lines)
+    reader = csv.DictReader(lines)
+    try:
+        fieldnames = reader.fieldnames
+    except csv.Error as exc:
+        raise ValueError(f"unreadable CSV header: {exc}") from None
+    if fieldnames is None:
+        return iter(())
+    if 'query_text' not in fieldnames:
+        raise ValueError("CSV header has no query_text column")
+    return _csv_queries(reader)
+
+
+def _csv_queries(reader):
+    n = 0
+    while True:
+        n += 1
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            # The reader has consumed the bad line and can go on
+            yield n, None, f"bad CSV row: {exc}"
+            continue
+        yield row.get('query_id') or n, row['query_text'] or '', None
+
+
+def _ndjson_queries(lines):
+    n = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        n += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield n, None, "invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield n, None, "expected a JSON object"
+            continue
+        text = record.get('query_text', record.get('q'))
+        if not isinstance(text, str):
+            yield record.get('query_id', n), None, "missing query_text"
+            continue
+        yield record.get('query_id', n), text, None
+
+
+def stream_batch(queries, vectorizer, tfidf_matrix, doc_ids, postings=None, top_k=10,
+                 chunk_size=STREAM_CHUNK, scorer=None, norms=None):
+    """Rank (query_id, query_text, error) records in micro-batches.
+
+    Yields one list of JSON-ready records per micro-batch, in input order,
+    reading the next micro-batch only when the caller asks for it: memory
+    stays at one micro-batch however long the input is, and a client that
+    stops reading stops the reading of its queries.
+    """
+    chunk_size = max(1, min(chunk_size, MAX_SCORE_CELLS // max(tfidf_matrix.shape[0], 1)))
+    doc_ids = np.asarray(doc_ids, dtype=object)
+    queries = iter(queries)
+    while True:
+        records = list(islice(queries, chunk_size))
+        if not records:
+            return
+        valid = [text for _, text, error in records if error is None]
+        ranked = iter(rank_chunk(valid, vectorizer, tfidf_matrix, doc_ids, postings, top_k,
+                                 scorer, norms) if valid else [])
+        out = []
+        for query_id, _, error in records:
+            if error is not None:
+                out.append({'query_id': query_id, 'error': error})
+                continue
+            out.append({'query_id': query_id, 'results': [
+                {'rank': rank, 'doc_id': doc_id, 'score': score}
+                for doc_id, rank, score in next(ranked)]})
+        yield out
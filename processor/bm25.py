@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+BM25 / BM25F ranking for CS-429 IR Project
+Scores from the positional index's term frequencies and the document
+lengths in doc_metadata, with idf and length normalization precomputed at
+load time
+"""
+
+from collections import Counter
+import numpy as np
+
+from postings import PositionalIndex
+
+
+class BM25F:
+    """BM25F over one or more fields (BM25 when there is a single field).
+
+    Each field is (index, lengths, weight, b): an inverted index with
+    postings(term) -> (doc_nums, tfs), per-doc field lengths, the field
+    weight and its length-normalization strength. Per document and term,
+
+        tf' = sum_f weight_f * tf_f / (1 - b_f + b_f * len_f / avglen_f)
+        score += idf * tf' * (k1 + 1) / (tf' + k1)
+
+    with idf = ln(1 + (N - df + 0.5) / (df + 0.5)), df counting docs that
+    have the term in any field.
+    """
+
+    def __init__(self, fields, num_docs, k1=1.2):
+        self.k1 = k1
+        self.num_docs = num_docs
+        self.fields = []
+        for index, lengths, weight, b in fields:
+            lengths = np.asarray(lengths, dtype=np.float64)
+            avg = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+            # weight / (1 - b + b * len / avglen), one value per doc
+            scale = weight / (1.0 - b + b * lengths / avg)
+            self.fields.append((index, scale))
+
+    def idf(self, df):
+        return np.log1p((self.num_docs - df + 0.5) / (df + 0.5))
+
+    def term_scores(self, term):
+        """(doc_nums, scores) of one term; only its postings are touched"""
+        docs, weighted = [], []
+        for index, scale in self.fields:
+            doc_nums, tfs = index.postings(term)
+            docs.append(doc_nums)
+            weighted.append(tfs * scale[doc_nums])
+        docs = np.concatenate(docs)
+        if not len(docs):
+            return docs, np.empty(0)
+        if len(self.fields) == 1:
+            doc_nums, tf = docs, weighted[0]
+        else:
+            doc_nums, inverse = np.unique(docs, return_inverse=True)
+            tf = np.bincount(inverse, weights=np.concatenate(weighted), minlength=len(doc_nums))
+        return doc_nums, self.idf(len(doc_nums)) * tf * (self.k1 + 1) / (tf + self.k1)
+
+    def score(self, tokens):
+        """Dense score accumulator over all docs for a tokenized query"""
+        scores = np.zeros(self.num_docs)
+        for term, qtf in Counter(tokens).items():
+            doc_nums, term_scores = self.term_scores(term)
+            scores[doc_nums] += qtf * term_scores
+        return scores
+
+
+def build_models(postings, doc_ids, doc_metadata, tokenize,
+                 title_weight=2.0, body_b=0.75, title_b=0.5, k1=1.2):
+    """{'bm25': BM25 over the indexed text, 'bm25f': BM25F over title + body}.
+
+    The title field is indexed here from doc_metadata (titles are short).
+    """
+    body_lengths = [doc_metadata[doc_id]['length'] for doc_id in doc_ids]
+    title_tokens = [tokenize(doc_metadata[doc_id]['title']) for doc_id in doc_ids]
+    titles = PositionalIndex.build(title_tokens, max_positions=0)
+    title_lengths = [len(tokens) for tokens in title_tokens]
+    return {
+        'bm25': BM25F([(postings, body_lengths, 1.0, body_b)], len(doc_ids), k1),
+        'bm25f': BM25F([(postings, body_lengths, 1.0, body_b),
+                        (titles, title_lengths, title_weight, title_b)], len(doc_ids), k1),
+    }
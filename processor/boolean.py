@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Boolean retrieval for CS-429 IR Project
+Parses AND / OR / NOT queries (with parentheses and quoted phrases) and
+evaluates them over the postings, intersecting the rarest lists first
+"""
+
+import re
+import numpy as np
+
+from doclists import difference, intersect, union
+from phrase import phrase_matches, tokenize
+
+OPERATORS = ('AND', 'OR', 'NOT')
+_TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"(?:~(\d+))?|([^\s()"]+))')
+
+
+def _lex(query):
+    """('(' | ')' | 'AND' | 'OR' | 'NOT' | operand node) per token"""
+    pos, tokens = 0, []
+    query = query.rstrip()
+    while pos < len(query):
+        m = _TOKEN_RE.match(query, pos)
+        if m is None:
+            raise ValueError(f"unbalanced quote at position {pos}")
+        pos = m.end()
+        lparen, rparen, phrase, slop, word = m.groups()
+        if lparen or rparen:
+            tokens.append(lparen or rparen)
+        elif word and word.upper() in OPERATORS:
+            tokens.append(word.upper())
+        else:
+            # A word the index splits (e-mail) must match as a phrase
+            terms = tokenize(word if phrase is None else phrase)
+            if not terms:
+                continue
+            if len(terms) == 1 and phrase is None:
+                tokens.append(('term', terms[0]))
+            else:
+                tokens.append(('phrase', terms, int(slop or 0)))
+    return tokens
+
+
+def parse_boolean(query):
+    """Query tree of a boolean query; ValueError if malformed.
+
+    Operators are matched in any case (quote one to search for the
+    word); NOT binds tightest, then AND, then OR, and
+    adjacent operands are ANDed. Nodes are ('term', token),
+    ('phrase', tokens, slop), ('not', node), ('and', [nodes]) and
+    ('or', [nodes]).
+    """
+    tokens = _lex(query)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def parse_or():
+        nonlocal pos
+        children = [parse_and()]
+        while peek() == 'OR':
+            pos += 1
+            children.append(parse_and())
+        return children[0] if len(children) == 1 else ('or', children)
+
+    def parse_and():
+        nonlocal pos
+        children = [parse_not()]
+        while peek() not in (None, 'OR', ')'):
+            if peek() == 'AND':
+                pos += 1
+            children.append(parse_not())
+        return children[0] if len(children) == 1 else ('and', children)
+
+    def parse_not():
+        nonlocal pos
+        token = peek()
+        pos += 1
+        if token == 'NOT':
+            return ('not', parse_not())
+        if token == '(':
+            node = parse_or()
+            if peek() != ')':
+                raise ValueError("missing ')'")
+            pos += 1
+            return node
+        if token is None or token in OPERATORS or token == ')':
+            raise ValueError(f"expected a term before {token or 'the end'}")
+        return token
+
+    if not tokens:
+        raise ValueError("empty boolean query")
+    node = parse_or()
+    if pos < len(tokens):
+        raise ValueError(f"unexpected '{tokens[pos]}'")
+    return node
+
+
+def positive_terms(node):
+    """Tokens of the operands that are not negated, for ranking"""
+    kind = node[0]
+    if kind == 'term':
+        return [node[1]]
+    if kind == 'phrase':
+        return list(node[1])
+    if kind == 'not':
+        return []
+    return [t for child in node[1] for t in positive_terms(child)]
+
+
+def estimate(index, node, num_docs):
+    """Upper bound on the matches of node, from document frequencies only"""
+    kind = node[0]
+    if kind == 'term':
+        return index.df(node[1])
+    if kind == 'phrase':
+        return min(index.df(t) for t in node[1])
+    if kind == 'not':
+        return num_docs
+    sizes = [estimate(index, child, num_docs) for child in node[1]]
+    return min(sizes) if kind == 'and' else min(sum(sizes), num_docs)
+
+
+class BooleanEvaluator:
+    """Evaluates query trees over a PostingsReader (or PositionalIndex).
+
+    ANDs intersect their operands rarest first and stop once the result is
+    empty, so longer lists are then never decoded; NOT operands are
+    subtracted last. Results are sorted doc numbers.
+    """
+
+    def __init__(self, index, num_docs):
+        self.index = index
+        self.num_docs = num_docs
+
+    def all_docs(self):
+        return np.arange(self.num_docs, dtype=np.int32)
+
+    def evaluate(self, node):
+        kind = node[0]
+        if kind == 'term':
+            return self.index.docs(node[1])
+        if kind == 'phrase':
+            return phrase_matches(self.index, node[1], node[2])[0]
+        if kind == 'not':
+            return difference(self.all_docs(), self.evaluate(node[1]))
+        if kind == 'or':
+            return union([self.evaluate(child) for child in node[1]], self.num_docs)
+        return self._evaluate_and(node[1])
+
+    def _evaluate_and(self, children):
+        required = [c for c in children if c[0] != 'not']
+        excluded = [c[1] for c in children if c[0] == 'not']
+        required.sort(key=lambda c: estimate(self.index, c, self.num_docs))
+        result = self.evaluate(required[0]) if required else self.all_docs()
+        for child in required[1:]:
+            if not len(result):
+                return result
+            result = intersect([result, self.evaluate(child)])
+        for child in excluded:
+            if not len(result):
+                return result
+            result = difference(result, self.evaluate(child))
+        return result
+
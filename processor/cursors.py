@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Pagination cursors for CS-429 IR Project
+Ranked candidate lists kept for a short time so later pages of a query are
+sliced from them instead of re-scoring the collection
+"""
+
+import base64
+from collections import OrderedDict
+import json
+import threading
+import time
+import numpy as np
+
+from result_cache import normalize_query
+
+
+def encode_cursor(query, offset, k, engine, model, nprobe, filter_query=''):
+    """Opaque token for the page of query starting at offset.
+
+    It carries the query itself, so any worker can serve it: from its
+    candidate store when it holds the list, else by ranking again.
+    """
+    state = json.dumps([query, offset, k, engine, model, nprobe, filter_query],
+                       separators=(',', ':'))
+    return base64.urlsafe_b64encode(state.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(query, offset, k, engine, model, nprobe, filter_query); ValueError
+    if malformed"""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        query, offset, k, engine, model, nprobe, filter_query = state
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("malformed cursor")
+    if not isinstance(query, str) or not isinstance(filter_query, str) \
+            or not isinstance(offset, int) or not isinstance(k, int) or offset < 0 or k < 1 \
+            or not (nprobe is None or isinstance(nprobe, int) and nprobe >= 1):
+        raise ValueError("malformed cursor")
+    return query, offset, k, engine, model, nprobe, filter_query
+
+
+class Candidates:
+    """Best documents of one query, best first. complete: no document
+    beyond these matches"""
+
+    __slots__ = ('doc_nums', 'scores', 'complete', 'expires_at')
+
+    def __init__(self, doc_nums, scores, complete, expires_at):
+        self.doc_nums = doc_nums
+        self.scores = scores
+        self.complete = complete
+        self.expires_at = expires_at
+
+
+class CursorStore:
+    """Thread-safe LRU + TTL store of candidate lists.
+
+    Keys are (normalized query, model, nprobe, filter): the engines rank
+    identically. Memory is bounded by the total number of stored
+    candidates (12 bytes each); set_version() drops every list when a
+    different index version is loaded.
+    """
+
+    def __init__(self, max_candidates=1 << 20, ttl=120.0, clock=time.monotonic):
+        self.max_candidates = max_candidates
+        self.ttl = ttl
+        self.clock = clock
+        self.version = None
+        self._entries = OrderedDict()  # key -> Candidates
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    @staticmethod
+    def key(query, model, nprobe, filter_query=''):
+        return normalize_query(query), model, nprobe, filter_query
+
+    def _remove(self, key):
+        self._size -= len(self._entries.pop(key).doc_nums)
+
+    def get(self, key):
+        """Stored candidates for key, or None; a hit extends its lifetime"""
+        with self._lock:
+            entry = self._entries.get(key)
+            now = self.clock()
+            if entry is not None and entry.expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            entry.expires_at = now + self.ttl
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, doc_nums, scores, complete, version=None):
+        """Store a ranked list (unless it was ranked on another index
+        version, or alone exceeds the budget); returns its Candidates"""
+        doc_dtype = np.int32 if len(doc_nums) == 0 or doc_nums.max() < 2**31 else np.int64
+        entry = Candidates(np.asarray(doc_nums, dtype=doc_dtype),
+                           np.asarray(scores, dtype=np.float64), complete,
+                           self.clock() + self.ttl)
+        if len(doc_nums) > self.max_candidates:
+            return entry
+        with self._lock:
+            if version is not None and version != self.version:
+                return entry
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._size += len(entry.doc_nums)
+            while self._size > self.max_candidates:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def set_version(self, version):
+        """Switch to a new index version, dropping lists ranked on the old one"""
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self._size = 0
+                self.version = version
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'candidates': self._size,
+                'max_candidates': self.max_candidates,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Hot index reloading for CS-429 IR Project
+Loads a rebuilt index in the background and swaps it in atomically; queries
+hold a reference to the version they started on, which is closed only once
+the last of them finishes
+"""
+
+from contextlib import contextmanager
+import hashlib
+from pathlib import Path
+import threading
+import time
+
+from manifest import check_files, read_manifest, read_version
+
+# Fallback fingerprint for indexes without a manifest: (mtime, size) of these
+INDEX_VERSION_FILES = ("doc_ids.json", "postings.bin", "tfidf_meta.json", "tfidf_data.npy")
+# Loads tried before giving up when builds keep publishing mid-load
+LOAD_ATTEMPTS = 3
+
+
+def get_index_version(indexer_path):
+    """Version of the index on disk: the manifest's, else a short
+    fingerprint of the index files"""
+    version = read_version(indexer_path)
+    if version is not None:
+        return version
+    h = hashlib.sha1()
+    for name in INDEX_VERSION_FILES:
+        stat = (Path(indexer_path) / name).stat()
+        h.update(f"{name}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+    return h.hexdigest()[:12]
+
+
+class IndexManager:
+    """Reference-counted current index with background reloads.
+
+    loader(indexer_path, version) returns an index object with a close()
+    method. acquire() pins the current version for one query; reload()
+    loads the version on disk (at most one load at a time) and swaps it
+    in. A replaced version is closed when its last query releases it.
+    """
+
+    def __init__(self, loader, on_swap=None):
+        self.loader = loader
+        self.on_swap = on_swap
+        self.indexer_path = None
+        self._current = None
+        self._refs = {}  # id(index) -> queries using it
+        self._retired = {}  # id(index) -> replaced index still in use
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self.loaded_at = None
+        self.last_reload_seconds = None
+        self.reloads = self.failures = 0
+        self.last_error = None
+        self.watch_interval = 0  # seconds between checks for a new version
+
+    @property
+    def current(self):
+        return self._current
+
+    def open(self, indexer_path):
+        """Load the index synchronously (at startup)"""
+        self.indexer_path = Path(indexer_path)
+        self.reload(force=True, raise_errors=True)
+
+    @contextmanager
+    def acquire(self):
+        """The current index, kept open until the block exits"""
+        with self._lock:
+            index = self._current
+            self._refs[id(index)] = self._refs.get(id(index), 0) + 1
+        try:
+            yield index
+        finally:
+            with self._lock:
+                self._refs[id(index)] -= 1
+                idle = self._refs[id(index)] == 0
+                if idle:
+                    del self._refs[id(index)]
+                retired = self._retired.pop(id(index), None) if idle else None
+            if retired is not None:
+                retired.close()
+
+    def _swap(self, index):
+        with self._lock:
+            old = self._current
+            self._current = index
+            if old is not None and self._refs.get(id(old)):
+                self._retired[id(old)] = old
+                old = None
+        if self.on_swap:
+            self.on_swap(index)
+        if old is not None:
+            old.close()
+
+    def changed(self):
+        """Whether the index on disk is a different version"""
+        try:
+            return get_index_version(self.indexer_path) != self._current.version
+        except (OSError, ValueError, KeyError):
+            return False  # mid-build; try again later
+
+    def reload(self, force=False, raise_errors=False):
+        """Load and swap in the index on disk if its version changed.
+
+        Returns True if a new version was swapped in. A failed load keeps
+        the current version serving. If the manifest changes while loading
+        (another build started or published), some files may be from
+        that build, so the load is discarded: retried on a newly published
+        version, failed while a build is still writing.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False  # another reload is already running
+        try:
+            version = get_index_version(self.indexer_path)
+            if not force and self._current is not None and version == self._current.version:
+                return False
+            start = time.perf_counter()
+            index = self._load(version)
+            self._swap(index)
+            self.last_reload_seconds = round(time.perf_counter() - start, 3)
+            self.loaded_at = time.time()
+            self.reloads += 1
+            self.last_error = None
+            return True
+        except Exception as exc:
+            self.failures += 1
+            self.last_error = f"{type(exc).__name__}: {exc}"
+            if raise_errors:
+                raise
+            return False
+        finally:
+            self._reload_lock.release()
+
+    def _load(self, version):
+        """The index of version, checked to still be the one on disk: the
+        manifest is unchanged from before the load to after it, and the
+        files have the sizes it recorded"""
+        for _ in range(LOAD_ATTEMPTS):
+            before = read_manifest(self.indexer_path)
+            index = self.loader(self.indexer_path, version)
+            try:
+                after = read_manifest(self.indexer_path)
+                latest = get_index_version(self.indexer_path)
+                if latest == version and after == before:
+                    if after is not None:
+                        check_files(self.indexer_path, after)
+                    return index
+            except BaseException:
+                index.close()
+                raise
+            index.close()
+            version = latest
+        raise RuntimeError(f"index version changed during each of {LOAD_ATTEMPTS} loads")
+
+    def reload_async(self, force=False):
+        """Start a reload in a background thread"""
+        thread = threading.Thread(target=self.reload, kwargs={'force': force}, daemon=True)
+        thread.start()
+        return thread
+
+    def watch(self, interval=2.0):
+        """Poll the indexer directory and reload when the version changes"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                if self.changed():
+                    self.reload()
+
+        self.watch_interval = interval
+        threading.Thread(target=loop, daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            in_use = len(self._retired)
+        return {
+            'active_version': self._current.version if self._current else None,
+            'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.loaded_at))
+                         if self.loaded_at else None,
+            'last_reload_seconds': self.last_reload_seconds,
+            'reloading': self._reload_lock.locked(),
+            'reloads': self.reloads,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'old_versions_in_use': in_use,
+            'watch_interval': self.watch_interval,
+        }
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+HTTP load generator for CS-429 IR Project
+Replays a query log against a locally started query_processor (dev or
+prefork server) in closed-loop (fixed concurrency) or open-loop (arrival
+rate) mode and reports throughput and latency percentiles
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import http.client
+import json
+import os
+from pathlib import Path
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+import numpy as np
+
+PROCESSOR_DIR = Path(__file__).resolve().parent
+PERCENTILES = (50, 95, 99, 99.9)
+
+# name -> (method, path, query parameters); cache=0 bypasses the result cache
+SCENARIOS = {
+    'cosine': ('GET', '/search', {'engine': 'exhaustive', 'cache': '0'}),
+    'cached': ('GET', '/search', {'engine': 'exhaustive'}),
+    'wand': ('GET', '/search', {'engine': 'wand', 'cache': '0'}),
+    'taat': ('GET', '/search', {'engine': 'taat', 'cache': '0'}),
+    'bm25': ('GET', '/search', {'model': 'bm25', 'cache': '0'}),
+    'lsi': ('GET', '/search', {'model': 'lsi', 'cache': '0'}),
+    'batch': ('POST', '/batch', {}),
+}
+
+
+def read_queries(path):
+    """query_text column of a CSV query log (or one query per line)"""
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        first = f.readline()
+        f.seek(0)
+        if 'query_text' in first:
+            return [row['query_text'] for row in csv.DictReader(f) if row['query_text'].strip()]
+        return [line.strip() for line in f if line.strip()]
+
+
+class LocalServer:
+    """query_processor.py started in a scratch tree.
+
+    The scratch tree links the real index and holds a copy of the query
+    log as queries/queries.csv, so POST /batch writes its results.csv there
+    instead of into the repository.
+    """
+
+    def __init__(self, mode, port, queries_file, indexer_dir, workers=0, threads=8):
+        self.mode, self.port = mode, port
+        self.root = Path(tempfile.mkdtemp(prefix="ir-loadtest-"))
+        (self.root / "processor").mkdir()
+        (self.root / "queries").mkdir()
+        (self.root / "indexer").symlink_to(Path(indexer_dir).resolve())
+        with open(self.root / "queries" / "queries.csv", 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['query_id', 'query_text'])
+            writer.writerows((f"q{i}", text) for i, text in enumerate(read_queries(queries_file)))
+        cmd = [sys.executable, str(PROCESSOR_DIR / "query_processor.py"), mode,
+               "--host", "127.0.0.1", "--port", str(port)]
+        if mode == "serve":
+            cmd += ["--workers", str(workers), "--threads", str(threads)]
+        self.log = open(self.root / "server.log", 'w')
+        # Own process group, so the Flask reloader child is stopped too
+        self.proc = subprocess.Popen(cmd, cwd=self.root / "processor", stdout=self.log,
+                                     stderr=subprocess.STDOUT, start_new_session=True)
+
+    def wait_ready(self, timeout=60.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"server exited; see {self.root / 'server.log'}")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=1)
+                conn.request('GET', '/health')
+                if conn.getresponse().status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"server not ready after {timeout:.0f}s")
+
+    def stop(self):
+        try:
+            os.killpg(self.proc.pid, signal.SIGTERM)
+            self.proc.wait(timeout=30)
+        except (ProcessLookupError, subprocess.TimeoutExpired):
+            os.killpg(self.proc.pid, signal.SIGKILL)
+            self.proc.wait()
+        self.log.close()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class _Client:
+    """One keep-alive connection; returns (ok, seconds) per request"""
+
+    def __init__(self, host, port, timeout):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.conn = None
+
+    def request(self, method, path):
+        start = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.conn.request(method, path)
+            response = self.conn.getresponse()
+            response.read()
+            ok = response.status == 200
+            if response.will_close:
+                self.conn.close()
+                self.conn = None
+        except (OSError, http.client.HTTPException):
+            ok = False
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = None
+        return ok, time.perf_counter() - start
+
+
+def _paths(scenario, queries, k):
+    method, endpoint, params = SCENARIOS[scenario]
+    if method == 'POST':
+        return method, [endpoint]
+    return method, [f"{endpoint}?{urlencode(dict(params, q=text, k=k))}" for text in queries]
+
+
+def run_closed(host, port, method, paths, concurrency, duration, warmup, timeout):
+    """`concurrency` clients, each sending its next request as soon as the
+    previous one returns"""
+    latencies, errors = [[] for _ in range(concurrency)], [0] * concurrency
+    start = time.monotonic()
+    measure_from, end = start + warmup, start + warmup + duration
+
+    def client(slot):
+        conn = _Client(host, port, timeout)
+        i = slot
+        while True:
+            now = time.monotonic()
+            if now >= end:
+                return
+            ok, seconds = conn.request(method, paths[i % len(paths)])
+            i += concurrency
+            if now >= measure_from:
+                if ok:
+                    latencies[slot].append(seconds)
+                else:
+                    errors[slot] += 1
+
+    threads = [threading.Thread(target=client, args=(slot,)) for slot in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [s for slot in latencies for s in slot], sum(errors), duration
+
+
+def run_open(host, port, method, paths, rate, duration, warmup, timeout, max_clients,
+             poisson=True, seed=0):
+    """Requests arrive at `rate` per second regardless of how fast the
+    server answers. Latency counts from the scheduled arrival, so queueing
+    behind a slow server is included (no coordinated omission)."""
+    rng = random.Random(seed)
+    results, lock = [], threading.Lock()
+    errors = [0]
+    # Most recently used connection first: only as many connections as
+    # there are requests in flight stay busy (the server ties a thread to
+    # each open connection)
+    idle = []
+    start = time.perf_counter()
+    measure_from, end = start + warmup, start + warmup + duration
+
+    def send(scheduled, path):
+        with lock:
+            conn = idle.pop() if idle else _Client(host, port, timeout)
+        ok, _ = conn.request(method, path)
+        latency = time.perf_counter() - scheduled
+        with lock:
+            idle.append(conn)
+            if scheduled >= measure_from:
+                if ok:
+                    results.append(latency)
+                else:
+                    errors[0] += 1
+
+    with ThreadPoolExecutor(max_workers=max_clients) as pool:
+        scheduled, i = start, 0
+        while scheduled < end:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, scheduled, paths[i % len(paths)])
+            i += 1
+            scheduled += rng.expovariate(rate) if poisson else 1.0 / rate
+    return results, errors[0], duration
+
+
+def summarize(latencies, errors, duration):
+    seconds = np.asarray(latencies)
+    row = {
+        'requests': len(seconds),
+        'errors': errors,
+        'throughput': round(len(seconds) / duration, 1),
+        'mean_ms': round(1000 * seconds.mean(), 3) if len(seconds) else None,
+    }
+    for p in PERCENTILES:
+        row[f"p{p}_ms"] = round(1000 * float(np.percentile(seconds, p)), 3) if len(seconds) else None
+    return row
+
+
+def print_table(rows):
+    columns = ['server', 'scenario', 'load', 'requests', 'errors', 'throughput', 'mean_ms'] + \
+              [f"p{p}_ms" for p in PERCENTILES]
+    widths = [max(len(col), *(len(str(row[col])) for row in rows)) for col in columns]
+    print("  ".join(col.rjust(w) for col, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[col]).rjust(w) for col, w in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the query processor over HTTP")
+    parser.add_argument("--queries", default=str(PROCESSOR_DIR.parent / "queries" / "queries.csv"),
+                        help="query log to replay (CSV with query_text, or one query per line)")
+    parser.add_argument("--indexer-dir", default=str(PROCESSOR_DIR.parent / "indexer"))
+    parser.add_argument("--servers", default="serve",
+                        help="comma-separated server modes to start: dev, serve")
+    parser.add_argument("--url", default=None,
+                        help="host:port of an already running server (instead of --servers)")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--workers", type=int, default=0, help="serve: worker processes")
+    parser.add_argument("--threads", type=int, default=8, help="serve: threads per worker")
+    parser.add_argument("--scenarios", default="cosine,cached,wand,taat",
+                        help=f"comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="8",
+                        help="closed loop: comma-separated client counts")
+    parser.add_argument("--rate", default=None,
+                        help="open loop: comma-separated arrival rates (req/s)")
+    parser.add_argument("--uniform", action="store_true",
+                        help="open loop: evenly spaced arrivals instead of Poisson")
+    parser.add_argument("--max-clients", type=int, default=256,
+                        help="open loop: connections available to send arrivals")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per run")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds first")
+    parser.add_argument("-k", type=int, default=10, help="results per query")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout")
+    parser.add_argument("--shuffle", type=int, default=None, metavar="SEED",
+                        help="replay the log in a shuffled order")
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    args = parser.parse_args()
+
+    queries = read_queries(args.queries)
+    if args.shuffle is not None:
+        random.Random(args.shuffle).shuffle(queries)
+    scenarios = args.scenarios.split(',')
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"unknown scenario '{scenario}'")
+    if args.rate:
+        loads = [('rate', float(rate)) for rate in args.rate.split(',')]
+    else:
+        loads = [('concurrency', int(c)) for c in args.concurrency.split(',')]
+
+    rows = []
+    servers = [None] if args.url else args.servers.split(',')
+    for mode in servers:
+        server = None
+        if mode is None:
+            host, port = args.url.rsplit(':', 1)
+            port, mode = int(port), args.url
+        else:
+            host, port = "127.0.0.1", args.port
+            print(f"Starting query_processor.py {mode} on port {port}...")
+            server = LocalServer(mode, port, args.queries, args.indexer_dir,
+                                 args.workers, args.threads)
+        try:
+            if server is not None:
+                server.wait_ready()
+            for scenario in scenarios:
+                method, paths = _paths(scenario, queries, args.k)
+                for kind, value in loads:
+                    print(f"  {scenario}: {kind} {value:g} for {args.duration:g}s...")
+                    if kind == 'rate':
+                        result = run_open(host, port, method, paths, value, args.duration,
+                                          args.warmup, args.timeout, args.max_clients,
+                                          poisson=not args.uniform)
+                    else:
+                        result = run_closed(host, port, method, paths, value, args.duration,
+                                            args.warmup, args.timeout)
+                    load = f"{value:g}/s" if kind == 'rate' else f"c={value}"
+                    rows.append(dict(server=mode, scenario=scenario, load=load,
+                                     **summarize(*result)))
+        finally:
+            if server is not None:
+                server.stop()
+
+    print()
+    print_table(rows)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'queries': len(queries), 'duration': args.duration, 'runs': rows}, f,
+                      indent=2)
+        print(f"Results saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
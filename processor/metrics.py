@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Prometheus metrics for CS-429 IR Project
+Counters and latency histograms kept in one shared memory block, so the
+prefork workers' numbers add up in /metrics whichever worker is scraped
+"""
+
+from bisect import bisect_left
+import mmap
+import threading
+import time
+
+# Seconds; Prometheus' default buckets plus finer ones below 5 ms
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    def __init__(self, registry, name, help, labelnames, label_values, width):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # Every label combination gets its cells up front
+        self.label_values = [tuple(str(v) for v in values) for values in label_values] \
+            if labelnames else [()]
+        self.offsets = {}
+        for values in self.label_values:
+            self.offsets[values] = registry._reserve(width)
+
+    def _offset(self, labels):
+        offset = self.offsets.get(labels)
+        if offset is None:
+            offset = self.offsets[tuple(str(v) for v in labels)]
+        return offset
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, registry, name, help, labelnames=(), label_values=()):
+        super().__init__(registry, name, help, labelnames, label_values, 1)
+
+    def inc(self, *labels, amount=1):
+        self.registry._add(self._offset(labels), amount)
+
+    def samples(self, totals):
+        for values in self.label_values:
+            yield self.name, _format_labels(self.labelnames, values), totals[self.offsets[values]]
+
+
+class Histogram(_Metric):
+    """Per-bucket counts (cumulated when rendered), sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, labelnames=(), label_values=(),
+                 buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(registry, name, help, labelnames, label_values, len(self.buckets) + 3)
+
+    def observe(self, value, *labels):
+        base = self._offset(labels)
+        self.registry._observe(base, bisect_left(self.buckets, value), len(self.buckets), value)
+
+    def samples(self, totals):
+        n = len(self.buckets)
+        for values in self.label_values:
+            base = self.offsets[values]
+            cumulative = 0
+            for i, bound in enumerate(self.buckets + (float('inf'),)):
+                cumulative += totals[base + i]
+                le = "+Inf" if i == n else _format_value(bound)
+                yield (self.name + "_bucket",
+                       _format_labels(self.labelnames, values, [f'le="{le}"']), cumulative)
+            yield self.name + "_sum", _format_labels(self.labelnames, values), totals[base + n + 1]
+            yield self.name + "_count", _format_labels(self.labelnames, values), totals[base + n + 2]
+
+
+class Registry:
+    """Fixed set of metrics stored as float64 cells.
+
+    Define every metric, then call allocate(rows) before forking: each
+    process writes only its own row (use_row), so updates need just a
+    thread lock, and render() sums the rows.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.size = 0
+        self.rows = 0
+        self.row = 0
+        self._cells = None
+        self._lock = threading.Lock()
+
+    def _reserve(self, width):
+        if self._cells is not None:
+            raise RuntimeError("metrics must be defined before allocate()")
+        offset = self.size
+        self.size += width
+        return offset
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(self, *args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(self, *args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def allocate(self, rows=1):
+        """Shared (inherited by forked children) zeroed cells for `rows` processes"""
+        self.rows = rows
+        self._buffer = mmap.mmap(-1, max(rows * self.size, 1) * 8)
+        self._cells = memoryview(self._buffer).cast('d')
+
+    def use_row(self, row):
+        self.row = row
+
+    def _add(self, offset, amount):
+        if self._cells is None:
+            self.allocate()
+        i = self.row * self.size + offset
+        with self._lock:
+            self._cells[i] += amount
+
+    def _observe(self, base, bucket, n, value):
+        if self._cells is None:
+            self.allocate()
+        i = self.row * self.size + base
+        with self._lock:
+            self._cells[i + bucket] += 1
+            self._cells[i + n + 1] += value
+            self._cells[i + n + 2] += 1
+
+    def totals(self):
+        if self._cells is None:
+            self.allocate()
+        totals = [0.0] * self.size
+        for row in range(self.rows):
+            start = row * self.size
+            for i, value in enumerate(self._cells[start:start + self.size]):
+                totals[i] += value
+        return totals
+
+    def render(self, gauges=()):
+        """Prometheus text format; gauges are (name, help, [(labels, value)])"""
+        totals = self.totals()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples(totals):
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        for name, help, samples in gauges:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                label_text = _format_labels(list(labels), list(labels.values())) if labels else ""
+                lines.append(f"{name}{label_text} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class StageClock:
+    """Records the time since the previous lap into a per-stage histogram"""
+
+    __slots__ = ('histogram', 'last')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.histogram.observe(now - self.last, stage)
+        self.last = now
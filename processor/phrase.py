@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Phrase and proximity matching for CS-429 IR Project
+Answers quoted queries ("a b", "a b"~k) from the positional postings by
+intersecting doc lists and merging position lists, without touching the
+documents themselves
+"""
+
+import re
+import numpy as np
+
+from doclists import intersect
+
+# "exact phrase" or "terms in order"~k (at most k extra tokens in between)
+PHRASE_RE = re.compile(r'"([^"]*)"(?:~(\d+))?')
+
+
+def tokenize(text):
+    """Index tokens of text (same cleaning as SearchIndexer.clean_text)"""
+    return re.sub(r'[^a-z0-9\s]', ' ', text.lower()).split()
+
+
+def parse_query(query):
+    """Split a query into (free text, [(tokens, slop), ...]).
+
+    The free text keeps the phrase words (without quotes) so the ranking
+    model still sees them.
+    """
+    phrases = []
+    for m in PHRASE_RE.finditer(query):
+        tokens = tokenize(m.group(1))
+        if tokens:
+            phrases.append((tokens, int(m.group(2) or 0)))
+    text = PHRASE_RE.sub(lambda m: ' ' + m.group(1) + ' ', query).replace('"', ' ')
+    return text, phrases
+
+
+def _position_keys(postings, docs):
+    """(rank of doc in docs) << 32 | position, for the postings in docs.
+
+    Keys come out sorted: doc numbers and positions within a doc both
+    ascend, so one searchsorted can scan every candidate doc at once.
+    """
+    doc_nums, _, pos_ptr, positions = postings
+    idx = np.searchsorted(docs, doc_nums)
+    found = idx < len(docs)
+    found[found] = docs[idx[found]] == doc_nums[found]
+    owner = np.repeat(np.arange(len(doc_nums)), np.diff(pos_ptr))
+    keep = found[owner]
+    return (idx[owner[keep]].astype(np.int64) << 32) | positions[keep].astype(np.int64)
+
+
+def phrase_matches(index, tokens, slop=0):
+    """(doc_nums, match counts) of docs containing tokens in order.
+
+    Consecutive tokens may be separated by extra tokens, at most slop of
+    them in total; slop=0 is an exact phrase. index is a PostingsReader,
+    SegmentedPostings or PositionalIndex built with full positions.
+    """
+    empty = np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+    reads = {token: index.read_term(token) for token in set(tokens)}
+    if any(read is None for read in reads.values()):
+        return empty
+    docs = intersect([read[0] for read in reads.values()])
+    if not len(docs):
+        return empty
+
+    keys = {token: _position_keys(read, docs) for token, read in reads.items()}
+    starts = keys[tokens[0]]
+    # Greedily take the next occurrence of each token after the previous
+    # one: the earliest choice gives the shortest span for every start
+    end = starts
+    ok = np.ones(len(starts), dtype=bool)
+    for token in tokens[1:]:
+        following = keys[token]
+        if not len(following):
+            return empty
+        idx = np.searchsorted(following, end, side='right')
+        ok &= idx < len(following)
+        end = following[np.minimum(idx, len(following) - 1)]
+    ok &= (end >> 32) == (starts >> 32)  # still in the same doc
+    ok &= (end - starts) - (len(tokens) - 1) <= slop
+
+    counts = np.bincount((starts[ok] >> 32).astype(np.int64), minlength=len(docs))
+    hit = counts > 0
+    return docs[hit], counts[hit]
+
+
+def match_phrases(index, phrases):
+    """Doc numbers that match every (tokens, slop) phrase"""
+    doc_lists = [phrase_matches(index, tokens, slop)[0] for tokens, slop in phrases]
+    return intersect(doc_lists)
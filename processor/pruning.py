@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Dynamic-pruning top-k retrieval (WAND) for CS-429 IR Project
+Evaluates a query over per-feature posting lists in windows of documents
+and skips documents whose score upper bound cannot enter the current top-k
+"""
+
+from operator import attrgetter
+import numpy as np
+
+from scoring import safe_norms, top_k
+from tfidf_store import load_term_major
+
+# Slack on the upper-bound test, so float rounding in the bound sum can
+# never prune a document that would make the top-k
+_BOUND_EPS = 1e-12
+# Docs scored together once the bounds pick a window's first doc
+WINDOW_DOCS = 1 << 16
+
+
+class ImpactIndex:
+    """Feature-major (CSC) copy of the TF-IDF matrix with doc norms and the
+    per-feature max of weight / norm.
+
+    Each entry also keeps its position within its CSR row, so a document's
+    score can be summed in the same order as the exhaustive matrix-vector
+    product and comes out bit-for-bit identical.
+    """
+
+    def __init__(self, indptr, docs, weights, row_rank, norms):
+        self.indptr = indptr
+        self.docs = docs
+        self.weights = weights
+        self.row_rank = row_rank
+        self.num_docs = len(norms)
+        self.norms = safe_norms(norms)
+        df = np.diff(indptr)
+        self.max_weight = np.zeros(len(df))
+        nonempty = df > 0
+        if nonempty.any():
+            normalized = np.asarray(weights) / self.norms[docs]
+            self.max_weight[nonempty] = np.maximum.reduceat(normalized, indptr[:-1][nonempty])
+        # Row positions fit 16 bits unless a doc has 65536+ features; NumPy
+        # sorts those stably with a radix sort
+        self.rank_dtype = np.uint16 if not len(row_rank) or row_rank.max() < 1 << 16 \
+            else row_rank.dtype
+
+    @classmethod
+    def load(cls, indexer_dir):
+        """Memory-mapped term-major copy written by the indexer"""
+        indptr, docs, weights, row_rank, norms = load_term_major(indexer_dir)
+        return cls(indptr, docs, weights, row_rank, norms)
+
+    @classmethod
+    def from_csr(cls, tfidf_matrix):
+        num_docs, num_features = tfidf_matrix.shape
+        row_ptr = np.asarray(tfidf_matrix.indptr, dtype=np.int64)
+        cols = np.asarray(tfidf_matrix.indices)
+        rows = np.repeat(np.arange(num_docs, dtype=np.int32), np.diff(row_ptr))
+        row_rank = np.arange(len(cols)) - np.repeat(row_ptr[:-1], np.diff(row_ptr))
+        data = np.asarray(tfidf_matrix.data)
+        norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=num_docs))
+        order = np.lexsort((rows, cols))
+        indptr = np.zeros(num_features + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cols, minlength=num_features), out=indptr[1:])
+        return cls(indptr, rows[order], data[order], row_rank[order].astype(np.int32), norms)
+
+
+class _Cursor:
+    """Position in one feature's posting list. The list stays a view of the
+    (memory-mapped) term-major arrays; only the postings a window covers
+    are read."""
+
+    __slots__ = ('docs', 'weights', 'ranks', 'qw', 'bound', 'pos', 'end', 'doc')
+
+    def __init__(self, index, col, qw):
+        lo, hi = index.indptr[col], index.indptr[col + 1]
+        self.docs = index.docs[lo:hi]
+        self.weights = index.weights[lo:hi]
+        self.ranks = index.row_rank[lo:hi]
+        self.qw = qw
+        self.bound = qw * float(index.max_weight[col])
+        self.pos = 0
+        self.end = hi - lo
+        self.doc = int(self.docs[0])
+
+    def seek(self, target):
+        """Position of the first posting at or after pos with doc >= target"""
+        return self.pos + int(np.searchsorted(self.docs[self.pos:], target))
+
+    def move_to(self, pos):
+        """Continue from pos; False once the list is exhausted"""
+        self.pos = pos
+        if pos == self.end:
+            return False
+        self.doc = int(self.docs[pos])
+        return True
+
+    def next_geq(self, target):
+        """Move to the first posting with doc >= target; False once the
+        list is exhausted"""
+        return self.move_to(self.seek(target))
+
+
+def _score_window(index, cursors, start, threshold):
+    """(docs, scores) of the docs in [start, start + WINDOW_DOCS) whose
+    summed bound can beat threshold, and the cursors still live after
+    moving past the window. Contributions are summed in CSR row order, as
+    in taat_top_k."""
+    ends = [cursor.seek(start + WINDOW_DOCS) for cursor in cursors]
+    spans = [(cursor, cursor.pos, end) for cursor, end in zip(cursors, ends) if end > cursor.pos]
+    local = np.concatenate([c.docs[lo:hi] for c, lo, hi in spans]) - start
+    size = max(int(c.docs[hi - 1]) for c, _, hi in spans) - start + 1
+    bounds = np.bincount(local, weights=np.concatenate(
+        [np.full(hi - lo, c.bound) for c, lo, hi in spans]), minlength=size)
+    candidate = bounds + _BOUND_EPS > threshold if threshold > 0.0 else bounds > 0.0
+    keep = candidate[local]
+    contribs = np.concatenate([c.weights[lo:hi] * c.qw for c, lo, hi in spans])[keep]
+    ranks = np.concatenate([c.ranks[lo:hi] for c, lo, hi in spans])[keep]
+    order = np.argsort(ranks.astype(index.rank_dtype), kind='stable')
+    acc = np.bincount(local[keep][order], weights=contribs[order], minlength=size)
+    docs = np.flatnonzero(candidate)
+    live = [cursor for cursor, end in zip(cursors, ends) if cursor.move_to(end)]
+    return docs + start, acc[docs] / index.norms[docs + start], live
+
+
+def wand_top_k(index, query_vec, k):
+    """(doc indices, scores) of the top k docs by cosine, best first.
+
+    Same ranking and scores as scoring.top_k over scoring.cosine_scores,
+    restricted to docs with a non-zero score.
+
+    WAND over doc windows: the cursors' summed upper bounds pick the next
+    doc that could beat the current k-th score (skipping the lists before
+    it with a binary search), then the WINDOW_DOCS docs from there are
+    scored together with NumPy, leaving out those whose own bound is too
+    low. Rare terms are skipped through; common terms cost about as much
+    as term-at-a-time scoring instead of a Python step per posting.
+    """
+    cursors = [_Cursor(index, col, qw)
+               for col, qw in zip(query_vec.indices.tolist(), query_vec.data.tolist())
+               if index.indptr[col + 1] > index.indptr[col]]
+    best_docs, best_scores = np.empty(0, dtype=np.int64), np.empty(0)
+    threshold = 0.0  # scores must beat this to enter a full top-k
+
+    while cursors and k > 0:
+        cursors.sort(key=attrgetter('doc'))
+
+        # Pivot: first cursor at which the summed bounds can beat the threshold
+        bound, pivot = 0.0, None
+        for i, cursor in enumerate(cursors):
+            bound += cursor.bound
+            if bound + _BOUND_EPS > threshold:
+                pivot = i
+                break
+        if pivot is None:
+            break
+        pivot_doc = cursors[pivot].doc
+
+        if cursors[0].doc < pivot_doc:
+            # No doc before pivot_doc can make it: skip the preceding lists ahead
+            cursors = [c for c in cursors[:pivot] if c.next_geq(pivot_doc)] + cursors[pivot:]
+            continue
+
+        docs, scores, cursors = _score_window(index, cursors, pivot_doc, threshold)
+        best = top_k(scores, k)
+        # Window docs all follow the current best, so a tie keeps the earlier doc
+        docs = np.concatenate((best_docs, docs[best]))
+        scores = np.concatenate((best_scores, scores[best]))
+        order = np.lexsort((docs, -scores))[:k]
+        best_docs, best_scores = docs[order], scores[order]
+        if len(best_docs) == k:
+            threshold = best_scores[-1]
+
+    return best_docs, best_scores
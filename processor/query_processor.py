@@ -4,90 +4,397 @@ Query Processor for CS-429 IR Project
 Flask API for processing queries and returning ranked results
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+import csv
+import io
 import json
-import pickle
+import os
+import signal
+import sys
+import time
+from itertools import product
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-import csv
 from pathlib import Path
 
+# Index file readers live next to the indexer that writes them
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "indexer"))
+from docstore import DOCSTORE_FILE, DocStore
+from lsi import IVFIndex, recall_at_k
+from postings import open_postings
+from query_vectorizer import QueryAnalyzer
+from tfidf_store import load_tfidf_matrix, load_vectorizer
+
+from batch import MAX_STREAM_CHUNK, STREAM_CHUNK, body_lines, read_queries, run_batch, stream_batch
+from bm25 import build_models
+from boolean import BooleanEvaluator, parse_boolean, positive_terms
+from cursors import CursorStore, decode_cursor, encode_cursor
+from hot_reload import IndexManager, get_index_version
+from metrics import Registry, StageClock
+from doclists import intersect
+from phrase import match_phrases, parse_query, tokenize
+from pruning import ImpactIndex, wand_top_k
+from result_cache import ResultCache
+from scoring import cosine_scores, top_k as select_top_k
+from snippets import make_snippet, snippet_terms
+from taat import taat_top_k
+
+ENGINES = ('exhaustive', 'wand', 'taat')
+MODELS = ('cosine', 'bm25', 'bm25f', 'lsi')
+BATCH_MODELS = ('cosine', 'bm25', 'bm25f')
+
 app = Flask(__name__)
 
-# Global variables for loaded data
-doc_ids = []
-doc_metadata = {}
-vectorizer = None
-tfidf_matrix = None
+# Metrics live in shared memory: prefork workers add to their own row and
+# /metrics sums all rows
+metrics = Registry()
+ENDPOINTS = ('/search', '/batch', '/batch/stream', '/health', '/metrics', '/admin/reload',
+             'other')
+STAGES = ('parse', 'filter', 'phrase', 'transform', 'score', 'topk', 'metadata', 'snippet',
+          'serialize')
+REQUESTS = metrics.counter(
+    'ir_http_requests_total', "HTTP requests by endpoint and status class",
+    ('endpoint', 'status'), product(ENDPOINTS, ('2xx', '3xx', '4xx', '5xx')))
+REQUEST_SECONDS = metrics.histogram(
+    'ir_http_request_duration_seconds', "HTTP request latency",
+    ('endpoint',), [(endpoint,) for endpoint in ENDPOINTS])
+STAGE_SECONDS = metrics.histogram(
+    'ir_query_stage_duration_seconds', "Query latency by stage",
+    ('stage',), [(stage,) for stage in STAGES])
+SEARCHES = metrics.counter(
+    'ir_searches_total', "Searches by engine and model",
+    ('engine', 'model'), product(ENGINES, MODELS))
+RESULT_COUNT = metrics.histogram(
+    'ir_search_results', "Results returned per search",
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 1000))
+CACHE_LOOKUPS = metrics.counter(
+    'ir_result_cache_lookups_total', "Result cache lookups",
+    ('result',), [('hit',), ('miss',)])
 
-def load_index(indexer_dir="../indexer"):
-    """Load all index components"""
-    global doc_ids, doc_metadata, vectorizer, tfidf_matrix
+# /search results by (normalized query, k); emptied when the index changes
+result_cache = ResultCache(max_entries=1024, ttl=300)
+# Ranked candidate lists for paging (offset / cursor), ~12 MB at most
+cursor_store = CursorStore(max_candidates=1 << 20, ttl=120)
+# Candidates ranked when a page is not stored: enough for several pages
+CURSOR_DEPTH = 100
+# Largest page (k) /search returns
+MAX_K = 1000
+
+def int_param(args, name, default=None, low=0, high=None):
+    """Integer request parameter, default if absent; ValueError unless it is
+    an integer in [low, high]"""
+    raw = args.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer") from None
+    if value < low or (high is not None and value > high):
+        bounds = f"between {low} and {high}" if high is not None else f">= {low}"
+        raise ValueError(f"{name} must be {bounds}")
+    return value
+
+class LoadedIndex:
+    """Every component of one index version"""
     
-    indexer_path = Path(indexer_dir)
+    def __init__(self, indexer_path, version):
+        indexer_path = Path(indexer_path)
+        self.version = version
+        
+        # Load doc IDs
+        with open(indexer_path / "doc_ids.json", 'r') as f:
+            self.doc_ids = json.load(f)
+        
+        # Load metadata
+        with open(indexer_path / "doc_metadata.json", 'r') as f:
+            self.doc_metadata = json.load(f)
+        
+        # Load TF-IDF components; the matrix arrays are memory-mapped, so
+        # every serving process shares them through the page cache
+        self.vectorizer = load_vectorizer(indexer_path)
+        # Per-query path: vocabulary / idf table compiled from the vectorizer
+        self.analyzer = QueryAnalyzer(self.vectorizer)
+        self.tfidf_matrix = load_tfidf_matrix(indexer_path, mmap_mode='r')
+        # Positional index, for phrase/proximity queries
+        self.postings = open_postings(indexer_path / "postings.bin")
+        # Term-major copy of tfidf_matrix and doc norms (WAND, TAAT)
+        self.impact_index = ImpactIndex.load(indexer_path)
+        # 'bm25' / 'bm25f' -> BM25F scorer
+        self.bm25_models = build_models(self.postings, self.doc_ids, self.doc_metadata, tokenize)
+        # LSI vectors + IVF lists, if the indexer built them
+        self.lsi_index = IVFIndex.load(indexer_path) if IVFIndex.exists(indexer_path) else None
+        # Compressed cleaned text, for snippets; only result docs are read
+        docstore_path = indexer_path / DOCSTORE_FILE
+        self.docstore = DocStore(docstore_path) if docstore_path.exists() else None
     
+    def close(self):
+        self.postings.close()
+        if self.docstore is not None:
+            self.docstore.close()
+
+# The served index. A rebuilt index is loaded in the background and swapped
+# in; queries still running on the old version finish on it
+def _on_swap(index):
+    result_cache.set_version(index.version)
+    cursor_store.set_version(index.version)
+
+index_manager = IndexManager(LoadedIndex, on_swap=_on_swap)
+
+def load_index(indexer_dir="../indexer"):
+    """Load all index components"""
     print("Loading index components...")
+    index_manager.open(indexer_dir)
+    index = index_manager.current
+    print(f"✓ Loaded index with {len(index.doc_ids)} documents (version {index.version})")
+
+def rank_documents(query_text, top_k=10, engine='exhaustive', model='cosine', nprobe=None,
+                   index=None, snippets=False, bool_filter=None):
+    """Rank documents for a query using cosine similarity (or BM25).
     
-    # Load doc IDs
-    with open(indexer_path / "doc_ids.json", 'r') as f:
-        doc_ids = json.load(f)
+    Returns the top_k as result dicts (see rank_candidates for the
+    options), with query-biased snippets if asked.
+    """
+    if index is None:
+        with index_manager.acquire() as index:
+            return rank_documents(query_text, top_k, engine, model, nprobe, index, snippets,
+                                  bool_filter)
+    clock = StageClock(STAGE_SECONDS)
+    top_indices, scores = rank_candidates(index, query_text, top_k, engine, model, nprobe, clock,
+                                          bool_filter)
+    return format_results(index, top_indices, scores, clock=clock,
+                          snippet_query=query_text if snippets else None)
+
+def rank_candidates(index, query_text, top_k=10, engine='exhaustive', model='cosine',
+                    nprobe=None, clock=None, bool_filter=None):
+    """(doc numbers, scores) of the top_k matching documents, best first.
     
-    # Load metadata
-    with open(indexer_path / "doc_metadata.json", 'r') as f:
-        doc_metadata = json.load(f)
+    engine='exhaustive' scores every document; engine='wand' walks the
+    query terms' posting lists and skips documents that cannot reach the
+    top k; engine='taat' accumulates only the query terms' postings (all
+    three rank identically). model='bm25' / 'bm25f' (title + body) score
+    from the inverted index instead of TF-IDF cosine. model='lsi' ranks by
+    cosine in LSI space, probing the nprobe nearest IVF lists (approximate;
+    the engine is ignored). Quoted parts ("a b"
+    or "a b"~k) must match as phrases; only the documents containing
+    every phrase are ranked. bool_filter (a parse_boolean tree) likewise
+    restricts ranking to its matches, found in the inverted index before
+    anything is scored; when they are few, cosine scores only them.
+    Documents scoring 0 are left out, unless they match a phrase or filter.
+    """
+    analyzer, impact_index, lsi_index = index.analyzer, index.impact_index, index.lsi_index
+    clock = clock or StageClock(STAGE_SECONDS)
     
-    # Load TF-IDF components
-    with open(indexer_path / "tfidf_vectorizer.pkl", 'rb') as f:
-        vectorizer = pickle.load(f)
+    text, phrases = parse_query(query_text)
+    clock.lap('parse')
     
-    with open(indexer_path / "tfidf_matrix.pkl", 'rb') as f:
-        tfidf_matrix = pickle.load(f)
+    # The only documents ranked, if the query restricts them (sorted)
+    candidates = None
+    if bool_filter is not None:
+        candidates = BooleanEvaluator(index.postings, len(index.doc_ids)).evaluate(bool_filter)
+        clock.lap('filter')
+    if phrases:
+        matched = match_phrases(index.postings, phrases)
+        candidates = matched if candidates is None else intersect([candidates, matched])
+        clock.lap('phrase')
+    filtered = candidates is not None
     
-    print(f"✓ Loaded index with {len(doc_ids)} documents")
-
-def rank_documents(query_text, top_k=10):
-    """Rank documents for a query using cosine similarity"""
-    # Vectorize query
-    query_vec = vectorizer.transform([query_text.lower()])
+    if model == 'lsi':
+        query_vec = None
+        query_lsi = lsi_index.project(analyzer.vector(text.lower()))
+        clock.lap('transform')
+        if filtered:
+            # Scored in one product: a subset's scores may differ in the last bit
+            similarities = lsi_index.scores(query_lsi)[candidates]
+            clock.lap('score')
+    elif model != 'cosine':
+        similarities = index.bm25_models[model].score(tokenize(text))
+        if filtered:
+            similarities = similarities[candidates]
+        query_vec = None
+        clock.lap('score')
+    else:
+        # Vectorize query
+        query_vec = analyzer.vector(text.lower())
+        clock.lap('transform')
     
-    # Calculate cosine similarity
-    similarities = cosine_similarity(query_vec, tfidf_matrix)[0]
+    # Get top-K indices and their scores (pruned engines select as they score)
+    if model == 'lsi' and not filtered:
+        top_indices, scores = lsi_index.search(query_lsi, top_k, nprobe)
+        clock.lap('score')
+    elif query_vec is not None and engine == 'wand' and not filtered:
+        top_indices, scores = wand_top_k(impact_index, query_vec, top_k)
+        clock.lap('score')
+    elif query_vec is not None and engine == 'taat' and not filtered:
+        top_indices, scores = taat_top_k(impact_index, query_vec, top_k)
+        clock.lap('score')
+    else:
+        if query_vec is not None and filtered and len(candidates) * 4 < len(index.doc_ids):
+            # Few matches: copying out their rows beats scoring every row
+            similarities = cosine_scores(query_vec, index.tfidf_matrix[candidates],
+                                         impact_index.norms[candidates])
+            clock.lap('score')
+        elif query_vec is not None:
+            similarities = cosine_scores(query_vec, index.tfidf_matrix, impact_index.norms)
+            if filtered:
+                similarities = similarities[candidates]
+            clock.lap('score')
+        top_indices = select_top_k(similarities, top_k)
+        scores = similarities[top_indices]
+        if filtered:
+            top_indices = candidates[top_indices]
+        clock.lap('topk')
     
-    # Get top-K indices
-    top_indices = np.argsort(similarities)[::-1][:top_k]
+    # Only documents with non-zero similarity (or a phrase / filter match);
+    # scores are in descending order, so this cuts a tail
+    if not filtered:
+        keep = int(np.count_nonzero(scores > 0))
+        top_indices, scores = top_indices[:keep], scores[:keep]
+    return top_indices, scores
+
+def format_results(index, top_indices, scores, first_rank=1, clock=None, snippet_query=None):
+    """Result dicts (rank, doc_id, score, url, title) of ranked documents.
     
-    # Build results
+    With snippet_query, each also gets a 'snippet' of its text biased
+    towards that query; the docs are read from the docstore, whose blocks
+    are decompressed only for these results.
+    """
+    doc_ids, doc_metadata = index.doc_ids, index.doc_metadata
     results = []
-    for rank, idx in enumerate(top_indices, 1):
-        score = similarities[idx]
-        if score > 0:  # Only include documents with non-zero similarity
-            doc_id = doc_ids[idx]
-            results.append({
-                'rank': rank,
-                'doc_id': doc_id,
-                'score': float(score),
-                'url': doc_metadata[doc_id]['url'],
-                'title': doc_metadata[doc_id]['title']
-            })
-    
+    for rank, (idx, score) in enumerate(zip(top_indices, scores), first_rank):
+        doc_id = doc_ids[idx]
+        results.append({
+            'rank': rank,
+            'doc_id': doc_id,
+            'score': float(score),
+            'url': doc_metadata[doc_id]['url'],
+            'title': doc_metadata[doc_id]['title']
+        })
+    if clock:
+        clock.lap('metadata')
+    if snippet_query is not None and results:
+        terms = snippet_terms(parse_query(snippet_query)[0], index.vectorizer.get_stop_words())
+        for result, text in zip(results, index.docstore.texts(top_indices)):
+            result['snippet'] = make_snippet(text, terms)
+        if clock:
+            clock.lap('snippet')
     return results
 
+def search_page(query, offset, k, engine, model, nprobe, index, use_stored=True,
+                snippets=False, filter_query=''):
+    """Results offset+1 .. offset+k of query, whether more follow, and
+    whether they came from a stored candidate list.
+    
+    The page is sliced from the query's stored candidate list when that is
+    deep enough; otherwise at least CURSOR_DEPTH (and twice the page's end)
+    candidates are ranked and stored, so the next pages are O(k).
+    """
+    clock = StageClock(STAGE_SECONDS)
+    key = CursorStore.key(query, model, nprobe, filter_query)
+    end = offset + k
+    entry = cursor_store.get(key) if use_stored else None
+    stored = entry is not None and (len(entry.doc_nums) >= end or entry.complete)
+    if not stored:
+        depth = max(CURSOR_DEPTH, 2 * end)
+        bool_filter = parse_boolean(filter_query) if filter_query else None
+        top_indices, scores = rank_candidates(index, query, depth, engine, model, nprobe, clock,
+                                              bool_filter)
+        entry = cursor_store.put(key, top_indices, scores, len(top_indices) < depth,
+                                 index.version)
+    results = format_results(index, entry.doc_nums[offset:end], entry.scores[offset:end],
+                             offset + 1, clock, query if snippets else None)
+    return results, end < len(entry.doc_nums) or not entry.complete, stored
+
 @app.route('/search', methods=['GET'])
 def search():
-    """Search endpoint"""
+    """Search endpoint
+    
+    &offset=N skips the first N results; the response's next_cursor
+    (&cursor=...) fetches the page after it. Paged requests rank a deeper
+    candidate list once and keep it, so later pages are sliced from it.
+    &snippets=1 adds a query-biased snippet to each result (pass it with
+    every page). &filter=<boolean query> (AND, OR, NOT in any case,
+    parentheses, phrases) ranks only the documents matching it; without
+    q, they are ranked by the filter's own non-negated terms.
+    """
     query = request.args.get('q', '')
-    top_k = int(request.args.get('k', 10))
+    engine = request.args.get('engine', 'exhaustive')
+    model = request.args.get('model', 'cosine')
+    use_cache = request.args.get('cache', '1') != '0'  # cache=0: always rank
+    snippets = request.args.get('snippets', '0') != '0'
+    filter_query = request.args.get('filter', '')
+    try:
+        top_k = int_param(request.args, 'k', 10, 1, MAX_K)
+        offset = int_param(request.args, 'offset')
+        # Absent: the index's default; more than nlist probes every list
+        nprobe = int_param(request.args, 'nprobe', low=1) if model == 'lsi' else None
+        if 'cursor' in request.args:
+            query, offset, k, engine, model, nprobe, filter_query = \
+                decode_cursor(request.args['cursor'])
+            top_k = int_param(request.args, 'k', min(k, MAX_K), 1, MAX_K)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
     
-    if not query:
+    bool_filter = None
+    if filter_query:
+        try:
+            bool_filter = parse_boolean(filter_query)
+        except ValueError as exc:
+            return jsonify({'error': f"Bad filter: {exc} (operators: AND, OR, NOT, "
+                                     f"parentheses and quoted phrases)"}), 400
+        query = query or " ".join(positive_terms(bool_filter))
+    if not query and bool_filter is None:
         return jsonify({'error': 'No query provided'}), 400
+    if engine not in ENGINES:
+        return jsonify({'error': f"Unknown engine '{engine}'"}), 400
+    if model not in MODELS:
+        return jsonify({'error': f"Unknown model '{model}'"}), 400
     
-    results = rank_documents(query, top_k)
+    cached = False
+    if offset is None:
+        # The engines rank identically, so they share cache entries
+        key = ResultCache.key(query, top_k, model, nprobe, snippets, filter_query)
+        results = result_cache.get(key) if use_cache else None
+        cached = results is not None
+        if use_cache:
+            CACHE_LOOKUPS.inc('hit' if cached else 'miss')
+    if not cached:
+        # Pinned: a reload during the query swaps in a new version, but
+        # this one stays open until the query is done
+        with index_manager.acquire() as index:
+            if model == 'lsi' and index.lsi_index is None:
+                return jsonify({'error': "No LSI index (build with --lsi-dims > 0)"}), 400
+            if snippets and index.docstore is None:
+                return jsonify({'error': f"No {DOCSTORE_FILE} (rebuild the index)"}), 400
+            if offset is None:
+                results = rank_documents(query, top_k, engine, model, nprobe, index, snippets,
+                                         bool_filter)
+            else:
+                results, has_more, cached = search_page(query, offset, top_k, engine, model,
+                                                        nprobe, index, use_cache, snippets,
+                                                        filter_query)
+        # Dropped if the index changed meanwhile
+        if use_cache and offset is None:
+            result_cache.put(key, results, index.version)
+    if offset is None:
+        offset, has_more = 0, len(results) == top_k
+    SEARCHES.inc(engine, model)
+    RESULT_COUNT.observe(len(results))
     
-    return jsonify({
+    clock = StageClock(STAGE_SECONDS)
+    response = jsonify({
         'query': query,
+        'filter': filter_query or None,
+        'model': model,
+        'offset': offset,
         'num_results': len(results),
-        'results': results
+        'cached': cached,
+        'results': results,
+        'next_cursor': encode_cursor(query, offset + top_k, top_k, engine, model, nprobe,
+                                     filter_query)
+                       if has_more else None
     })
+    clock.lap('serialize')
+    return response
 
 @app.route('/batch', methods=['POST'])
 def batch_process():
@@ -97,51 +404,154 @@ def batch_process():
     
     if not queries_file.exists():
         return jsonify({'error': 'queries.csv not found'}), 404
+    model = request.args.get('model', 'cosine')
+    if model not in BATCH_MODELS:
+        return jsonify({'error': f"Unknown model '{model}'"}), 400
     
-    # Read queries
-    with open(queries_file, 'r') as f:
-        reader = csv.DictReader(f)
-        queries = list(reader)
-    
-    # Process each query
-    all_results = []
-    for query_row in queries:
-        query_id = query_row['query_id']
-        query_text = query_row['query_text']
-        
-        results = rank_documents(query_text, top_k=10)
-        
-        for result in results:
-            all_results.append({
-                'query_id': query_id,
-                'doc_id': result['doc_id'],
-                'rank': result['rank'],
-                'score': result['score']
-            })
-    
-    # Write results
-    with open(results_file, 'w', newline='') as f:
-        if all_results:
-            writer = csv.DictWriter(f, fieldnames=['query_id', 'doc_id', 'rank', 'score'])
-            writer.writeheader()
-            writer.writerows(all_results)
+    # Vectorized: chunks of queries are scored with one sparse product each
+    # and results are streamed to the CSV
+    with index_manager.acquire() as index:
+        num_queries = run_batch(queries_file, results_file, index.vectorizer,
+                                index.tfidf_matrix, index.doc_ids, index.postings, top_k=10,
+                                scorer=index.bm25_models.get(model),
+                                norms=index.impact_index.norms)
     
     return jsonify({
         'status': 'success',
-        'queries_processed': len(queries),
+        'model': model,
+        'queries_processed': num_queries,
         'results_file': str(results_file)
     })
 
+# Upload formats of /batch/stream, by Content-Type
+NDJSON_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json')
+CSV_TYPES = ('text/csv', 'text/plain')
+
+@app.route('/batch/stream', methods=['POST'])
+def batch_stream():
+    """Rank queries uploaded as CSV or NDJSON; results stream back as NDJSON
+    
+    One line per query ({"query_id", "results"} or {"query_id", "error"}),
+    in upload order, sent per micro-batch while the rest is still being
+    uploaded. The whole stream runs on the index version it started on.
+    """
+    model = request.args.get('model', 'cosine')
+    try:
+        top_k = int_param(request.args, 'k', 10, 1, MAX_K)
+        chunk_size = int_param(request.args, 'chunk', STREAM_CHUNK, 1, MAX_STREAM_CHUNK)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    if model not in BATCH_MODELS:
+        return jsonify({'error': f"Unknown model '{model}'"}), 400
+    if request.mimetype not in NDJSON_TYPES + CSV_TYPES:
+        return jsonify({'error': "Upload text/csv or application/x-ndjson"}), 415
+    try:
+        # Reads the CSV header now, so a bad one is a 400, not a stream
+        queries = read_queries(body_lines(io.BufferedReader(request.stream)),
+                               ndjson=request.mimetype in NDJSON_TYPES)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    
+    def generate():
+        with index_manager.acquire() as index:
+            chunks = stream_batch(queries, index.vectorizer, index.tfidf_matrix, index.doc_ids,
+                                  index.postings, top_k, chunk_size,
+                                  scorer=index.bm25_models.get(model),
+                                  norms=index.impact_index.norms)
+            try:
+                for records in chunks:
+                    yield ''.join(json.dumps(record) + '\n' for record in records)
+            except (ValueError, csv.Error) as exc:
+                # Unreadable upload after the header (e.g. an overlong line)
+                yield json.dumps({'error': str(exc)}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    rule = request.url_rule.rule if request.url_rule else None
+    endpoint = rule if rule in ENDPOINTS else 'other'
+    status = f"{min(max(response.status_code // 100, 2), 5)}xx"
+    REQUESTS.inc(endpoint, status)
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics (text exposition format)"""
+    index = index_manager.current
+    reload_stats = index_manager.stats()
+    cache_stats = result_cache.stats()
+    # Per-process values: the worker that answers this scrape
+    gauges = [
+        ('ir_index_info', "Active index version", [({'version': index.version}, 1)]),
+        ('ir_index_documents', "Documents in the active index", [({}, len(index.doc_ids))]),
+        ('ir_index_load_seconds', "Duration of the last index load",
+         [({}, reload_stats['last_reload_seconds'] or 0)]),
+        ('ir_index_loaded_timestamp_seconds', "Unix time the active index was loaded",
+         [({}, index_manager.loaded_at or 0)]),
+        ('ir_index_reloads', "Index loads by this process", [({}, reload_stats['reloads'])]),
+        ('ir_index_reload_failures', "Failed index loads by this process",
+         [({}, reload_stats['failures'])]),
+        ('ir_result_cache_entries', "Entries in this process's result cache",
+         [({}, cache_stats['entries'])]),
+        ('ir_result_cache_evictions', "LRU evictions from this process's result cache",
+         [({}, cache_stats['evictions'])]),
+        ('ir_result_cache_expirations', "Expired entries in this process's result cache",
+         [({}, cache_stats['expirations'])]),
+        ('ir_cursor_candidates', "Candidates stored for paging by this process",
+         [({}, cursor_store.stats()['candidates'])]),
+    ]
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
+    with index_manager.acquire() as index:
+        return jsonify({
+            'status': 'healthy',
+            'documents': len(index.doc_ids),
+            'vocabulary': len(index.vectorizer.vocabulary_),
+            'index_version': index.version,
+            'reload': index_manager.stats(),
+            'result_cache': result_cache.stats(),
+            'cursors': cursor_store.stats(),
+            'lsi': {key: index.lsi_index.meta[key] for key in ('dims', 'nlist', 'nprobe')}
+                   if index.lsi_index else None
+        })
+
+def request_reload():
+    """Reload a rebuilt index in the background (every worker when served
+    by the prefork server)"""
+    import serve
+    if serve.is_worker():
+        os.kill(os.getppid(), signal.SIGHUP)
+    else:
+        index_manager.reload_async()
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """Pick up a rebuilt index without a restart (local requests only)"""
+    if request.remote_addr not in ('127.0.0.1', '::1'):
+        return jsonify({'error': 'Forbidden'}), 403
+    try:
+        on_disk = get_index_version(index_manager.indexer_path)
+    except (OSError, ValueError, KeyError) as exc:
+        return jsonify({'error': f"No readable index on disk: {exc}"}), 409
+    active = index_manager.current.version
+    if on_disk != active:
+        request_reload()
     return jsonify({
-        'status': 'healthy',
-        'documents': len(doc_ids),
-        'vocabulary': len(vectorizer.vocabulary_) if vectorizer else 0
-    })
+        'status': 'reloading' if on_disk != active else 'up to date',
+        'active_version': active,
+        'disk_version': on_disk
+    }), 202 if on_disk != active else 200
 
-def process_queries_standalone():
+def process_queries_standalone(model='cosine'):
     """Process queries without Flask (for notebook use)"""
     queries_file = Path("../queries/queries.csv")
     results_file = Path("../queries/results.csv")
@@ -150,52 +560,82 @@ def process_queries_standalone():
         print(f"Error: {queries_file} not found")
         return
     
-    # Read queries
-    with open(queries_file, 'r') as f:
-        reader = csv.DictReader(f)
-        queries = list(reader)
-    
-    print(f"Processing {len(queries)} queries...")
+    print(f"Processing queries from {queries_file} ({model})...")
+    index = index_manager.current
+    num_queries = run_batch(queries_file, results_file, index.vectorizer, index.tfidf_matrix,
+                            index.doc_ids, index.postings, top_k=10,
+                            scorer=index.bm25_models.get(model), norms=index.impact_index.norms,
+                            progress=lambda n: print(f"  {n} queries processed"))
     
-    # Process each query
-    all_results = []
-    for query_row in queries:
-        query_id = query_row['query_id']
-        query_text = query_row['query_text']
-        
-        print(f"  Query: {query_text}")
-        results = rank_documents(query_text, top_k=10)
-        print(f"    Found {len(results)} results")
-        
-        for result in results:
-            all_results.append({
-                'query_id': query_id,
-                'doc_id': result['doc_id'],
-                'rank': result['rank'],
-                'score': result['score']
-            })
-    
-    # Write results
-    with open(results_file, 'w', newline='') as f:
-        if all_results:
-            writer = csv.DictWriter(f, fieldnames=['query_id', 'doc_id', 'rank', 'score'])
-            writer.writeheader()
-            writer.writerows(all_results)
-    
-    print(f"✓ Results saved to {results_file}")
+    print(f"✓ Results for {num_queries} queries saved to {results_file}")
+
+def lsi_recall_report(k=10):
+    """Print recall@k of the IVF index against exhaustive LSI search for
+    the queries in queries.csv, per nprobe"""
+    queries_file = Path("../queries/queries.csv")
+    index = index_manager.current
+    lsi_index = index.lsi_index
+    if lsi_index is None:
+        print("Error: no LSI index (build with --lsi-dims > 0)")
+        return
+    with open(queries_file, 'r', newline='') as f:
+        texts = [parse_query(row['query_text'])[0].lower() for row in csv.DictReader(f)]
+    queries = [lsi_index.project(query_vec) for query_vec in index.vectorizer.transform(texts)]
+    nprobes = sorted({min(2**i, lsi_index.nlist) for i in range(lsi_index.nlist.bit_length() + 1)})
+    print(f"recall@{k} vs exhaustive LSI search, {len(queries)} queries, "
+          f"{lsi_index.nlist} lists (default nprobe {lsi_index.nprobe}):")
+    for row in recall_at_k(lsi_index, queries, k, nprobes):
+        print(f"  nprobe={row['nprobe']:<5} recall={row['recall']:.3f}  "
+              f"{row['ms_per_query']:.3f} ms/query")
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Query processor: batch mode or HTTP API")
+    parser.add_argument("mode", nargs="?", default="dev", choices=["dev", "batch", "serve", "recall"],
+                        help="dev: Flask debug server; batch: queries.csv -> results.csv; "
+                             "serve: prefork production server; "
+                             "recall: LSI/IVF recall@10 per nprobe on queries.csv")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="serve: worker processes (0 = one per core)")
+    parser.add_argument("--threads", type=int, default=8,
+                        help="serve: request threads per worker")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0,
+                        help="serve: seconds to let in-flight requests finish on shutdown")
+    parser.add_argument("--model", default="cosine", choices=BATCH_MODELS,
+                        help="batch: ranking model")
+    parser.add_argument("--watch", type=float, default=0,
+                        help="dev/serve: seconds between checks for a rebuilt index (0 = off)")
+    args = parser.parse_args()
+    
+    # Loaded once; serve mode forks after this, so workers share it
     load_index()
     
-    # If running standalone, process queries
-    import sys
-    if len(sys.argv) > 1 and sys.argv[1] == "batch":
-        process_queries_standalone()
+    if args.mode == "batch":
+        process_queries_standalone(args.model)
+    elif args.mode == "recall":
+        lsi_recall_report()
+    elif args.mode == "serve":
+        from serve import serve
+        index_manager.watch_interval = args.watch  # the master polls
+        workers = args.workers or os.cpu_count() or 1
+        metrics.allocate(rows=workers)
+        serve(app, host=args.host, port=args.port, workers=workers,
+              threads=args.threads, graceful_timeout=args.graceful_timeout,
+              reload=index_manager.reload, changed=index_manager.changed,
+              watch_interval=args.watch, worker_init=metrics.use_row)
     else:
+        if args.watch:
+            index_manager.watch(args.watch)
         # Start Flask server
-        print("\nStarting Flask server on http://localhost:5000")
+        print(f"\nStarting Flask server on http://localhost:{args.port}")
         print("Endpoints:")
         print("  GET  /search?q=your+query")
         print("  POST /batch")
+        print("  POST /batch/stream  (CSV or NDJSON body)")
         print("  GET  /health")
-        app.run(host='0.0.0.0', port=5000, debug=True)
+        print("  GET  /metrics")
+        print("  POST /admin/reload")
+        app.run(host=args.host, port=args.port, debug=True)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Query result cache for CS-429 IR Project
+LRU cache of ranked results with a size bound and a TTL, tagged with the
+index version it was filled from
+"""
+
+from collections import OrderedDict
+import re
+import threading
+import time
+
+
+def normalize_query(query):
+    """Cache key form of a query: lowercased, whitespace collapsed"""
+    return re.sub(r'\s+', ' ', query.lower()).strip()
+
+
+class ResultCache:
+    """Thread-safe LRU + TTL cache of search results.
+
+    Keys are (normalized query, k, ...options). set_version() drops every
+    entry when a different index version is loaded.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.version = None
+        self._entries = OrderedDict()  # key -> (expires_at, results)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    @staticmethod
+    def key(query, k, *options):
+        return (normalize_query(query), k) + options
+
+    def get(self, key):
+        """Cached results for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, results, version=None):
+        """Store results, unless they were computed on another index version"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entries[key] = (self.clock() + self.ttl, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def set_version(self, version):
+        """Switch to a new index version, dropping results of the old one"""
+        with self._lock:
+            if version != self.version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'index_version': self.version,
+            }
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Exhaustive scoring helpers for CS-429 IR Project
+Shared by the query engines so they rank (and break ties) identically
+"""
+
+import numpy as np
+
+
+def safe_norms(norms):
+    """Doc norms to divide scores by; empty docs get 1 (their score is 0)"""
+    norms = np.asarray(norms, dtype=np.float64)
+    return np.where(norms > 0, norms, 1.0)
+
+
+def cosine_scores(query_vec, tfidf_matrix, norms=None):
+    """Cosine similarity of one query against every document.
+
+    The query vector is L2-normalized by the vectorizer; with norms (see
+    safe_norms) each dot product is divided by its document's norm.
+    """
+    scores = tfidf_matrix.dot(query_vec.toarray().ravel())
+    if norms is not None:
+        scores /= norms
+    return scores
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores, best first.
+
+    Ties are broken by lower index, so every engine returns the same order.
+    Uses partial selection instead of sorting every score.
+    """
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    kth = np.partition(scores, n - k)[n - k]
+    above = np.flatnonzero(scores > kth)
+    tied = np.flatnonzero(scores == kth)[:k - len(above)]
+    idx = np.concatenate((above, tied))
+    return idx[np.lexsort((idx, -scores[idx]))]
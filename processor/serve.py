@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Prefork WSGI server for CS-429 IR Project
+The index is loaded once in the master, which then binds the listening
+socket and forks worker processes. Workers inherit the loaded index
+(memory-mapped arrays and copy-on-write pages), so N workers share one copy
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from wsgiref.simple_server import ServerHandler, WSGIRequestHandler, WSGIServer
+
+# Idle keep-alive connections are dropped after this many seconds
+KEEPALIVE_TIMEOUT = 5
+# A request whose client neither sends nor reads for this long is dropped
+# (a streamed response waits this long for a slow reader)
+REQUEST_TIMEOUT = 60
+# Request body bytes left unread by the application that are skipped to
+# keep the connection; with more left, the connection is closed
+MAX_DRAIN = 1 << 16
+
+# Set by serve() before forking, so workers can tell they are workers
+_master_pid = None
+
+
+def is_worker():
+    """True in a process forked by serve()"""
+    return _master_pid is not None and os.getpid() != _master_pid
+
+
+class _RequestBody:
+    """wsgi.input that ends at Content-Length and knows how much of the
+    body the application left unread"""
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def _limit(self, size):
+        return self.remaining if size is None or size < 0 else min(size, self.remaining)
+
+    def read(self, size=-1):
+        size = self._limit(size)
+        data = self.rfile.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        size = self._limit(size)
+        data = self.rfile.readline(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def drain(self, limit):
+        """Skip the unread rest (if at most limit bytes); whether the next
+        request can be read from the connection"""
+        if self.remaining > limit:
+            return False
+        while self.remaining and self.read(self.remaining):
+            pass
+        return self.remaining == 0
+
+
+class _ServerHandler(ServerHandler):
+    http_version = "1.1"
+    chunked = False
+
+    def cleanup_headers(self):
+        super().cleanup_headers()
+        # A body of unknown length (a streamed response) goes out chunked to
+        # HTTP/1.1 clients; for older ones it ends at connection close
+        if 'Content-Length' not in self.headers and \
+                self.request_handler.request_version == "HTTP/1.1":
+            self.headers['Transfer-Encoding'] = 'chunked'
+            self.chunked = True
+        self.keep_alive = 'Content-Length' in self.headers or self.chunked
+
+    def write(self, data):
+        if self.status and not self.headers_sent:
+            self.bytes_sent = len(data)  # Content-Length of a one-block body
+            self.send_headers()
+            self.bytes_sent = 0
+        if self.chunked:
+            if not data:
+                return
+            data = b"%x\r\n%s\r\n" % (len(data), data)
+        super().write(data)
+
+    def finish_content(self):
+        if self.chunked and self.headers_sent:
+            self._write(b"0\r\n\r\n")
+            self._flush()
+        else:
+            super().finish_content()
+
+    def handle_error(self):
+        # A response that failed part way leaves the connection unusable
+        self.keep_alive = False
+        super().handle_error()
+
+
+class _KeepAliveHandler(WSGIRequestHandler):
+    """HTTP/1.1 request handler: serves several requests per connection and
+    does not log each request to stderr"""
+
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT
+    # Headers and body go out in separate writes; with Nagle on, the body
+    # waits for the client's delayed ACK (~40 ms) on every kept-alive request
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        try:
+            while not self.server.stopping.is_set():
+                self.raw_requestline = self.rfile.readline(65537)
+                if not self.raw_requestline:
+                    return
+                if len(self.raw_requestline) > 65536:
+                    self.send_error(414)
+                    return
+                if not self.parse_request():
+                    return
+                if 'Transfer-Encoding' in self.headers:
+                    self.send_error(411, "Chunked request bodies are not supported")
+                    return
+                length = self.headers.get('Content-Length') or '0'
+                if not length.isdigit():
+                    self.send_error(400, "Bad Content-Length")
+                    return
+                body = _RequestBody(self.rfile, int(length))
+                handler = _ServerHandler(body, self.wfile, self.get_stderr(),
+                                         self.get_environ(), multithread=True)
+                handler.keep_alive = False
+                handler.request_handler = self
+                self.connection.settimeout(REQUEST_TIMEOUT)
+                handler.run(self.server.get_app())
+                self.connection.settimeout(self.timeout)
+                if self.close_connection or not handler.keep_alive or not body.drain(MAX_DRAIN):
+                    return
+        except (socket.timeout, ConnectionError):
+            return
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _PooledWSGIServer(WSGIServer):
+    """WSGIServer that handles requests on a bounded thread pool.
+
+    Takes an already bound, listening socket shared with the other workers.
+    """
+
+    def __init__(self, sock, app, threads):
+        super().__init__(sock.getsockname()[:2], _KeepAliveHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.server_name, self.server_port = sock.getsockname()[:2]
+        self.setup_environ()
+        self.set_app(app)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.stopping = threading.Event()  # close keep-alive connections
+
+    def server_bind(self):
+        pass  # the master already bound the socket
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        self.stopping.set()
+        self.pool.shutdown(wait=True)  # let in-flight requests finish
+        super().server_close()
+
+
+def _run_worker(sock, app, threads, reload=None):
+    server = _PooledWSGIServer(sock, app, threads)
+
+    def stop(signum, frame):
+        server.stopping.set()
+        # shutdown() blocks until serve_forever returns, so not in this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the master handles Ctrl-C
+    if reload is not None:
+        # Load in the background; requests keep being served meanwhile
+        signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+            target=reload, daemon=True).start())
+        # A respawned worker may have been forked before the last reload
+        threading.Thread(target=reload, daemon=True).start()
+    else:
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    try:
+        server.serve_forever(poll_interval=0.5)
+    finally:
+        server.server_close()
+    os._exit(0)
+
+
+def serve(app, host='0.0.0.0', port=5000, workers=None, threads=8,
+          graceful_timeout=30.0, backlog=1024, reload=None, changed=None,
+          watch_interval=0, worker_init=None):
+    """Serve app with `workers` forked processes of `threads` threads each.
+
+    Load everything the app needs before calling this. SIGTERM or SIGINT
+    stops accepting connections, lets workers finish their requests for up
+    to graceful_timeout seconds, then kills any that are left. Workers that
+    die are replaced.
+
+    reload() loads the app's data again if it changed. SIGHUP to the master
+    (or changed() turning true, checked every watch_interval seconds) runs
+    it in every worker in the background, then in the master so that
+    workers forked later start from the new data.
+
+    worker_init(slot) runs in each new worker; slots are 0..workers-1 and a
+    replacement worker gets the slot of the one it replaces.
+    """
+    global _master_pid
+    if not hasattr(os, 'fork'):
+        raise RuntimeError("prefork serving needs os.fork (use the dev server on Windows)")
+    workers = workers or os.cpu_count() or 1
+    _master_pid = os.getpid()
+
+    sock = socket.create_server((host, port), backlog=backlog)
+    sock.set_inheritable(True)
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                if worker_init is not None:
+                    worker_init(slot)
+                _run_worker(sock, app, threads, reload)
+            finally:
+                os._exit(1)
+        return pid
+
+    stopping, reloading = [], []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGHUP, lambda signum, frame: reloading.append(signum))
+    next_check = time.monotonic() + watch_interval
+
+    children = {}  # pid -> slot
+    for slot in range(workers):
+        children[spawn(slot)] = slot
+    print(f"Serving on http://{host}:{port} with {workers} workers x {threads} threads "
+          f"(master pid {os.getpid()})")
+    sys.stdout.flush()
+
+    while not stopping:
+        if watch_interval and changed is not None and time.monotonic() >= next_check:
+            if changed():
+                reloading.append(None)
+            next_check = time.monotonic() + watch_interval
+        if reloading and reload is not None:
+            reloading.clear()
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGHUP)
+                except ProcessLookupError:
+                    pass
+            if reload():
+                print("  Reloaded")
+                sys.stdout.flush()
+        reloading.clear()
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid and pid in children:
+            slot = children.pop(pid)
+            if not stopping:
+                print(f"  worker {pid} exited (status {status}), restarting")
+                children[spawn(slot)] = slot
+        else:
+            time.sleep(0.2)
+
+    print("Shutting down: waiting for in-flight requests...")
+    sock.close()
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + graceful_timeout
+    while children and time.monotonic() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            children.clear()
+            break
+        if pid:
+            children.pop(pid, None)
+        else:
+            time.sleep(0.1)
+    for pid in children:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    print("Server stopped")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Query-biased snippets for CS-429 IR Project
+Picks the window of a document's cleaned text (from the indexer's docstore)
+that covers the most query terms, and marks where they occur
+"""
+
+from phrase import tokenize
+
+SNIPPET_TOKENS = 30
+ELLIPSIS = "..."
+
+
+def snippet_terms(query_text, stop_words=()):
+    """Distinct query tokens worth highlighting (stop words dropped)"""
+    return frozenset(t for t in tokenize(query_text) if t not in stop_words)
+
+
+def best_window(positions, terms_at, num_tokens, width):
+    """Start of the width-token window covering the most distinct query
+    terms, then the most hits; ties go to the earliest window"""
+    best, best_start = (0, 0), 0
+    counts = {}
+    lo = 0
+    # Windows ending at each hit: slide lo past hits that fall out
+    for hi, pos in enumerate(positions):
+        counts[terms_at[hi]] = counts.get(terms_at[hi], 0) + 1
+        while positions[lo] <= pos - width:
+            term = terms_at[lo]
+            counts[term] -= 1
+            if not counts[term]:
+                del counts[term]
+            lo += 1
+        score = (len(counts), hi - lo + 1)
+        if score > best:
+            # Center the covered span inside the window
+            slack = width - (pos - positions[lo] + 1)
+            best_start = max(0, min(positions[lo] - slack // 2, num_tokens - width))
+            best = score
+    return best_start
+
+
+def make_snippet(text, terms, width=SNIPPET_TOKENS):
+    """{'text': window of cleaned text, 'highlights': [[start, end], ...]}.
+
+    highlights are character ranges of the query terms within 'text'. A
+    document without any of the terms gets its opening words.
+    """
+    tokens = text.split()
+    positions = [i for i, token in enumerate(tokens) if token in terms]
+    start = best_window(positions, [tokens[i] for i in positions], len(tokens), width) \
+        if positions else 0
+    end = min(start + width, len(tokens))
+
+    parts, highlights = [], []
+    offset = 0
+    if start > 0:
+        parts.append(ELLIPSIS)
+        offset = len(ELLIPSIS) + 1
+    for token in tokens[start:end]:
+        if token in terms:
+            highlights.append([offset, offset + len(token)])
+        parts.append(token)
+        offset += len(token) + 1
+    if end < len(tokens):
+        parts.append(ELLIPSIS)
+    return {'text': " ".join(parts), 'highlights': highlights}
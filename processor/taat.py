@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Term-at-a-time accumulator scoring for CS-429 IR Project
+Gathers only the query terms' columns of the term-major TF-IDF copy, so the
+work grows with the query's postings, not with the number of documents
+"""
+
+import numpy as np
+
+from scoring import top_k
+
+# Use a dense (one slot per doc) accumulator once the query's postings are
+# at least this fraction of the collection; below it, a sparse one over
+# just the touched docs
+DENSE_FRACTION = 1 / 16
+
+
+def gather(index, query_vec):
+    """(doc numbers, weighted contributions, CSR row positions) of every
+    posting of the query's features"""
+    spans = [(index.indptr[col], index.indptr[col + 1], qw)
+             for col, qw in zip(query_vec.indices.tolist(), query_vec.data.tolist())]
+    spans = [(lo, hi, qw) for lo, hi, qw in spans if hi > lo]
+    if not spans:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0, dtype=np.int32)
+    docs = np.concatenate([index.docs[lo:hi] for lo, hi, _ in spans])
+    contribs = np.concatenate([index.weights[lo:hi] * qw for lo, hi, qw in spans])
+    ranks = np.concatenate([index.row_rank[lo:hi] for lo, hi, _ in spans])
+    return docs, contribs, ranks
+
+
+def taat_top_k(index, query_vec, k, dense=None):
+    """(doc indices, scores) of the top k docs by cosine, best first.
+
+    Same ranking and scores as scoring.top_k over scoring.cosine_scores,
+    restricted to docs with a non-zero score: contributions are added in
+    CSR row order, as the matrix-vector product does. dense=None picks the
+    accumulator from the query's postings count (see DENSE_FRACTION).
+    """
+    docs, contribs, ranks = gather(index, query_vec)
+    if not len(docs) or k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    if dense is None:
+        dense = len(docs) >= index.num_docs * DENSE_FRACTION
+
+    order = np.argsort(ranks, kind='stable')
+    if dense:
+        acc = np.bincount(docs[order], weights=contribs[order], minlength=index.num_docs)
+        touched = np.flatnonzero(acc)
+        acc = acc[touched]
+    else:
+        touched, slot = np.unique(docs, return_inverse=True)
+        acc = np.bincount(slot[order], weights=contribs[order], minlength=len(touched))
+    scores = acc / index.norms[touched]
+    best = top_k(scores, k)
+    return touched[best].astype(np.int64), scores[best]
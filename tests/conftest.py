@@ -0,0 +1,54 @@
+"""
+Shared test setup for CS-429 IR Project
+Puts indexer/ and processor/ on the import path (the scripts import each
+other by module name) and generates small synthetic HTML corpora
+"""
+
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT / "indexer"), str(ROOT / "processor")]
+
+# Common words recur (and form repeated bigrams); rare ones give long tails
+WORDS = ("information retrieval search engine index query document ranking vector "
+         "space model term weight frequency inverse cosine similarity relevance "
+         "feedback precision recall boolean phrase proximity compression posting "
+         "list merge segment cache crawler web page link anchor text").split()
+
+
+def write_doc(html_dir, doc_id, title, body, url=None):
+    """Write one document in the crawler's format; returns its path"""
+    path = Path(html_dir) / f"{doc_id}.html"
+    path.write_text(f"<!-- URL: {url or 'http://example.org/' + doc_id} -->\n"
+                    f"<html><head><title>{title}</title></head>"
+                    f"<body><p>{body}</p><script>var hidden = 1;</script></body></html>",
+                    encoding='utf-8')
+    return path
+
+
+def write_corpus(html_dir, num_docs, seed=0, prefix="doc"):
+    """num_docs random documents named {prefix}{i:05d}.html"""
+    rng = random.Random(seed)
+    html_dir = Path(html_dir)
+    html_dir.mkdir(parents=True, exist_ok=True)
+    for i in range(num_docs):
+        words = [rng.choice(WORDS) if rng.random() < 0.7 else f"w{rng.randint(0, 400)}"
+                 for _ in range(rng.randint(20, 120))]
+        title = " ".join(rng.sample(WORDS, 3)).title()
+        write_doc(html_dir, f"{prefix}{i:05d}", title, " ".join(words))
+    return html_dir
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """html/ with 60 synthetic documents"""
+    return write_corpus(tmp_path / "html", 60)
+
+
+def index_files(output_dir, names):
+    """{name: bytes} of the given index files"""
+    return {name: (Path(output_dir) / name).read_bytes() for name in names}
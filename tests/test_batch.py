@@ -0,0 +1,81 @@
+"""Batch ranking: run_batch, row-wise top-k selection and uploaded queries"""
+
+import csv
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from batch import batch_top_k, read_queries, run_batch
+from build_index import TFIDF_PARAMS
+from conftest import WORDS
+from phrase import match_phrases, parse_query, tokenize
+from postings import PositionalIndex
+from scoring import cosine_scores, safe_norms, top_k
+
+TEXTS = [" ".join(WORDS[i:i + 6]) for i in range(len(WORDS) - 5)] * 2
+QUERIES = ["vector space", '"space model"', "nothing", "index query document", "web"]
+
+
+def test_read_csv():
+    lines = ["query_id,query_text\n", "q1,web search\n", ",index\n"]
+    assert list(read_queries(iter(lines))) == [('q1', "web search", None), (2, "index", None)]
+    # The header is checked before any row is asked for
+    with pytest.raises(ValueError):
+        read_queries(iter(["id,text\n", "1,a\n"]))
+    assert list(read_queries(iter([]))) == []
+
+
+def test_bad_csv_row_is_an_error_record():
+    huge = "x" * 60000
+    lines = ["query_text\n", "a\n", f'"{huge}\n', f"{huge}\n", f'{huge}"\n', "b\n"]
+    records = list(read_queries(iter(lines)))
+    assert [text for _, text, _ in records] == ["a", None, "b"]
+    assert records[1][0] == 2 and "field limit" in records[1][2]
+    assert records[2][0] == 3
+
+
+def test_read_ndjson():
+    lines = ['{"query_id": 7, "q": "a"}\n', "\n", "not json\n", "[1]\n", '{"x": 1}\n']
+    assert list(read_queries(iter(lines), ndjson=True)) == [
+        (7, "a", None), (2, None, "invalid JSON"), (3, None, "expected a JSON object"),
+        (4, None, "missing query_text")]
+
+
+def test_batch_top_k_matches_single_query():
+    rng = np.random.default_rng(0)
+    # Few distinct values, so many ties at the k-th score
+    scores = rng.integers(0, 4, size=(20, 50)).astype(float)
+    idx, picked = batch_top_k(scores, 7)
+    for row in range(len(scores)):
+        want = top_k(scores[row], 7)
+        np.testing.assert_array_equal(idx[row], want)
+        np.testing.assert_array_equal(picked[row], scores[row][want])
+
+
+def test_run_batch_matches_single_queries(tmp_path):
+    vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
+    matrix = vectorizer.fit_transform(TEXTS)
+    norms = safe_norms(np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1)
+    postings = PositionalIndex.build(map(tokenize, TEXTS))
+    doc_ids = [f"d{i}" for i in range(len(TEXTS))]
+    with open(tmp_path / "queries.csv", 'w', newline='') as f:
+        csv.writer(f).writerows([("query_id", "query_text")] + list(enumerate(QUERIES)))
+
+    assert run_batch(tmp_path / "queries.csv", tmp_path / "results.csv", vectorizer, matrix,
+                     doc_ids, postings, top_k=4, chunk_size=2, norms=norms) == len(QUERIES)
+    with open(tmp_path / "results.csv", newline='') as f:
+        got = [(int(q), d, int(r), float(s)) for q, d, r, s in list(csv.reader(f))[1:]]
+
+    want = []
+    for n, query in enumerate(QUERIES):
+        text, phrases = parse_query(query)
+        scores = cosine_scores(vectorizer.transform([text.lower()]), matrix, norms)
+        if phrases:
+            keep = np.zeros(len(scores), dtype=bool)
+            keep[match_phrases(postings, phrases)] = True
+            scores[~keep] = -np.inf
+        best = top_k(scores, 4)
+        best = best[(scores[best] > 0) | (bool(phrases) & np.isfinite(scores[best]))]
+        want += [(n, doc_ids[d], rank, scores[d]) for rank, d in enumerate(best, 1)]
+    assert got == want
@@ -0,0 +1,62 @@
+"""BM25 / BM25F scores against the textbook formula"""
+
+import math
+
+import numpy as np
+import pytest
+
+from bm25 import BM25F, build_models
+from phrase import tokenize
+from postings import PositionalIndex
+
+DOCS = ["web search engine", "search search search the web", "engine", "",
+        "web crawler for the web search engine index"]
+TITLES = ["Search", "Engines", "Web search", "Empty", "Crawler"]
+
+
+def _bm25(docs, query, k1=1.2, b=0.75):
+    """Per-doc BM25, term by term"""
+    tokens = [doc.split() for doc in docs]
+    avg = sum(map(len, tokens)) / len(tokens)
+    scores = []
+    for words in tokens:
+        score = 0.0
+        for term in query.split():
+            df = sum(term in other for other in tokens)
+            tf = words.count(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(words) / avg))
+        scores.append(score)
+    return scores
+
+
+@pytest.mark.parametrize("query", ["web", "search engine", "web web crawler", "missing"])
+def test_bm25_matches_formula(query):
+    index = PositionalIndex.build(doc.split() for doc in DOCS)
+    model = BM25F([(index, [len(doc.split()) for doc in DOCS], 1.0, 0.75)], len(DOCS))
+    np.testing.assert_allclose(model.score(query.split()), _bm25(DOCS, query), rtol=1e-12)
+
+
+def test_bm25f_matches_formula():
+    index = PositionalIndex.build(map(tokenize, DOCS))
+    metadata = {str(i): {'length': len(tokenize(doc)), 'title': title}
+                for i, (doc, title) in enumerate(zip(DOCS, TITLES))}
+    models = build_models(index, [str(i) for i in range(len(DOCS))], metadata, tokenize)
+    np.testing.assert_allclose(models['bm25'].score(["search"]), _bm25(DOCS, "search"),
+                               rtol=1e-12)
+
+    # Title weight 2, b 0.5; body b 0.75; df counts docs with either field
+    body, title = [d.split() for d in DOCS], [tokenize(t) for t in TITLES]
+    avg_body, avg_title = np.mean([len(d) for d in body]), np.mean([len(t) for t in title])
+    df = sum("search" in b or "search" in t for b, t in zip(body, title))
+    idf = math.log(1 + (len(DOCS) - df + 0.5) / (df + 0.5))
+    want = []
+    for b, t in zip(body, title):
+        tf = (b.count("search") / (0.25 + 0.75 * len(b) / avg_body) +
+              2 * t.count("search") / (0.5 + 0.5 * len(t) / avg_title))
+        want.append(idf * tf * 2.2 / (tf + 1.2))
+    scores = models['bm25f'].score(["search"])
+    np.testing.assert_allclose(scores, want, rtol=1e-12)
+    assert scores[2] > 0  # title-only match
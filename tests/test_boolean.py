@@ -0,0 +1,53 @@
+"""Boolean filter parsing and evaluation against a brute-force scan"""
+
+import numpy as np
+import pytest
+
+from boolean import BooleanEvaluator, parse_boolean, positive_terms
+from phrase import tokenize
+from postings import PositionalIndex
+
+DOCS = ["apple banana cherry", "apple cherry", "banana date", "cherry date apple",
+        "and or not", "banana apple split"]
+
+
+@pytest.fixture
+def evaluator():
+    return BooleanEvaluator(PositionalIndex.build(map(tokenize, DOCS)), len(DOCS))
+
+
+def test_precedence():
+    assert parse_boolean("a OR b c") == ('or', [('term', 'a'), ('and', [('term', 'b'),
+                                                                       ('term', 'c')])])
+    assert parse_boolean("NOT a AND (b OR c)") == \
+        ('and', [('not', ('term', 'a')), ('or', [('term', 'b'), ('term', 'c')])])
+    assert parse_boolean('"a b"~2') == ('phrase', ['a', 'b'], 2)
+
+
+def test_operators_in_any_case():
+    assert parse_boolean("a or not b") == parse_boolean("a OR NOT b")
+    assert parse_boolean('"and"') == ('phrase', ['and'], 0)
+
+
+@pytest.mark.parametrize("query", ["", "a AND", "(a OR b", "OR a", 'a "b', "a )"])
+def test_malformed(query):
+    with pytest.raises(ValueError):
+        parse_boolean(query)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("apple AND cherry", [0, 1, 3]),
+    ("apple NOT banana", [1, 3]),
+    ("date OR split", [2, 3, 5]),
+    ("(apple OR date) AND NOT cherry", [2, 5]),
+    ('"banana apple"', [5]),
+    ('"apple cherry"~1', [0, 1]),
+    ('"and" "or"', [4]),
+    ("apple AND missing", []),
+])
+def test_evaluate(evaluator, query, expected):
+    np.testing.assert_array_equal(evaluator.evaluate(parse_boolean(query)), expected)
+
+
+def test_positive_terms():
+    assert positive_terms(parse_boolean('a NOT b OR "c d"')) == ['a', 'c', 'd']
@@ -0,0 +1,64 @@
+"""Full builds: HTML extraction, parallel loading and --profile"""
+
+import json
+
+import numpy as np
+import pytest
+
+import build_stats
+from build_index import INDEX_FILES, SearchIndexer
+from build_stats import BuildProfiler
+from conftest import index_files, write_doc
+
+
+def _build(html, out, **kwargs):
+    out.mkdir()
+    SearchIndexer(html, out, cache=False, lsi_dims=0, **kwargs).build()
+
+
+def test_extract_from_html(tmp_path):
+    path = write_doc(tmp_path, "page", "A Title", "Body, with <b>markup</b>!",
+                     url="http://example.org/x")
+    url, title, text = SearchIndexer.extract_from_html(path.read_text())
+    assert (url, title) == ("http://example.org/x", "A Title")
+    assert "hidden" not in text
+    assert SearchIndexer.clean_text(text) == "a title body with markup"
+
+
+def test_parallel_build_matches_serial(corpus, tmp_path):
+    _build(corpus, tmp_path / "serial")
+    _build(corpus, tmp_path / "parallel", workers=3, chunksize=2)
+    assert index_files(tmp_path / "parallel", INDEX_FILES) == \
+        index_files(tmp_path / "serial", INDEX_FILES)
+
+
+def test_profile(corpus, tmp_path):
+    _build(corpus, tmp_path / "plain")
+    _build(corpus, tmp_path / "profiled", workers=2, profile=True)
+    # Profiling only observes the build
+    assert index_files(tmp_path / "profiled", INDEX_FILES) == \
+        index_files(tmp_path / "plain", INDEX_FILES)
+
+    stats = json.loads((tmp_path / "profiled" / "build_stats.json").read_text())
+    assert stats['mode'] == "build" and stats['documents'] == 60 and stats['workers'] == 2
+    stages = {s['stage']: s for s in stats['stages']}
+    assert {'load_documents', 'build_inverted_index', 'build_tfidf',
+            'write_postings'} <= set(stages)
+    assert stages['write_postings']['output_bytes'] == \
+        (tmp_path / "profiled" / "postings.bin").stat().st_size
+    per_doc = {s['stage']: s['calls'] for s in stats['per_document']}
+    assert per_doc == {'read_html': 60, 'parse_html': 60, 'clean_text': 60}
+
+
+def test_stage_peak_rss_is_per_stage():
+    if build_stats._rss_since_reset_mb() is None or not build_stats._reset_peak_rss():
+        pytest.skip("needs /proc/self/clear_refs")
+    profiler = BuildProfiler()
+    with profiler.stage('big'):
+        block = np.ones(40 << 17)  # 40 MB
+        del block
+    with profiler.stage('small'):
+        pass
+    big, small = (s['peak_rss_mb'] for s in profiler.stages)
+    assert big - small > 30
+    assert profiler.to_dict()['total']['peak_rss_mb'] >= big
@@ -0,0 +1,98 @@
+"""Pagination cursors and the candidate store"""
+
+import base64
+import json
+
+import numpy as np
+import pytest
+
+from cursors import CursorStore, decode_cursor, encode_cursor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _token(state):
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+
+@pytest.mark.parametrize("state", [
+    ("web search", 10, 5, "wand", "cosine", None, ""),
+    ("naïve “quotes” & =", 0, 1000, "taat", "lsi", 4, '"vector space" AND NOT web'),
+])
+def test_round_trip(state):
+    token = encode_cursor(*state)
+    assert "=" not in token and "+" not in token and "/" not in token
+    assert decode_cursor(token) == state
+
+
+@pytest.mark.parametrize("token", [
+    "", "!!!", "bm90IGpzb24", _token([1, 2]), _token(["q", 0, 5, "wand", "cosine", None]),
+    _token([5, 0, 5, "wand", "cosine", None, ""]),
+    _token(["q", -1, 5, "wand", "cosine", None, ""]),
+    _token(["q", 0, 0, "wand", "cosine", None, ""]),
+    _token(["q", "0", 5, "wand", "cosine", None, ""]),
+    _token(["q", 0, 5, "wand", "lsi", 0, ""]),
+    _token(["q", 0, 5, "wand", "lsi", "all", ""]),
+])
+def test_malformed(token):
+    with pytest.raises(ValueError, match="malformed cursor"):
+        decode_cursor(token)
+
+
+def test_key_normalizes_query():
+    assert CursorStore.key("Web  SEARCH", "cosine", None) == \
+        CursorStore.key("web search", "cosine", None)
+    assert CursorStore.key("web", "cosine", None) != CursorStore.key("web", "bm25", None)
+
+
+def test_put_get():
+    store = CursorStore()
+    store.put("a", np.array([3, 1, 2]), [0.9, 0.5, 0.1], complete=True)
+    entry = store.get("a")
+    assert entry.doc_nums.tolist() == [3, 1, 2] and entry.doc_nums.dtype == np.int32
+    assert entry.scores.tolist() == [0.9, 0.5, 0.1] and entry.complete
+    assert store.get("b") is None
+    assert (store.stats()['hits'], store.stats()['misses']) == (1, 1)
+
+
+def test_evicts_least_recently_used_by_candidates():
+    store = CursorStore(max_candidates=5)
+    store.put("a", np.arange(2), np.zeros(2), False)
+    store.put("b", np.arange(2), np.zeros(2), False)
+    store.get("a")
+    store.put("c", np.arange(2), np.zeros(2), False)
+    assert store.get("b") is None and store.get("a") and store.get("c")
+    assert store.stats()['candidates'] == 4 and store.stats()['evictions'] == 1
+    # Too large on its own: returned but not stored
+    assert len(store.put("d", np.arange(6), np.zeros(6), True).doc_nums) == 6
+    assert store.get("d") is None and store.stats()['entries'] == 2
+
+
+def test_ttl_extended_by_hits():
+    clock = FakeClock()
+    store = CursorStore(ttl=10, clock=clock)
+    store.put("a", np.arange(1), np.zeros(1), True)
+    clock.now = 8
+    assert store.get("a") is not None
+    clock.now = 17
+    assert store.get("a") is not None
+    clock.now = 27
+    assert store.get("a") is None
+    assert store.stats()['expirations'] == 1 and store.stats()['candidates'] == 0
+
+
+def test_version():
+    store = CursorStore()
+    store.set_version("v1")
+    store.put("a", np.arange(1), np.zeros(1), True, version="v1")
+    # Ranked on an index that is no longer current
+    store.put("b", np.arange(1), np.zeros(1), True, version="v0")
+    assert store.get("a") is not None and store.get("b") is None
+    store.set_version("v2")
+    assert store.get("a") is None and store.stats()['candidates'] == 0
@@ -0,0 +1,77 @@
+"""Compressed docstore: round trip, block copying on update"""
+
+import json
+import zlib
+
+import pytest
+
+import docstore
+from conftest import ROOT
+from docstore import DocStore, write_docstore
+
+
+def _docs(n, prefix="d"):
+    return [(f"{prefix}{i}", f"http://example.org/{i}", f"Title {i}",
+             " ".join(f"word{i % 7} text{j}" for j in range(40 + i % 13))) for i in range(n)]
+
+
+def test_round_trip_across_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(docstore, "MAX_BLOCK_DOCS", 4)
+    docs = _docs(30)
+    write_docstore(tmp_path / "ds.bin", docs)
+    with DocStore(tmp_path / "ds.bin") as store:
+        assert len(store) == 30 and len(store.block_rows) == 8
+        picked = [17, 2, 29, 3]
+        assert store.texts(picked) == [docs[i][3] for i in picked]
+        assert store.get(picked, text=False)[0] == {
+            'doc_id': "d17", 'url': "http://example.org/17", 'title': "Title 17"}
+
+
+def test_update_copies_unchanged_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(docstore, "MAX_BLOCK_DOCS", 4)
+    old = _docs(16)
+    write_docstore(tmp_path / "old.bin", old)
+    new_doc = ("n0", "http://example.org/n0", "New", "brand new text")
+    with DocStore(tmp_path / "old.bin") as previous:
+        # Docs 0-3 (block 0) and 8-11 (block 2) survive; a new doc goes between
+        wanted = [0, 1, 2, 3, new_doc, 8, 9, 10, 11]
+        compress = zlib.compress
+        calls = []
+        monkeypatch.setattr(zlib, "compress", lambda *a: calls.append(1) or compress(*a))
+        write_docstore(tmp_path / "new.bin", wanted, previous)
+        with DocStore(tmp_path / "new.bin") as store:
+            expected = [old[d] if isinstance(d, int) else d for d in wanted]
+            got = store.get(range(len(wanted)))
+            assert [(g['doc_id'], g['url'], g['title'], g['text']) for g in got] == expected
+            # Two old blocks copied byte for byte; only the new doc compressed
+            assert store.raw_block(0) == previous.raw_block(0)
+            assert store.raw_block(1) == previous.raw_block(2)
+            assert len(calls) == 2  # its metadata and text columns
+
+
+def test_mostly_deleted_blocks_are_repacked(tmp_path, monkeypatch):
+    monkeypatch.setattr(docstore, "MAX_BLOCK_DOCS", 8)
+    old = _docs(16)
+    write_docstore(tmp_path / "old.bin", old)
+    with DocStore(tmp_path / "old.bin") as previous:
+        write_docstore(tmp_path / "new.bin", [0, 1, 2, 3, 4, 5, 6, 7, 9], previous)
+        with DocStore(tmp_path / "new.bin") as store:
+            assert store.raw_block(0) == previous.raw_block(0)
+            assert store.block_rows.tolist() == [8, 1]  # doc 9 alone, not its block
+            assert store.texts([8]) == [old[9][3]]
+
+
+def test_committed_docstore():
+    with open(ROOT / "indexer" / "doc_ids.json") as f:
+        doc_ids = json.load(f)
+    assert (ROOT / "indexer" / "docstore.bin").read_bytes()[:8] == docstore.DOCSTORE_MAGIC
+    with DocStore(ROOT / "indexer" / "docstore.bin") as store:
+        assert len(store) == len(doc_ids)
+        assert [doc['doc_id'] for doc in store.get([0, len(store) - 1], text=False)] == \
+            [doc_ids[0], doc_ids[-1]]
+
+
+def test_rejects_other_formats(tmp_path):
+    (tmp_path / "old.bin").write_bytes(b'IRDOCS01' + b'\0' * 32)
+    with pytest.raises(ValueError):
+        DocStore(tmp_path / "old.bin")
@@ -0,0 +1,72 @@
+"""Pruned top-k engines rank exactly like exhaustive cosine scoring"""
+
+import random
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from build_index import TFIDF_PARAMS
+from conftest import WORDS
+import pruning
+from pruning import ImpactIndex, wand_top_k
+from scoring import cosine_scores, top_k
+from taat import taat_top_k
+from tfidf_store import save_tfidf
+
+rng = random.Random(2)
+TEXTS = [" ".join(rng.choice(WORDS[:12]) for _ in range(rng.randint(1, 30))) for _ in range(150)]
+TEXTS += TEXTS[:10]  # duplicate docs tie on score
+QUERIES = [" ".join(rng.sample(WORDS[:14], rng.randint(1, 4))) for _ in range(25)]
+QUERIES += ["zzz", "information retrieval"]
+
+
+@pytest.fixture(scope="module")
+def model():
+    vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
+    matrix = vectorizer.fit_transform(TEXTS)
+    return vectorizer, matrix, ImpactIndex.from_csr(matrix)
+
+
+def exhaustive(model, query, k):
+    vectorizer, matrix, index = model
+    scores = cosine_scores(vectorizer.transform([query]), matrix, index.norms)
+    best = top_k(scores, k)
+    best = best[scores[best] > 0]
+    return best, scores[best]
+
+
+def assert_same(got, want):
+    np.testing.assert_array_equal(got[0], want[0])
+    np.testing.assert_array_equal(got[1], want[1])  # bit for bit
+
+
+@pytest.mark.parametrize("window", [1, 7, 64, pruning.WINDOW_DOCS])
+@pytest.mark.parametrize("k", [1, 5, 200])
+def test_wand_matches_exhaustive(model, k, window, monkeypatch):
+    monkeypatch.setattr(pruning, "WINDOW_DOCS", window)
+    vectorizer, _, index = model
+    for query in QUERIES:
+        assert_same(wand_top_k(index, vectorizer.transform([query]), k),
+                    exhaustive(model, query, k))
+
+
+@pytest.mark.parametrize("dense", [False, True, None])
+@pytest.mark.parametrize("k", [1, 5, 200])
+def test_taat_matches_exhaustive(model, k, dense):
+    vectorizer, _, index = model
+    for query in QUERIES:
+        assert_same(taat_top_k(index, vectorizer.transform([query]), k, dense),
+                    exhaustive(model, query, k))
+
+
+def test_saved_term_major_copy(model, tmp_path):
+    vectorizer, matrix, index = model
+    save_tfidf(tmp_path, vectorizer, matrix, TFIDF_PARAMS)
+    loaded = ImpactIndex.load(tmp_path)
+    for name in ('indptr', 'docs', 'weights', 'row_rank', 'norms', 'max_weight'):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(index, name))
+    # WAND reads the mapped lists in place
+    for query in QUERIES:
+        assert_same(wand_top_k(loaded, vectorizer.transform([query]), 5),
+                    exhaustive(model, query, 5))
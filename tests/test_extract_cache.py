@@ -0,0 +1,55 @@
+"""Extraction cache: stat fast path, content-hash hits, versioning"""
+
+import os
+
+import pytest
+
+import build_index
+from build_index import SearchIndexer
+from extract_cache import ExtractCache
+
+
+def _extract(html, out, workers=1):
+    indexer = SearchIndexer(html, out, workers=workers, chunksize=4)
+    return list(indexer.iter_documents())
+
+
+def _stats(out):
+    with ExtractCache(out / "extract_cache.sqlite", build_index.EXTRACTOR_VERSION) as cache:
+        return cache.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_hits_match_parsed_docs(corpus, tmp_path, capsys, workers):
+    fresh = _extract(corpus, tmp_path, workers)
+    assert "0 hits, 60 misses" in capsys.readouterr().out
+    assert _extract(corpus, tmp_path, workers) == fresh
+    assert "60 hits, 0 misses" in capsys.readouterr().out
+    assert _stats(tmp_path) == 60
+
+    # A touched file is read and hashed (by the worker) but not parsed
+    path = corpus / "doc00004.html"
+    os.utime(path, ns=(1, 1))
+    (corpus / "doc00009.html").write_text(path.read_text().replace("<p>", "<p>zebra "))
+    (corpus / "doc00011.html").unlink()
+    docs = _extract(corpus, tmp_path, workers)
+    # Evicted: the deleted file's extract and doc00009's old one
+    assert "58 hits, 1 misses (98% hit rate), 2 evicted" in capsys.readouterr().out
+    assert docs[4] == fresh[4]
+    assert "zebra" in docs[9][3].split()
+
+
+def test_parser_not_called_on_hash_hit(corpus, tmp_path, monkeypatch):
+    _extract(corpus, tmp_path)
+    for path in corpus.iterdir():
+        os.utime(path, ns=(1, 1))
+    monkeypatch.setattr(SearchIndexer, "extract_from_html", None)
+    assert len(_extract(corpus, tmp_path)) == 60
+
+
+def test_other_extractor_version_is_dropped(corpus, tmp_path, capsys, monkeypatch):
+    _extract(corpus, tmp_path)
+    monkeypatch.setattr(build_index, "EXTRACTOR_VERSION", build_index.EXTRACTOR_VERSION + 1)
+    capsys.readouterr()
+    _extract(corpus, tmp_path)
+    assert "0 hits, 60 misses" in capsys.readouterr().out
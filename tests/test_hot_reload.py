@@ -0,0 +1,105 @@
+"""IndexManager: reference-counted swaps and version checks around loads"""
+
+import json
+
+import pytest
+
+import hot_reload
+from hot_reload import IndexManager
+from manifest import publish_version, retire_files
+
+
+class FakeIndex:
+    def __init__(self, path, version):
+        self.version = version
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_swap_waits_for_queries(tmp_path):
+    publish_version(tmp_path)
+    manager = IndexManager(FakeIndex)
+    manager.open(tmp_path)
+    with manager.acquire() as old:
+        publish_version(tmp_path)
+        assert manager.changed() and manager.reload()
+        assert manager.current is not old and not old.closed
+    assert old.closed
+    assert not manager.reload()
+
+
+def test_load_is_discarded_if_a_build_publishes_meanwhile(tmp_path):
+    publish_version(tmp_path)
+    loaded = []
+
+    def loader(path, version):
+        index = FakeIndex(path, version)
+        loaded.append(index)
+        if len(loaded) == 1:
+            publish_version(path)  # a build finishes during the first load
+        return index
+
+    manager = IndexManager(loader)
+    manager.open(tmp_path)
+    assert len(loaded) == 2 and loaded[0].closed
+    assert manager.current is loaded[1]
+    assert manager.current.version == hot_reload.get_index_version(tmp_path)
+
+
+def test_gives_up_if_the_version_keeps_changing(tmp_path):
+    publish_version(tmp_path)
+    loaded = []
+
+    def loader(path, version):
+        loaded.append(FakeIndex(path, version))
+        publish_version(path)
+        return loaded[-1]
+
+    manager = IndexManager(loader)
+    with pytest.raises(RuntimeError):
+        manager.open(tmp_path)
+    assert len(loaded) == hot_reload.LOAD_ATTEMPTS and all(i.closed for i in loaded)
+    assert manager.failures == 1 and not manager.reload()
+
+
+def test_load_overlapping_a_build_is_discarded(tmp_path):
+    (tmp_path / "a.bin").write_bytes(b"old")
+    publish_version(tmp_path, ["a.bin"])
+    manager = IndexManager(FakeIndex)
+    manager.open(tmp_path)
+    first = manager.current
+    publish_version(tmp_path, ["a.bin"])
+    loaded = []
+
+    def loader(path, version):
+        loaded.append(FakeIndex(path, version))
+        # The next build retires and rewrites the files mid-load, with the
+        # manifest still naming the version being loaded until it is marked
+        retire_files(path, ["a.bin"])
+        (path / "a.bin").write_bytes(b"new!")
+        return loaded[-1]
+
+    manager.loader = loader
+    assert not manager.reload()
+    assert manager.current is first and loaded[0].closed
+    assert "being rebuilt" in manager.last_error
+    assert not manager.changed()  # nothing to load until the build publishes
+
+    manager.loader = FakeIndex
+    publish_version(tmp_path, ["a.bin"])
+    assert manager.changed() and manager.reload()
+
+
+def test_files_must_match_the_manifest(tmp_path):
+    (tmp_path / "a.bin").write_bytes(b"abc")
+    publish_version(tmp_path, ["a.bin", "missing.bin"])
+    assert json.loads((tmp_path / "index_version.json").read_text())['files'] == {'a.bin': 3}
+    manager = IndexManager(FakeIndex)
+    manager.open(tmp_path)
+    publish_version(tmp_path, ["a.bin"])
+    # Copied in by hand, without a build
+    (tmp_path / "a.bin").write_bytes(b"abcd")
+    assert not manager.reload()
+    assert "a.bin" in manager.last_error
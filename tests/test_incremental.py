@@ -0,0 +1,166 @@
+"""Incremental updates: segments read side by side, stats from stored counts"""
+
+import json
+
+import numpy as np
+
+import segments
+from build_index import INDEX_FILES, SearchIndexer
+from conftest import index_files, write_corpus, write_doc
+from docstore import DOCSTORE_FILE, DocStore
+from lsi import IVFIndex
+from postings import PostingsReader, SegmentedPostings, open_postings
+
+# postings.bin references the segments; docstore.bin reuses old blocks
+COMPARED = [name for name in INDEX_FILES if name not in ("postings.bin", DOCSTORE_FILE)]
+
+
+def _update(html, out, **kwargs):
+    SearchIndexer(html, out, cache=False, lsi_dims=0).update(**kwargs)
+
+
+def _build(html, out):
+    out.mkdir()
+    SearchIndexer(html, out, cache=False, lsi_dims=0).build()
+
+
+def _change_corpus(html):
+    write_corpus(html, 8, seed=1, prefix="new")
+    (html / "doc00003.html").unlink()
+    write_doc(html, "doc00007", "Changed", "zebra retrieval words never seen before")
+
+
+def assert_same_docs(out, full):
+    with DocStore(out / DOCSTORE_FILE) as store, DocStore(full / DOCSTORE_FILE) as expected:
+        assert len(store) == len(expected)
+        docs = list(range(len(store)))
+        assert store.get(docs) == expected.get(docs)
+
+
+def assert_same_postings(reader, expected):
+    terms = list(expected)
+    assert list(reader) == terms
+    for term in terms:
+        for got, want in zip(reader.read_term(term), expected.read_term(term)):
+            np.testing.assert_array_equal(got, want)
+        assert reader.df(term) == expected.df(term)
+        np.testing.assert_array_equal(reader.docs(term), expected.docs(term))
+    assert reader.read_term("no-such-term") is None
+
+
+def test_update_matches_full_build(corpus, tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    _update(corpus, out)
+    _change_corpus(corpus)
+    _update(corpus, out)
+    _build(corpus, tmp_path / "full")
+
+    assert index_files(out, COMPARED) == index_files(tmp_path / "full", COMPARED)
+    assert_same_docs(out, tmp_path / "full")
+    with open_postings(out / "postings.bin") as reader, \
+            PostingsReader(tmp_path / "full" / "postings.bin") as expected:
+        assert isinstance(reader, SegmentedPostings)
+        assert reader.num_docs == expected.num_docs
+        assert_same_postings(reader, expected)
+
+
+def test_update_leaves_published_segments_alone(corpus, tmp_path, monkeypatch):
+    out = tmp_path / "out"
+    out.mkdir()
+    _update(corpus, out)
+    old = out / "segments" / "seg_000000" / "postings.bin"
+    before = (old.stat().st_ino, old.stat().st_mtime_ns, old.read_bytes())
+
+    def no_merge(*args, **kwargs):
+        raise AssertionError("old postings were rewritten")
+
+    monkeypatch.setattr(segments, "merge_postings", no_merge)
+    _change_corpus(corpus)
+    _update(corpus, out)
+
+    assert (old.stat().st_ino, old.stat().st_mtime_ns, old.read_bytes()) == before
+    # postings.bin only references the two segments
+    assert (out / "postings.bin").stat().st_size < len(before[2]) // 10
+
+
+def test_merge_and_feature_table_rebuild(corpus, tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    _update(corpus, out)
+    _change_corpus(corpus)
+    # A lost feature table is rebuilt from the segments' terms
+    (out / "segments" / segments.FEATURE_IDS).unlink()
+    _update(corpus, out)
+    _update(corpus, out, merge=True)
+    _build(corpus, tmp_path / "full")
+
+    assert index_files(out, COMPARED) == index_files(tmp_path / "full", COMPARED)
+    assert_same_docs(out, tmp_path / "full")
+    with open_postings(out / "postings.bin") as reader:
+        assert len(reader.readers) == 1
+    features = (out / "segments" / segments.FEATURES).read_text().split("\n")[:-1]
+    assert features == sorted(features)
+    merged = (out / "segments" / "seg_000002" / "postings.bin").read_bytes()
+    assert merged == (tmp_path / "full" / "postings.bin").read_bytes()
+
+
+def test_update_folds_into_previous_lsi_basis(corpus, tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    SearchIndexer(corpus, out, cache=False, lsi_dims=8, nlist=4).update()
+    components = np.load(out / "lsi_components.npy")
+    centroids = np.load(out / "ivf_centroids.npy")
+    with open(out / "tfidf_vocab.json") as f:
+        old_vocab = json.load(f)
+    write_corpus(corpus, 5, seed=2, prefix="new")
+    SearchIndexer(corpus, out, cache=False, lsi_dims=8).update()
+
+    with open(out / "lsi_meta.json") as f:
+        assert json.load(f)['folded_in']
+    np.testing.assert_array_equal(np.load(out / "ivf_centroids.npy"), centroids)
+    index = IVFIndex.load(out)
+    assert index.vectors.shape == (65, 8)
+    with open(out / "tfidf_vocab.json") as f:
+        vocab = json.load(f)
+    # Columns follow the new vocabulary; known terms keep their weights
+    assert index.components.shape == (8, len(vocab))
+    old_col = {term: col for col, term in enumerate(old_vocab)}
+    for col, term in enumerate(vocab):
+        expected = components[:, old_col[term]] if term in old_col else 0
+        np.testing.assert_array_equal(index.components[:, col], expected)
+
+
+def test_update_without_previous_docstore_extracts_again(corpus, tmp_path, capsys):
+    out = tmp_path / "out"
+    out.mkdir()
+    SearchIndexer(corpus, out, lsi_dims=0).update()
+    _change_corpus(corpus)
+    (out / DOCSTORE_FILE).unlink()
+    capsys.readouterr()
+    SearchIndexer(corpus, out, lsi_dims=0).update()
+    # The re-extraction ran to completion (cache stats are printed last)
+    assert "Extraction cache:" in capsys.readouterr().out.split("Saving index files")[1]
+    _build(corpus, tmp_path / "full")
+    assert_same_docs(out, tmp_path / "full")
+
+
+def test_merge_keeps_published_segments_until_replaced(corpus, tmp_path, monkeypatch):
+    out = tmp_path / "out"
+    out.mkdir()
+    _update(corpus, out)
+    _change_corpus(corpus)
+    _update(corpus, out)
+    retire = SearchIndexer._retire_outputs
+    readable = []
+
+    def check_then_retire(self):
+        # Merged, not yet replaced: the published index must still load
+        with open_postings(out / "postings.bin") as reader:
+            readable.append(sum(len(reader.docs(term)) for term in reader))
+        retire(self)
+
+    monkeypatch.setattr(SearchIndexer, "_retire_outputs", check_then_retire)
+    _update(corpus, out, merge=True)
+    assert readable and readable[0] > 0
+    assert sorted(p.name for p in (out / "segments").glob("seg_*")) == ["seg_000002"]
@@ -0,0 +1,76 @@
+"""Load generator: query logs, request paths, closed/open loops and summaries"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from loadtest import PERCENTILES, _paths, read_queries, run_closed, run_open, summarize
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        status = 500 if "fail" in self.path else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_read_queries(tmp_path):
+    log = tmp_path / "log.csv"
+    log.write_text("query_id,query_text\nq1,first query\nq2,  \nq3,third\n")
+    assert read_queries(log) == ["first query", "third"]
+    plain = tmp_path / "log.txt"
+    plain.write_text("one\n\n two \n")
+    assert read_queries(plain) == ["one", "two"]
+
+
+def test_paths():
+    method, paths = _paths('wand', ["a b", "c"], 7)
+    assert method == 'GET' and len(paths) == 2
+    args = parse_qs(urlsplit(paths[0]).query)
+    assert urlsplit(paths[0]).path == "/search"
+    assert args == {'engine': ['wand'], 'cache': ['0'], 'q': ['a b'], 'k': ['7']}
+    assert _paths('batch', ["a", "b"], 7) == ('POST', ["/batch"])
+
+
+def test_summarize():
+    row = summarize([i / 1000 for i in range(1, 101)], 3, 2.0)
+    assert (row['requests'], row['errors'], row['throughput']) == (100, 3, 50.0)
+    assert row['mean_ms'] == 50.5 and row['p50_ms'] == 50.5
+    assert row['p99_ms'] == pytest.approx(99.01)
+    empty = summarize([], 1, 1.0)
+    assert empty['requests'] == 0 and empty['mean_ms'] is None
+    assert all(empty[f"p{p}_ms"] is None for p in PERCENTILES)
+
+
+def test_run_closed(server):
+    host, port = server
+    latencies, errors, duration = run_closed(host, port, 'GET', ["/ok", "/fail"], 2,
+                                             duration=0.3, warmup=0.05, timeout=5)
+    # Client 0 sends the even paths, client 1 the odd ones
+    assert duration == 0.3 and latencies and errors
+
+
+def test_run_open(server):
+    host, port = server
+    latencies, errors, _ = run_open(host, port, 'GET', ["/ok"], rate=100, duration=0.3,
+                                    warmup=0, timeout=5, max_clients=4, poisson=False)
+    assert errors == 0 and 25 <= len(latencies) <= 31
+    assert all(seconds > 0 for seconds in latencies)
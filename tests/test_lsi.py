@@ -0,0 +1,52 @@
+"""LSI vectors and the IVF index"""
+
+import random
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from build_index import TFIDF_PARAMS
+from conftest import WORDS
+from lsi import IVFIndex, build_lsi
+from tfidf_store import save_tfidf
+
+rng = random.Random(3)
+TEXTS = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40))) for _ in range(300)]
+
+
+@pytest.fixture(scope="module")
+def lsi(tmp_path_factory):
+    out = tmp_path_factory.mktemp("lsi")
+    vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
+    matrix = vectorizer.fit_transform(TEXTS)
+    save_tfidf(out, vectorizer, matrix, TFIDF_PARAMS)
+    meta = build_lsi(out, dims=16, target_recall=0.9, num_queries=50)
+    return vectorizer, IVFIndex.load(out), meta
+
+
+def test_meta(lsi):
+    _, index, meta = lsi
+    assert meta['dims'] == 16 and index.nlist == meta['nlist'] == 17  # ~sqrt(300)
+    report = {row['nprobe']: row['recall'] for row in meta['recall_report']['results']}
+    assert report[index.nlist] == 1.0
+    assert report[meta['nprobe']] >= 0.9
+    assert all(report[n] < 0.9 for n in report if n < meta['nprobe'])
+    np.testing.assert_allclose(np.linalg.norm(index.vectors, axis=1), 1, rtol=1e-5)
+    # Every doc is in exactly one list
+    assert sorted(index.doc_nums.tolist()) == list(range(len(TEXTS)))
+
+
+def test_full_probe_is_exact(lsi):
+    vectorizer, index, _ = lsi
+    for text in ("vector space model", "web crawler", "precision recall"):
+        query = index.project(vectorizer.transform([text]))
+        scores = index.scores(query)
+        want = np.lexsort((np.arange(len(scores)), -scores))[:10]
+        docs, got = index.search(query, 10, index.nlist)
+        np.testing.assert_array_equal(docs, want)
+        np.testing.assert_allclose(got, scores[want], rtol=1e-6)
+        # Probing fewer lists returns a subset of the candidates, still ordered
+        docs, got = index.search(query, 10, 2)
+        assert len(docs) <= 10 and np.all(np.diff(got) <= 0)
+        assert len(index.search(query, 10)[0]) <= 10
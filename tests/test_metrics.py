@@ -0,0 +1,83 @@
+"""Shared-memory counters and histograms and their Prometheus rendering"""
+
+import os
+
+import pytest
+
+from metrics import Registry, StageClock
+
+
+def _samples(text):
+    """{name+labels: value} of the sample lines"""
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+            for line in text.splitlines() if not line.startswith("#")}
+
+
+def test_counter():
+    registry = Registry()
+    plain = registry.counter('plain_total', "No labels")
+    labelled = registry.counter('hits_total', "By kind", ('kind',), [('a',), ('b',)])
+    plain.inc()
+    plain.inc(amount=2.5)
+    labelled.inc('a')
+    labelled.inc('b', amount=3)
+    text = registry.render()
+    assert "# TYPE hits_total counter" in text and "# HELP plain_total No labels" in text
+    assert _samples(text) == {'plain_total': 3.5, 'hits_total{kind="a"}': 1,
+                              'hits_total{kind="b"}': 3}
+    with pytest.raises(KeyError):
+        labelled.inc('c')
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('size', "Sizes", buckets=(1, 10))
+    for value in (0.5, 1, 5, 50):
+        histogram.observe(value)
+    assert _samples(registry.render()) == {
+        'size_bucket{le="1"}': 2, 'size_bucket{le="10"}': 3, 'size_bucket{le="+Inf"}': 4,
+        'size_sum': 56.5, 'size_count': 4}
+
+
+def test_gauges():
+    text = Registry().render([('g', "A gauge", [({'v': "x"}, 2), ({}, 0.25)])])
+    assert "# TYPE g gauge" in text
+    assert _samples(text) == {'g{v="x"}': 2, 'g': 0.25}
+
+
+def test_no_metrics_after_allocate():
+    registry = Registry()
+    registry.allocate()
+    with pytest.raises(RuntimeError):
+        registry.counter('late_total', "Too late")
+
+
+def test_rows_from_forked_processes_add_up():
+    registry = Registry()
+    counter = registry.counter('work_total', "Work")
+    registry.allocate(rows=3)
+    children = []
+    for row in (1, 2):
+        pid = os.fork()
+        if pid == 0:
+            registry.use_row(row)
+            counter.inc(amount=row * 10)
+            os._exit(0)
+        children.append(pid)
+    for pid in children:
+        os.waitpid(pid, 0)
+    counter.inc()
+    assert _samples(registry.render()) == {'work_total': 31}
+
+
+def test_stage_clock():
+    registry = Registry()
+    stages = registry.histogram('stage_seconds', "Stages", ('stage',), [('a',), ('b',)])
+    clock = StageClock(stages)
+    clock.lap('a')
+    clock.lap('b')
+    clock.lap('b')
+    samples = _samples(registry.render())
+    assert samples['stage_seconds_count{stage="a"}'] == 1
+    assert samples['stage_seconds_count{stage="b"}'] == 2
+    assert samples['stage_seconds_sum{stage="b"}'] >= 0
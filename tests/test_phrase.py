@@ -0,0 +1,56 @@
+"""Phrase and proximity matching against a scan of the token lists"""
+
+import random
+
+import pytest
+
+from phrase import match_phrases, parse_query, phrase_matches
+from postings import PositionalIndex
+
+rng = random.Random(1)
+DOCS = [[rng.choice("abcd") for _ in range(rng.randint(0, 30))] for _ in range(40)]
+
+
+def _scan(tokens, slop):
+    """{doc: matches}: starts of tokens[0] from which each next token's
+    earliest later occurrence keeps the extra tokens within slop"""
+    out = {}
+    for doc, words in enumerate(DOCS):
+        count = 0
+        for start, word in enumerate(words):
+            if word != tokens[0]:
+                continue
+            pos = start
+            for token in tokens[1:]:
+                pos = next((j for j in range(pos + 1, len(words)) if words[j] == token), None)
+                if pos is None:
+                    break
+            if pos is not None and pos - start - (len(tokens) - 1) <= slop:
+                count += 1
+        if count:
+            out[doc] = count
+    return out
+
+
+@pytest.fixture(scope="module")
+def index():
+    return PositionalIndex.build(DOCS)
+
+
+@pytest.mark.parametrize("tokens", [["a", "b"], ["a", "b", "c"], ["d", "d"], ["c", "a", "c"]])
+@pytest.mark.parametrize("slop", [0, 1, 3])
+def test_matches_scan(index, tokens, slop):
+    docs, counts = phrase_matches(index, tokens, slop)
+    assert dict(zip(docs.tolist(), counts.tolist())) == _scan(tokens, slop)
+
+
+def test_unknown_token(index):
+    assert len(phrase_matches(index, ["a", "zzz"])[0]) == 0
+
+
+def test_parse_and_combine(index):
+    text, phrases = parse_query('web "Vector  Space"~2 model "" "x"')
+    assert phrases == [(["vector", "space"], 2), (["x"], 0)]
+    assert text.split() == ["web", "Vector", "Space", "model", "x"]
+    both = match_phrases(index, [(["a", "b"], 0), (["c", "d"], 1)])
+    assert both.tolist() == sorted(set(_scan(["a", "b"], 0)) & set(_scan(["c", "d"], 1)))
@@ -0,0 +1,84 @@
+"""Positional inverted index, varint codec and postings.bin"""
+
+import random
+
+import numpy as np
+import pytest
+
+from postings import (PositionalIndex, PostingsReader, decode_varints, encode_varints,
+                      varint_sizes, write_postings_file)
+
+rng = random.Random(0)
+TOKEN_LISTS = [[rng.choice("abcdefgh") + rng.choice("xyz") for _ in range(rng.randint(0, 40))]
+               for _ in range(30)]
+
+
+def _naive(token_lists):
+    """{term: [(doc, [positions])]} by a dict walk"""
+    out = {}
+    for doc, tokens in enumerate(token_lists):
+        for pos, token in enumerate(tokens):
+            postings = out.setdefault(token, [])
+            if not postings or postings[-1][0] != doc:
+                postings.append((doc, []))
+            postings[-1][1].append(pos)
+    return out
+
+
+@pytest.fixture
+def index():
+    return PositionalIndex.build(TOKEN_LISTS)
+
+
+def test_matches_naive_index(index):
+    naive = _naive(TOKEN_LISTS)
+    assert list(index) == sorted(naive)
+    for term, postings in naive.items():
+        docs, tfs = index.postings(term)
+        assert docs.tolist() == [doc for doc, _ in postings]
+        assert tfs.tolist() == [len(positions) for _, positions in postings]
+        assert [p.tolist() for p in index.positions_for(term)] == \
+            [positions for _, positions in postings]
+        assert index.df(term) == len(postings)
+
+
+def test_unknown_term(index):
+    assert "nope" not in index and index.df("nope") == 0
+    assert len(index.docs("nope")) == 0 and index.read_term("nope") is None
+
+
+def test_max_positions_keeps_tf():
+    index = PositionalIndex.build([["a"] * 5 + ["b"]], max_positions=2)
+    assert index.postings("a")[1].tolist() == [5]
+    np.testing.assert_array_equal(index.positions_for("a")[0], [0, 1])
+
+
+def test_varint_round_trip():
+    values = np.array([0, 1, 127, 128, 255, 16383, 16384, 2**31 - 1, 2**32, 2**63 - 1] +
+                      list(range(300)), dtype=np.uint64)
+    encoded = encode_varints(values)
+    assert len(encoded) == varint_sizes(values).sum()
+    assert encode_varints([300]).tolist() == [0xAC, 0x02]
+    np.testing.assert_array_equal(decode_varints(encoded.tobytes()), values)
+    assert len(decode_varints(encode_varints([]).tobytes())) == 0
+
+
+@pytest.mark.parametrize("max_positions", [None, 3])
+def test_postings_file_round_trip(tmp_path, max_positions):
+    index = PositionalIndex.build(TOKEN_LISTS, max_positions=max_positions)
+    write_postings_file(index, tmp_path / "postings.bin", len(TOKEN_LISTS))
+    with PostingsReader(tmp_path / "postings.bin") as reader:
+        assert reader.full_positions == (max_positions is None)
+        assert list(reader) == list(index) and reader.num_docs == len(TOKEN_LISTS)
+        for term in index:
+            for got, want in zip(reader.read_term(term), index.read_term(term)):
+                np.testing.assert_array_equal(got, want)
+            np.testing.assert_array_equal(reader.docs(term), index.docs(term))
+            assert reader.df(term) == index.df(term)
+        assert reader.df("nope") == 0 and reader.read_term("nope") is None
+
+        # Decoding a run of terms at once gives the same arrays
+        run = reader.read_range(2, len(reader) - 1)
+        for term in run:
+            for got, want in zip(run.read_term(term), index.read_term(term)):
+                np.testing.assert_array_equal(got, want)
@@ -0,0 +1,91 @@
+"""Query-time TF-IDF without scikit-learn: QueryVectorizer and QueryAnalyzer"""
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from build_index import TFIDF_PARAMS
+from conftest import WORDS
+from query_vectorizer import QueryAnalyzer, QueryVectorizer
+from tfidf_store import load_vectorizer, save_tfidf
+
+TEXTS = [" ".join(WORDS[i::k]) for k in (2, 3, 5) for i in range(k)] + ["The web, THE web."]
+QUERIES = ["Vector space model", "query query QUERY", "the and of", "", "web-page: web page!",
+           "unknown zzz words", "indexing ranking retrieval evaluation"]
+
+
+def _fit(**params):
+    vectorizer = TfidfVectorizer(**params)
+    vectorizer.fit(TEXTS)
+    return vectorizer
+
+
+def _lightweight(vectorizer, params):
+    idf = vectorizer.idf_ if vectorizer.use_idf else np.ones(len(vectorizer.vocabulary_))
+    return QueryVectorizer.from_params(vectorizer.vocabulary_, idf,
+                                       vectorizer.get_stop_words() or (), params)
+
+
+@pytest.mark.parametrize("params", [
+    TFIDF_PARAMS,
+    dict(stop_words='english', ngram_range=(1, 2)),
+    dict(ngram_range=(2, 3), norm=None),
+    dict(lowercase=False, min_df=2),
+])
+def test_transform_is_bit_identical(params):
+    vectorizer = _fit(**params)
+    got = _lightweight(vectorizer, params).transform(QUERIES)
+    want = vectorizer.transform(QUERIES)
+    want.sort_indices()
+    assert got.shape == want.shape
+    np.testing.assert_array_equal(got.indptr, want.indptr)
+    np.testing.assert_array_equal(got.indices, want.indices)
+    np.testing.assert_array_equal(got.data, want.data)
+
+
+@pytest.mark.parametrize("params", [
+    dict(sublinear_tf=True), dict(norm='l1'), dict(use_idf=False), dict(binary=True),
+])
+def test_unsupported_params(params):
+    with pytest.raises(ValueError):
+        _lightweight(_fit(**params), params)
+
+
+def test_load_vectorizer_lightweight(tmp_path):
+    vectorizer = _fit(**TFIDF_PARAMS)
+    save_tfidf(tmp_path, vectorizer, vectorizer.transform(TEXTS), TFIDF_PARAMS)
+    loaded = load_vectorizer(tmp_path)
+    assert isinstance(loaded, QueryVectorizer)
+    assert (loaded.transform(QUERIES) != vectorizer.transform(QUERIES)).nnz == 0
+    assert isinstance(load_vectorizer(tmp_path, lightweight=False), TfidfVectorizer)
+
+
+@pytest.mark.parametrize("params", [
+    TFIDF_PARAMS,
+    dict(stop_words='english', ngram_range=(1, 2)),
+    dict(ngram_range=(2, 3), norm=None),
+    dict(lowercase=False),
+])
+@pytest.mark.parametrize("lightweight", [False, True])
+def test_analyzer_matches_transform(params, lightweight):
+    vectorizer = _fit(**params)
+    if lightweight:
+        vectorizer = _lightweight(vectorizer, params)
+    analyzer = QueryAnalyzer(vectorizer)
+    assert analyzer.table is not None
+    for query in QUERIES:
+        got = analyzer.vector(query)
+        want = vectorizer.transform([query])
+        want.sort_indices()
+        assert got.shape == want.shape and got.nnz == want.nnz
+        np.testing.assert_array_equal(got.indices, want.indices)
+        np.testing.assert_array_equal(got.data, want.data)
+        assert (got.tocsr() != want).nnz == 0
+        np.testing.assert_array_equal(got.toarray(), want.toarray())
+
+
+def test_analyzer_falls_back_to_transform():
+    vectorizer = _fit(sublinear_tf=True)
+    analyzer = QueryAnalyzer(vectorizer)
+    assert analyzer.table is None
+    assert (analyzer.vector("web web page") != vectorizer.transform(["web web page"])).nnz == 0
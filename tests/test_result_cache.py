@@ -0,0 +1,56 @@
+"""Result cache: LRU order, TTL and index-version invalidation"""
+
+from result_cache import ResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_key_normalizes_query():
+    assert ResultCache.key("  Vector\tSPACE ", 10, 'bm25') == ("vector space", 10, 'bm25')
+
+
+def test_lru_eviction():
+    cache = ResultCache(max_entries=2)
+    cache.set_version("v1")
+    cache.put("a", [1])
+    cache.put("b", [2])
+    assert cache.get("a") == [1]  # b is now least recently used
+    cache.put("c", [3])
+    assert cache.get("b") is None and cache.get("a") == [1] and cache.get("c") == [3]
+    assert cache.stats()['evictions'] == 1
+
+
+def test_ttl():
+    clock = FakeClock()
+    cache = ResultCache(ttl=5, clock=clock)
+    cache.put("a", [1])
+    clock.now = 4.9
+    assert cache.get("a") == [1]
+    clock.now = 5.0
+    assert cache.get("a") is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_version_invalidation():
+    cache = ResultCache()
+    cache.set_version("v1")
+    cache.put("a", [1], version="v1")
+    cache.set_version("v2")
+    assert cache.get("a") is None and cache.stats()['invalidations'] == 1
+    # Results ranked on the old version while it was swapped out are dropped
+    cache.put("a", [1], version="v1")
+    assert cache.get("a") is None
+    cache.put("a", [2], version="v2")
+    assert cache.get("a") == [2]
+
+
+def test_disabled():
+    cache = ResultCache(max_entries=0)
+    cache.put("a", [1])
+    assert cache.get("a") is None
@@ -0,0 +1,127 @@
+"""/search and /batch/stream request handling, through the Flask test client"""
+
+import json
+
+import numpy as np
+import pytest
+
+import query_processor
+from build_index import SearchIndexer
+from conftest import write_corpus
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("api")
+    out = tmp / "out"
+    out.mkdir()
+    SearchIndexer(write_corpus(tmp / "html", 60), out, cache=False, lsi_dims=8).build()
+    query_processor.index_manager.open(out)
+    return query_processor.app.test_client()
+
+
+def _search(client, **args):
+    return client.get("/search", query_string={'q': "retrieval", **args})
+
+
+def test_k_limits_results(client):
+    assert len(_search(client, k=3).get_json()['results']) == 3
+    # Every matching doc, short of the cap
+    assert 3 < len(_search(client, k=query_processor.MAX_K).get_json()['results']) <= 60
+
+
+@pytest.mark.parametrize("args", [
+    {'k': 0}, {'k': -1}, {'k': query_processor.MAX_K + 1}, {'k': "ten"},
+    {'offset': -1}, {'offset': "abc"}, {'offset': ""},
+])
+def test_bad_paging_is_rejected(client, args):
+    response = _search(client, **args)
+    assert response.status_code == 400
+    assert response.get_json()['error']
+
+
+def test_pages_follow_cursor(client):
+    first = _search(client, k=5).get_json()
+    whole = [r['doc_id'] for r in _search(client, k=10).get_json()['results']]
+    second = client.get("/search", query_string={'cursor': first['next_cursor']}).get_json()
+    assert [r['doc_id'] for r in first['results'] + second['results']] == whole
+    third = _search(client, k=5, offset=10).get_json()
+    assert third['results'][0]['rank'] == 11
+
+
+def test_nprobe(client):
+    lsi = {'model': "lsi", 'k': 5}
+    nlist = query_processor.index_manager.current.lsi_index.nlist
+    # Beyond nlist probes every list
+    assert _search(client, nprobe=10**6, **lsi).get_json()['results'] == \
+        _search(client, nprobe=nlist, **lsi).get_json()['results']
+    assert len(_search(client, nprobe=1, **lsi).get_json()['results']) == 5
+    for bad in (0, -2, "all"):
+        assert _search(client, nprobe=bad, **lsi).status_code == 400
+    # Only read for model=lsi
+    assert _search(client, nprobe=0).status_code == 200
+    with pytest.raises(ValueError):
+        query_processor.index_manager.current.lsi_index.search(np.zeros(8), 5, 0)
+
+
+def test_batch_stream_reports_bad_rows(client):
+    huge = "x" * 60000
+    body = f'query_id,query_text\nq1,retrieval\nq2,"{huge}\n{huge}\n{huge}"\nq3,index\n'
+    response = client.post("/batch/stream", data=body, content_type="text/csv")
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [r.get('query_id') for r in records] == ['q1', 2, 'q3']
+    assert records[0]['results'] and "field limit" in records[1]['error']
+
+    response = client.post("/batch/stream", data="id\n1\n", content_type="text/csv")
+    assert response.status_code == 400 and "query_text" in response.get_json()['error']
+
+
+@pytest.mark.parametrize("args", [
+    {'k': 0}, {'k': -1}, {'k': query_processor.MAX_K + 1}, {'k': "ten"},
+    {'chunk': 0}, {'chunk': 10**6}, {'chunk': "x"},
+])
+def test_batch_stream_bad_params_are_rejected(client, args):
+    response = client.post("/batch/stream", query_string=args,
+                           data="query_text\nretrieval\n", content_type="text/csv")
+    assert response.status_code == 400 and response.get_json()['error']
+
+
+def test_batch_stream_k_and_chunk(client):
+    body = "query_text\n" + "retrieval\nindex\n" * 5
+    response = client.post("/batch/stream", query_string={'k': 2, 'chunk': 3},
+                           data=body, content_type="text/csv")
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(records) == 10 and all(len(r['results']) == 2 for r in records)
+
+
+def test_result_cache(client):
+    first = _search(client, q="cache check query retrieval").get_json()
+    again = _search(client, q="Cache  check query RETRIEVAL").get_json()
+    assert again['cached'] and again['results'] == first['results']
+    assert not _search(client, q="cache check query retrieval", cache=0).get_json()['cached']
+
+
+def _metric(text, name):
+    return next(float(line.split()[-1]) for line in text.splitlines()
+                if line.startswith(name + " "))
+
+
+def test_metrics_endpoint(client):
+    ok = 'ir_http_requests_total{endpoint="/search",status="2xx"}'
+    bad = 'ir_http_requests_total{endpoint="/search",status="4xx"}'
+    before = client.get("/metrics").get_data(as_text=True)
+    _search(client, k=2, cache=0)
+    _search(client, k=-1)
+    text = client.get("/metrics").get_data(as_text=True)
+    assert _metric(text, ok) == _metric(before, ok) + 1
+    assert _metric(text, bad) == _metric(before, bad) + 1
+    assert _metric(text, 'ir_index_documents') == 60
+    assert 'ir_query_stage_duration_seconds_count{stage="score"}' in text
+
+
+def test_snippets(client):
+    results = _search(client, k=3, snippets=1).get_json()['results']
+    for result in results:
+        snippet = result['snippet']
+        assert {snippet['text'][a:b] for a, b in snippet['highlights']} == {"retrieval"}
+    assert 'snippet' not in _search(client, k=3).get_json()['results'][0]
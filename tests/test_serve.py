@@ -0,0 +1,87 @@
+"""Prefork server: keep-alive, chunked streaming, worker restart, shutdown"""
+
+import http.client
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import ROOT
+
+APP = """
+import os, sys
+sys.path.insert(0, {processor!r})
+from serve import serve
+
+def app(environ, start_response):
+    if environ['PATH_INFO'] == '/stream':
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return (f"line {{i}}\\n".encode() for i in range(3))
+    body = environ['wsgi.input'].read()
+    out = f"{{os.getpid()}} {{len(body)}}".encode()
+    start_response('200 OK', [('Content-Length', str(len(out)))])
+    return [out]
+
+serve(app, host='127.0.0.1', port={port}, workers=2, threads=2, graceful_timeout=5)
+"""
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs os.fork")
+
+
+@pytest.fixture
+def server():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, "-c", APP.format(
+        processor=str(ROOT / "processor"), port=port)], stdout=subprocess.PIPE, text=True)
+    assert "Serving on" in proc.stdout.readline()
+    yield proc, port
+    if proc.poll() is None:
+        proc.kill()
+    proc.wait()
+
+
+def _get(conn, path, body=None):
+    conn.request("POST" if body else "GET", path, body=body)
+    response = conn.getresponse()
+    return response, response.read().decode()
+
+
+def test_keep_alive_and_streaming(server):
+    _, port = server
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    first = _get(conn, "/", b"x" * 10)[1]
+    pid, length = first.split()
+    assert length == "10"
+    # Same connection, same worker
+    assert _get(conn, "/")[1] == f"{pid} 0"
+    response, text = _get(conn, "/stream")
+    assert response.getheader('Transfer-Encoding') == 'chunked'
+    assert text == "line 0\nline 1\nline 2\n"
+    assert _get(conn, "/")[1] == f"{pid} 0"
+    conn.close()
+
+
+def test_dead_worker_is_replaced_and_shutdown(server):
+    proc, port = server
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    pid = int(_get(conn, "/")[1].split()[0])
+    conn.close()
+    os.kill(pid, signal.SIGKILL)
+    assert "restarting" in proc.stdout.readline()
+    time.sleep(0.2)
+    pids = set()
+    for _ in range(20):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        pids.add(int(_get(conn, "/")[1].split()[0]))
+        conn.close()
+    assert pid not in pids
+
+    proc.send_signal(signal.SIGTERM)
+    assert proc.wait(timeout=10) == 0
+    assert "Server stopped" in proc.stdout.read()
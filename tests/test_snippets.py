@@ -0,0 +1,38 @@
+"""Query-biased snippets"""
+
+from snippets import ELLIPSIS, best_window, make_snippet, snippet_terms
+
+
+def _highlighted(snippet):
+    return [snippet['text'][start:end] for start, end in snippet['highlights']]
+
+
+def test_snippet_terms():
+    assert snippet_terms("The Vector, the space!", {"the"}) == {"vector", "space"}
+
+
+def test_window_covers_most_distinct_terms():
+    text = " ".join(["alpha"] * 3 + [f"w{i}" for i in range(50)] + ["alpha", "beta"] +
+                    [f"v{i}" for i in range(50)])
+    snippet = make_snippet(text, {"alpha", "beta"}, width=10)
+    assert snippet['text'].startswith(ELLIPSIS + " ") and snippet['text'].endswith(" " + ELLIPSIS)
+    assert _highlighted(snippet) == ["alpha", "beta"]
+    # The pair sits in the middle of the window
+    words = snippet['text'].split()[1:-1]
+    assert len(words) == 10 and words[4:6] == ["alpha", "beta"]
+
+
+def test_ties_go_to_earliest_window():
+    assert best_window([5, 40], ["a", "a"], 100, 10) == 1
+    assert best_window([0, 1], ["a", "b"], 100, 10) == 0
+    # Never starts past the last full window
+    assert best_window([99], ["a"], 100, 10) == 90
+
+
+def test_no_terms_gives_opening_words():
+    text = " ".join(f"w{i}" for i in range(40))
+    snippet = make_snippet(text, {"missing"})
+    assert snippet == {'text': " ".join(text.split()[:30]) + " " + ELLIPSIS, 'highlights': []}
+    assert make_snippet("short text", {"text"}) == {'text': "short text",
+                                                    'highlights': [[6, 10]]}
+    assert make_snippet("", {"x"}) == {'text': "", 'highlights': []}
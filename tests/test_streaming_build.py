@@ -0,0 +1,20 @@
+"""Out-of-core (SPIMI) build: same files as the in-memory build"""
+
+import postings
+from build_index import INDEX_FILES, SearchIndexer
+from conftest import index_files
+
+
+def test_streaming_build_is_byte_identical(corpus, tmp_path, monkeypatch):
+    memory, streaming = tmp_path / "memory", tmp_path / "streaming"
+    memory.mkdir()
+    streaming.mkdir()
+    SearchIndexer(corpus, memory, cache=False, lsi_dims=0).build()
+
+    # A tiny budget flushes many blocks; tiny merge runs take many rounds
+    monkeypatch.setattr(postings, "MIN_MERGE_RUN", 1)
+    indexer = SearchIndexer(corpus, streaming, cache=False, lsi_dims=0)
+    indexer.build_streaming(memory_budget_mb=0.02)
+
+    assert index_files(streaming, INDEX_FILES) == index_files(memory, INDEX_FILES)
+    assert not (streaming / "spimi_blocks").exists()
@@ -0,0 +1,37 @@
+"""TF-IDF matrix stored as raw CSR arrays"""
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from build_index import TFIDF_PARAMS
+from conftest import WORDS
+from tfidf_store import load_tfidf_matrix, load_vectorizer, save_tfidf
+
+TEXTS = [" ".join(WORDS[i::k]) for k in (3, 4, 5, 7) for i in range(k)] + [""]
+QUERIES = ["vector space model", "query", "unknown words only", "web page web page"]
+
+
+@pytest.fixture
+def saved(tmp_path):
+    vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
+    matrix = vectorizer.fit_transform(TEXTS)
+    save_tfidf(tmp_path, vectorizer, matrix, TFIDF_PARAMS)
+    return tmp_path, vectorizer, matrix
+
+
+def test_matrix_round_trip(saved):
+    out, _, matrix = saved
+    loaded = load_tfidf_matrix(out)
+    assert not loaded.data.flags.owndata  # a view of the mapped file
+    assert loaded.shape == matrix.shape
+    np.testing.assert_array_equal(loaded.indptr, matrix.indptr)
+    np.testing.assert_array_equal(loaded.indices, matrix.indices)
+    np.testing.assert_array_equal(loaded.data, matrix.data)
+
+
+def test_vectorizer_round_trip(saved):
+    out, vectorizer, _ = saved
+    loaded = load_vectorizer(out, lightweight=False)
+    assert loaded.vocabulary_ == vectorizer.vocabulary_
+    assert (loaded.transform(QUERIES) != vectorizer.transform(QUERIES)).nnz == 0